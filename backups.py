@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MERZOGAMES BOT - BACKUPS
+Согласованные бэкапы работающей БД через online backup API SQLite
+
+Снимок копируется шагами по BACKUP_PAGES_PER_STEP страниц с паузой
+между шагами, поэтому писатели бота ждут не дольше одного шага.
+Если БД изменили другим подключением посреди копирования, SQLite сам
+начинает снимок заново — результат всегда согласован. Снимок
+проверяется PRAGMA integrity_check и за один проход пишется в gzip
+(сжатие в несколько потоков, см. compression.py);
+несжатая копия на диск не попадает (кроме очень больших БД, см.
+BACKUP_MEMORY_LIMIT).
+
+Инкрементальные бэкапы хранят только страницы, изменившиеся с прошлого
+снимка (по хэшам страниц). Снимки описаны в manifest.json цепочками:
+полный снимок и дельты за ним; любая точка восстанавливается
+наложением дельт на полный снимок с проверкой SHA-256 образа.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from compression import COMPRESS_LEVEL, open_compressed
+
+# ════════════════════════════════════════════════════════════════
+# НАСТРОЙКИ
+# ════════════════════════════════════════════════════════════════
+
+BACKUP_PAGES_PER_STEP = 1024              # Страниц за шаг backup API
+BACKUP_STEP_SLEEP = 0.005                 # Пауза между шагами, сек
+BACKUP_MEMORY_LIMIT = 256 * 1024 * 1024   # БД крупнее снимается во временный файл
+BACKUP_COMPRESS_LEVEL = COMPRESS_LEVEL
+BACKUP_FULL_EVERY = 24                    # Дельт в цепочке до нового полного снимка
+COPY_CHUNK_SIZE = 1024 * 1024
+
+MANIFEST_NAME = "manifest.json"
+DELTA_MAGIC = b"MGDELTA1"
+DELTA_HEADER = struct.Struct(">8sII")     # magic, page_size, page_count
+DELTA_PAGE = struct.Struct(">I")          # Номер страницы (с 1), за ним сама страница
+PAGE_HASH_SIZE = 16
+
+class BackupError(Exception):
+    """Снимок или архив не прошёл проверку"""
+
+@dataclass(frozen=True)
+class BackupResult:
+    """Итог создания бэкапа"""
+    path: str
+    pages: int
+    page_size: int
+    db_bytes: int
+    archive_bytes: int
+    sha256: str  # Хэш несжатого образа БД
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Запись манифеста инкрементальных бэкапов"""
+    id: int
+    parent: Optional[int]   # None — полный снимок
+    file: str
+    created_at: int
+    page_size: int
+    page_count: int
+    pages: int              # Страниц записано в файл
+    archive_bytes: int
+    sha256: str             # Хэш восстановленного образа БД
+
+    @property
+    def is_full(self) -> bool:
+        return self.parent is None
+
+# ════════════════════════════════════════════════════════════════
+# СНИМОК
+# ════════════════════════════════════════════════════════════════
+
+def check_integrity(conn: sqlite3.Connection):
+    """BackupError, если PRAGMA integrity_check нашёл ошибки"""
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"Ошибка целостности: {e}") from None
+    if problems != ["ok"]:
+        raise BackupError("Ошибка целостности: " + "; ".join(problems[:5]))
+
+def _read_file(path: str, chunk_size: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+def _iter_image(image: bytes, chunk_size: int) -> Iterator[memoryview]:
+    view = memoryview(image)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
+
+@contextmanager
+def _snapshot(
+    source: sqlite3.Connection,
+    work_path: str
+) -> Iterator[Tuple[int, int, Callable[[int], Iterator[bytes]]]]:
+    """
+    Снять проверенный снимок БД source.
+    Отдаёт (page_size, page_count, read): read(chunk_size) — итератор по
+    образу снимка. Большие БД снимаются в work_path (удаляется на выходе).
+    """
+    page_size = source.execute("PRAGMA page_size").fetchone()[0]
+    page_count = source.execute("PRAGMA page_count").fetchone()[0]
+
+    temp_db = None
+    if page_size * page_count <= BACKUP_MEMORY_LIMIT:
+        target = sqlite3.connect(":memory:")
+    else:
+        temp_db = work_path
+        target = sqlite3.connect(temp_db)
+
+    try:
+        source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+        check_integrity(target)
+        page_count = target.execute("PRAGMA page_count").fetchone()[0]
+
+        if temp_db is None:
+            yield page_size, page_count, partial(_iter_image, target.serialize())
+        else:
+            target.close()
+            yield page_size, page_count, partial(_read_file, temp_db)
+    finally:
+        target.close()
+        if temp_db and os.path.exists(temp_db):
+            os.remove(temp_db)
+
+def create_backup(source: sqlite3.Connection, archive_path: str) -> BackupResult:
+    """
+    Снять согласованный снимок БД source и записать его в archive_path (gzip).
+    Архив появляется под итоговым именем только после успешной записи.
+    """
+    part_path = archive_path + ".part"
+    digest = hashlib.sha256()
+    db_bytes = 0
+    try:
+        with _snapshot(source, archive_path + ".tmp") as (page_size, pages, read):
+            with open_compressed(part_path, level=BACKUP_COMPRESS_LEVEL) as out:
+                for chunk in read(COPY_CHUNK_SIZE):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    db_bytes += len(chunk)
+        os.replace(part_path, archive_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    return BackupResult(
+        path=archive_path,
+        pages=pages,
+        page_size=page_size,
+        db_bytes=db_bytes,
+        archive_bytes=os.path.getsize(archive_path),
+        sha256=digest.hexdigest()
+    )
+
+# ════════════════════════════════════════════════════════════════
+# ИНКРЕМЕНТАЛЬНЫЕ БЭКАПЫ
+# ════════════════════════════════════════════════════════════════
+
+def load_manifest(directory: str) -> List[Snapshot]:
+    """Снимки из манифеста (пустой список, если бэкапов ещё нет)"""
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [Snapshot(**entry) for entry in json.load(f)["snapshots"]]
+
+def _save_manifest(directory: str, snapshots: List[Snapshot]):
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "snapshots": [asdict(s) for s in snapshots]}, f, indent=2)
+    os.replace(path + ".part", path)
+
+def _hashes_path(directory: str, snapshot_id: int) -> str:
+    return os.path.join(directory, f"snapshot_{snapshot_id:06d}.hashes")
+
+def _load_hashes(directory: str, snapshot: Snapshot) -> Optional[bytes]:
+    """Хэши страниц снимка или None, если их нет или они не сходятся с манифестом"""
+    path = _hashes_path(directory, snapshot.id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        hashes = f.read()
+    return hashes if len(hashes) == snapshot.page_count * PAGE_HASH_SIZE else None
+
+def _chain(snapshots: List[Snapshot], snapshot_id: int) -> List[Snapshot]:
+    """Цепочка от полного снимка до snapshot_id включительно"""
+    by_id: Dict[int, Snapshot] = {s.id: s for s in snapshots}
+    if snapshot_id not in by_id:
+        raise BackupError(f"Снимок #{snapshot_id} не найден в манифесте")
+
+    chain = [by_id[snapshot_id]]
+    while chain[-1].parent is not None:
+        parent = by_id.get(chain[-1].parent)
+        if parent is None:
+            raise BackupError(f"Цепочка снимка #{snapshot_id} разорвана: нет #{chain[-1].parent}")
+        chain.append(parent)
+    return chain[::-1]
+
+def create_incremental_backup(
+    source: sqlite3.Connection,
+    directory: str,
+    full: bool = False,
+    full_every: int = BACKUP_FULL_EVERY
+) -> Snapshot:
+    """
+    Снять снимок и записать страницы, изменившиеся с последнего снимка.
+    Полный снимок пишется, если его просят, если в цепочке уже full_every
+    дельт, изменился размер страницы или нет хэшей прошлого снимка.
+    """
+    os.makedirs(directory, exist_ok=True)
+    snapshots = load_manifest(directory)
+    last = snapshots[-1] if snapshots else None
+    snapshot_id = last.id + 1 if last else 1
+    name = f"snapshot_{snapshot_id:06d}_{time.strftime('%Y%m%d_%H%M%S')}"
+
+    previous = None
+    if last and not full and len(_chain(snapshots, last.id)) <= full_every:
+        previous = _load_hashes(directory, last)
+
+    archive_path = os.path.join(directory, name + ".delta.gz")
+    hashes_path = _hashes_path(directory, snapshot_id)
+    digest = hashlib.sha256()
+    hashes = bytearray()
+    written = 0
+    try:
+        with _snapshot(source, archive_path + ".tmp") as (page_size, page_count, read):
+            if last is None or page_size != last.page_size:
+                previous = None
+            with open_compressed(archive_path + ".part", level=BACKUP_COMPRESS_LEVEL) as out:
+                out.write(DELTA_HEADER.pack(DELTA_MAGIC, page_size, page_count))
+                for index, page in enumerate(read(page_size)):
+                    digest.update(page)
+                    page_hash = hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+                    hashes += page_hash
+                    offset = index * PAGE_HASH_SIZE
+                    if previous is not None and previous[offset:offset + PAGE_HASH_SIZE] == page_hash:
+                        continue
+                    out.write(DELTA_PAGE.pack(index + 1))
+                    out.write(page)
+                    written += 1
+
+        with open(hashes_path + ".part", "wb") as f:
+            f.write(hashes)
+        os.replace(hashes_path + ".part", hashes_path)
+        os.replace(archive_path + ".part", archive_path)
+    finally:
+        for path in (archive_path + ".part", hashes_path + ".part"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    snapshot = Snapshot(
+        id=snapshot_id,
+        parent=last.id if previous is not None else None,
+        file=os.path.basename(archive_path),
+        created_at=int(time.time()),
+        page_size=page_size,
+        page_count=page_count,
+        pages=written,
+        archive_bytes=os.path.getsize(archive_path),
+        sha256=digest.hexdigest()
+    )
+    _save_manifest(directory, snapshots + [snapshot])
+
+    # Для следующей дельты нужны только хэши последнего снимка
+    if last is not None and os.path.exists(_hashes_path(directory, last.id)):
+        os.remove(_hashes_path(directory, last.id))
+    return snapshot
+
+def _apply_delta(path: str, image):
+    """Наложить страницы файла снимка на открытый образ БД"""
+    with gzip.open(path, "rb") as f:
+        magic, page_size, page_count = DELTA_HEADER.unpack(f.read(DELTA_HEADER.size))
+        if magic != DELTA_MAGIC:
+            raise BackupError(f"{path}: не файл снимка")
+        while True:
+            header = f.read(DELTA_PAGE.size)
+            if not header:
+                break
+            (pgno,) = DELTA_PAGE.unpack(header)
+            page = f.read(page_size)
+            if len(page) != page_size or not 0 < pgno <= page_count:
+                raise BackupError(f"{path}: файл снимка повреждён")
+            image.seek((pgno - 1) * page_size)
+            image.write(page)
+        image.truncate(page_count * page_size)
+
+def build_snapshot_image(directory: str, snapshot_id: int, image_path: str):
+    """Собрать образ БД на момент снимка и сверить его SHA-256 с манифестом"""
+    chain = _chain(load_manifest(directory), snapshot_id)
+    with open(image_path, "wb+") as image:
+        for snapshot in chain:
+            _apply_delta(os.path.join(directory, snapshot.file), image)
+
+    digest = hashlib.sha256()
+    for chunk in _read_file(image_path, COPY_CHUNK_SIZE):
+        digest.update(chunk)
+    if digest.hexdigest() != chain[-1].sha256:
+        raise BackupError(f"Образ снимка #{snapshot_id} не совпадает с манифестом")
+
+def restore_incremental(directory: str, snapshot_id: int, target: sqlite3.Connection):
+    """Восстановить БД target на момент снимка snapshot_id"""
+    image_path = os.path.join(directory, f"restore_{snapshot_id:06d}.tmp")
+    try:
+        build_snapshot_image(directory, snapshot_id, image_path)
+        restore_snapshot(image_path, target)
+    finally:
+        if os.path.exists(image_path):
+            os.remove(image_path)
+
+def prune_incremental(directory: str, before: int) -> int:
+    """
+    Удалить цепочки, все снимки которых старше before (epoch).
+    Последняя цепочка сохраняется всегда. Возвращает число удалённых снимков.
+    """
+    snapshots = load_manifest(directory)
+    if not snapshots:
+        return 0
+
+    chains: List[List[Snapshot]] = []
+    for snapshot in snapshots:
+        if snapshot.is_full or not chains:
+            chains.append([])
+        chains[-1].append(snapshot)
+
+    keep: List[Snapshot] = []
+    removed: List[Snapshot] = []
+    for chain in chains:
+        if chain is not chains[-1] and chain[-1].created_at < before:
+            removed.extend(chain)
+        else:
+            keep.extend(chain)
+
+    if removed:
+        _save_manifest(directory, keep)
+        for snapshot in removed:
+            for path in (os.path.join(directory, snapshot.file), _hashes_path(directory, snapshot.id)):
+                if os.path.exists(path):
+                    os.remove(path)
+    return len(removed)
+
+# ════════════════════════════════════════════════════════════════
+# ВОССТАНОВЛЕНИЕ
+# ════════════════════════════════════════════════════════════════
+
+def restore_snapshot(backup_path: str, target: sqlite3.Connection):
+    """
+    Восстановить БД target из бэкапа (.db или .db.gz).
+    Бэкап проверяется до того, как target будет перезаписана;
+    запись идёт через backup API, так что открытые подключения
+    к target остаются рабочими.
+    """
+    temp_db = None
+    if backup_path.endswith(".gz"):
+        temp_db = backup_path[:-3] + ".restore.tmp"
+        with gzip.open(backup_path, "rb") as f_in, open(temp_db, "wb") as f_out:
+            while True:
+                chunk = f_in.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f_out.write(chunk)
+
+    source = sqlite3.connect(temp_db or backup_path)
+    try:
+        check_integrity(source)
+        source.backup(target)
+    finally:
+        source.close()
+        if temp_db and os.path.exists(temp_db):
+            os.remove(temp_db)
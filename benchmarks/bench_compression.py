@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MERZOGAMES BOT - COMPRESSION BENCHMARK
+Пропускная способность ParallelGzipWriter по числу потоков
+
+Запуск из корня репозитория:
+    python benchmarks/bench_compression.py [--file merzogames.db] [--size 64] [--level 6]
+
+Без --file сжимаются синтетические строки, похожие на выгрузку users.
+"""
+
+import argparse
+import gzip
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import COMPRESS_LEVEL, ParallelGzipWriter  # noqa: E402
+
+def synthetic_data(size_mb: int) -> bytes:
+    """CSV-подобные строки: сжимаются примерно как реальные выгрузки"""
+    rng = random.Random(42)
+    lines = []
+    total = 0
+    while total < size_mb * 1024 * 1024:
+        line = (
+            f"{rng.randrange(10**9, 10**10)},user{rng.randrange(10**6)},"
+            f"{rng.choice(('ru', 'en'))},2026-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d} "
+            f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d},"
+            f"{rng.randrange(2)},{rng.randrange(2)},{rng.randrange(50)}\n"
+        ).encode()
+        lines.append(line)
+        total += len(line)
+    return b"".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк многопоточного gzip")
+    parser.add_argument("--file", help="Сжимать содержимое файла")
+    parser.add_argument("--size", type=int, default=64, help="Размер синтетических данных, МБ")
+    parser.add_argument("--level", type=int, default=COMPRESS_LEVEL, help="Уровень сжатия")
+    parser.add_argument(
+        "--threads", type=int, nargs="+",
+        default=sorted({1, 2, 4, os.cpu_count() or 1}),
+        help="Число потоков для замеров"
+    )
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            data = f.read()
+    else:
+        data = synthetic_data(args.size)
+    size_mb = len(data) / (1024 * 1024)
+    print(f"Данные: {size_mb:.1f} МБ, уровень {args.level}, ядер: {os.cpu_count()}\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.gz")
+
+        start = time.perf_counter()
+        with gzip.open(path, "wb", compresslevel=args.level) as f:
+            f.write(data)
+        elapsed = time.perf_counter() - start
+        print(f"{'gzip.open':<12} {size_mb / elapsed:>8.1f} МБ/с  {os.path.getsize(path) / len(data):>6.1%}")
+
+        for threads in args.threads:
+            start = time.perf_counter()
+            with ParallelGzipWriter(path, level=args.level, threads=threads) as f:
+                f.write(data)
+            elapsed = time.perf_counter() - start
+            with gzip.open(path, "rb") as f:
+                assert f.read() == data, "Архив не совпадает с исходными данными"
+            print(
+                f"{'потоков ' + str(threads):<12} {size_mb / elapsed:>8.1f} МБ/с  "
+                f"{os.path.getsize(path) / len(data):>6.1%}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MERZOGAMES BOT - KEYBOARD BENCHMARK
+Стоимость одного вызова get_*_keyboard: построение заново против реестра
+
+Запуск из корня репозитория:
+    python benchmarks/bench_keyboards.py [--number 20000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import merzogames_bot as bot_module  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк клавиатур")
+    parser.add_argument("--number", type=int, default=20000, help="Вызовов на замер")
+    parser.add_argument("--lang", default="ru", help="Язык клавиатур")
+    args = parser.parse_args()
+
+    bot_module.build_keyboards()
+
+    print(f"{'Клавиатура':<16} {'построение, мкс':>16} {'реестр, мкс':>12} {'ускорение':>10}")
+    for name, builder in bot_module.KEYBOARD_BUILDERS.items():
+        build = timeit.timeit(lambda: builder(args.lang), number=args.number)
+        cached = timeit.timeit(lambda: bot_module.get_keyboard(name, args.lang), number=args.number)
+        print(
+            f"{name:<16} {build / args.number * 1e6:>16.2f} "
+            f"{cached / args.number * 1e6:>12.3f} {build / cached:>9.0f}x"
+        )
+    for name, builder in bot_module.COMMON_KEYBOARD_BUILDERS.items():
+        build = timeit.timeit(builder, number=args.number)
+        cached = timeit.timeit(lambda: bot_module.get_keyboard(name), number=args.number)
+        print(
+            f"{name:<16} {build / args.number * 1e6:>16.2f} "
+            f"{cached / args.number * 1e6:>12.3f} {build / cached:>9.0f}x"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MERZOGAMES BOT - PARALLEL COMPRESSION
+Многопоточная запись gzip для бэкапов и выгрузок
+
+Поток данных режется на блоки по COMPRESS_BLOCK_SIZE, каждый блок
+сжимается в отдельный gzip-member в пуле потоков (zlib отпускает GIL)
+и дописывается в файл в исходном порядке. Склейка gzip-member'ов —
+обычный .gz: его читают gzip/zcat/pigz и модуль gzip. В очереди
+не больше двух блоков на поток, так что память ограничена.
+"""
+
+import gzip
+import io
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Optional, Tuple
+
+COMPRESS_LEVEL = 6
+COMPRESS_THREADS = os.cpu_count() or 1
+COMPRESS_BLOCK_SIZE = 1024 * 1024  # Байт несжатых данных на gzip-member
+RATIO_SAMPLE_SIZE = 64 * 1024      # Образец для оценки степени сжатия до первого блока
+
+def _compress_block(block: bytes, level: int) -> bytes:
+    # mtime=0 — одинаковые данные дают одинаковый архив
+    return gzip.compress(block, compresslevel=level, mtime=0)
+
+class ParallelGzipWriter(io.BufferedIOBase):
+    """Бинарный файл на запись, сжимающий блоки в несколько потоков"""
+
+    def __init__(
+        self,
+        path: str,
+        level: int = COMPRESS_LEVEL,
+        threads: int = COMPRESS_THREADS,
+        block_size: int = COMPRESS_BLOCK_SIZE
+    ):
+        super().__init__()
+        self.path = path
+        self.level = level
+        self.threads = max(1, threads)
+        self.block_size = block_size
+        self.bytes_in = 0
+        self._written_in = 0  # Несжатых байт, чьи блоки уже записаны в файл
+        self._file = open(path, "wb")
+        self._buffer = bytearray()
+        self._pending: Deque[Tuple[Future, int]] = deque()  # (сжатие блока, его размер)
+        self._executor: Optional[ThreadPoolExecutor] = (
+            ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="gzip")
+            if self.threads > 1 else None
+        )
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("Запись в закрытый файл")
+        size = len(data)
+        self._buffer += data
+        self.bytes_in += size
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block)
+        return size
+
+    def _submit(self, block: bytes):
+        if self._executor is None:
+            self._file.write(_compress_block(block, self.level))
+            self._written_in += len(block)
+            return
+        self._pending.append((self._executor.submit(_compress_block, block, self.level), len(block)))
+        while len(self._pending) > self.threads * 2:
+            self._write_next()
+
+    def _write_next(self):
+        """Дописать в файл самый старый блок (дождавшись его сжатия)"""
+        future, size = self._pending.popleft()
+        self._file.write(future.result())
+        self._written_in += size
+
+    def flush(self):
+        """Дописать всё, что уже сжато (неполный блок остаётся в буфере)"""
+        while self._pending and self._pending[0][0].done():
+            self._write_next()
+        self._file.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self.bytes_in:
+                # Пустой вход — всё равно корректный gzip
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._write_next()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+            try:
+                super().close()
+            finally:
+                self._file.close()
+
+    @property
+    def estimated_size(self) -> int:
+        """
+        Оценка размера архива, если закрыть его сейчас: ещё не сжатые данные
+        считаются по степени сжатия уже готовых блоков
+        """
+        if self._pending and not self._written_in:
+            # Степень сжатия ещё неизвестна — дождаться первого блока
+            self._pending[0][0].result()
+        compressed, compressed_in = self._file.tell(), self._written_in
+        uncompressed = len(self._buffer)
+        for future, size in self._pending:
+            if future.done():
+                compressed += len(future.result())
+                compressed_in += size
+            else:
+                uncompressed += size
+        if compressed_in:
+            ratio = compressed / compressed_in
+        elif self._buffer:
+            # Ни одного готового блока — степень сжатия по образцу из буфера
+            sample = bytes(self._buffer[:RATIO_SAMPLE_SIZE])
+            ratio = len(_compress_block(sample, self.level)) / len(sample)
+        else:
+            ratio = 1.0
+        return compressed + int(uncompressed * ratio)
+
+    @property
+    def bytes_out(self) -> int:
+        """Размер архива (точный после закрытия)"""
+        return os.path.getsize(self.path)
+
+def open_compressed(
+    path: str,
+    mode: str = "wb",
+    level: int = COMPRESS_LEVEL,
+    threads: int = COMPRESS_THREADS,
+    encoding: str = "utf-8",
+    newline: Optional[str] = None
+):
+    """
+    Открыть .gz на запись: 'wb' — бинарный ParallelGzipWriter,
+    'w' — текстовая обёртка над ним (для csv/json)
+    """
+    writer = ParallelGzipWriter(path, level=level, threads=threads)
+    if mode == "wb":
+        return writer
+    if mode == "w":
+        return io.TextIOWrapper(writer, encoding=encoding, newline=newline)
+    writer.close()
+    raise ValueError(f"Неподдерживаемый режим: {mode}")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MERZOGAMES BOT - DATABASE CONNECTION POOL
+Общий пул подключений к SQLite для бота и утилит
+
+Один долгоживущий писатель и N читателей в режиме WAL:
+чтения не блокируются записью, а подключение и разбор схемы
+выполняются один раз, а не на каждый запрос.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import timestamps  # noqa: F401 — регистрирует адаптер datetime → epoch
+
+# ════════════════════════════════════════════════════════════════
+# НАСТРОЙКИ
+# ════════════════════════════════════════════════════════════════
+
+DEFAULT_READERS = 4
+BUSY_TIMEOUT_MS = 5000
+
+# Применяются к каждому подключению пула
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",        # В WAL безопасно и без fsync на каждый коммит
+    "PRAGMA cache_size = -16000",         # ~16 МБ кэша страниц на подключение
+    "PRAGMA mmap_size = 268435456",       # 256 МБ memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+)
+
+# ════════════════════════════════════════════════════════════════
+# ПУЛ ПОДКЛЮЧЕНИЙ
+# ════════════════════════════════════════════════════════════════
+
+class ConnectionPool:
+    """Пул подключений: один писатель, несколько читателей"""
+
+    def __init__(self, db_path: str, readers: int = DEFAULT_READERS):
+        self.db_path = db_path
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+
+        # In-memory БД не разделяется между подключениями —
+        # тогда все запросы идут через писателя
+        self._shared = db_path == ":memory:"
+        if not self._shared:
+            self._writer.execute("PRAGMA journal_mode = WAL")
+
+        self._all: List[sqlite3.Connection] = [self._writer]
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        if not self._shared:
+            for _ in range(readers):
+                conn = self._connect()
+                conn.execute("PRAGMA query_only = 1")
+                self._all.append(conn)
+                self._readers.put(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Создать настроенное подключение"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        Эксклюзивный доступ к подключению-писателю.
+        Коммит при успешном выходе, откат при исключении.
+        """
+        with self._write_lock:
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Взять свободное подключение-читатель"""
+        if self._shared:
+            with self._write_lock:
+                yield self._writer
+            return
+
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def set_trace_callback(self, callback: Optional[Callable[[str], None]]):
+        """Передавать callback каждый выполняемый SQL (None — выключить); для аудита запросов"""
+        with self._write_lock:
+            for conn in self._all:
+                conn.set_trace_callback(callback)
+
+    def close(self):
+        """Закрыть все подключения пула"""
+        with self._write_lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+
+# ════════════════════════════════════════════════════════════════
+# ФАБРИКА
+# ════════════════════════════════════════════════════════════════
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: str, readers: int = DEFAULT_READERS) -> ConnectionPool:
+    """Получить общий пул для файла БД (создаётся при первом обращении)"""
+    key = db_path if db_path == ":memory:" else os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path, readers)
+            _pools[key] = pool
+        return pool
+
+def close_pool(db_path: str):
+    """Закрыть и забыть пул для файла БД"""
+    key = db_path if db_path == ":memory:" else os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.pop(key, None)
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MERZOGAMES BOT - EXPORTERS
+Потоковая выгрузка пользователей в CSV / JSON / NDJSON
+
+Строки читаются из курсора пачками по EXPORT_BATCH_SIZE и сразу
+пишутся в файл (при необходимости — через многопоточный gzip,
+см. compression.py), поэтому память не зависит от числа
+пользователей. JSON пишется массивом построчно, без сборки списка.
+Выгрузку можно разбить на самостоятельные файлы не больше заданного
+размера (лимит загрузки файлов в Telegram).
+"""
+
+import csv
+import json
+import os
+import sqlite3
+from typing import Callable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from compression import open_compressed
+from timestamps import TIMESTAMP_COLUMNS, format_epoch
+
+EXPORT_FORMATS = ("csv", "json", "ndjson")
+EXPORT_BATCH_SIZE = 5000
+
+class ExportError(ValueError):
+    """Неверные параметры выгрузки"""
+
+def open_export(path: str, newline: Optional[str] = None) -> TextIO:
+    """Открыть файл выгрузки на запись; .gz сжимается в несколько потоков"""
+    if path.endswith(".gz"):
+        return open_compressed(path, "w", newline=newline)
+    return open(path, "w", newline=newline, encoding="utf-8")
+
+def users_columns(conn: sqlite3.Connection) -> Tuple[str, ...]:
+    """Колонки таблицы users в порядке схемы"""
+    return tuple(row[1] for row in conn.execute("PRAGMA table_info(users)"))
+
+def users_query(
+    conn: sqlite3.Connection,
+    columns: Optional[Sequence[str]] = None,
+    since: Optional[int] = None,
+    active_only: bool = False
+) -> Tuple[str, Tuple, Tuple[str, ...]]:
+    """
+    SQL выгрузки users: (sql, параметры, колонки).
+    columns — проекция (ExportError на неизвестные), since — регистрация не раньше (epoch),
+    active_only — без заблокированных.
+    """
+    available = users_columns(conn)
+    if columns:
+        unknown = [column for column in columns if column not in available]
+        if unknown:
+            raise ExportError(f"Неизвестные колонки: {', '.join(unknown)}")
+        selected = tuple(columns)
+    else:
+        selected = available
+
+    conditions = []
+    params: Tuple = ()
+    if active_only:
+        conditions.append("is_blocked = 0")
+    if since is not None:
+        conditions.append("registration_date >= ?")
+        params = (since,)
+    sql = f"SELECT {', '.join(selected)} FROM users"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql, params, selected
+
+def iter_batches(cursor: sqlite3.Cursor, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[List[tuple]]:
+    """Строки курсора пачками"""
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        yield batch
+
+def write_rows(
+    f: TextIO,
+    export_format: str,
+    columns: Sequence[str],
+    batches: Iterator[List[tuple]],
+    progress: Optional[Callable[[int], None]] = None
+) -> int:
+    """
+    Записать пачки строк users в открытый файл, время — в читаемом виде.
+    progress(строк записано) вызывается после каждой пачки. Возвращает число строк.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Неизвестный формат: {export_format}")
+
+    timestamp_columns = TIMESTAMP_COLUMNS["users"]
+    is_time = [column in timestamp_columns for column in columns]
+
+    def values(row) -> list:
+        return [format_epoch(value) if time else value for value, time in zip(row, is_time)]
+
+    written = 0
+    if export_format == "csv":
+        writer = csv.writer(f)
+        writer.writerow(columns)
+    elif export_format == "json":
+        f.write("[")
+
+    for batch in batches:
+        if export_format == "csv":
+            writer.writerows(values(row) for row in batch)
+        else:
+            lines = [json.dumps(dict(zip(columns, values(row))), ensure_ascii=False) for row in batch]
+            if export_format == "json":
+                f.write(("," if written else "") + "\n  " + ",\n  ".join(lines))
+            else:
+                f.write("\n".join(lines) + "\n")
+        written += len(batch)
+        if progress:
+            progress(written)
+
+    if export_format == "json":
+        f.write("\n]\n" if written else "]\n")
+    return written
+
+def export_users(
+    conn: sqlite3.Connection,
+    path: str,
+    export_format: str = "csv",
+    columns: Optional[Sequence[str]] = None,
+    since: Optional[int] = None,
+    progress: Optional[Callable[[int], None]] = None
+) -> int:
+    """Выгрузить users в path (.gz — со сжатием), вернуть число строк"""
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Неизвестный формат: {export_format}")
+
+    sql, params, selected = users_query(conn, columns, since)
+    cursor = conn.execute(sql, params)
+    try:
+        with open_export(path, newline="" if export_format == "csv" else None) as f:
+            return write_rows(f, export_format, selected, iter_batches(cursor), progress)
+    finally:
+        cursor.close()
+
+def _written_bytes(f: TextIO, path: str) -> int:
+    """Сколько байт займёт файл выгрузки, если закрыть его сейчас"""
+    f.flush()
+    estimated_size = getattr(f.buffer, "estimated_size", None)
+    return estimated_size if estimated_size is not None else os.path.getsize(path)
+
+def export_users_parts(
+    conn: sqlite3.Connection,
+    path: str,
+    max_bytes: int,
+    export_format: str = "csv",
+    columns: Optional[Sequence[str]] = None,
+    since: Optional[int] = None,
+    active_only: bool = False,
+    progress: Optional[Callable[[int], None]] = None
+) -> List[str]:
+    """
+    Выгрузить users в один или несколько файлов не больше max_bytes.
+    Каждая часть — самостоятельный файл с заголовком (path_part1.csv.gz, ...);
+    если часть одна, она записывается в path. Возвращает пути частей.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Неизвестный формат: {export_format}")
+
+    sql, params, selected = users_query(conn, columns, since, active_only)
+    directory, name = os.path.split(path)
+    stem, dot, extension = name.partition(".")
+    cursor = conn.execute(sql, params)
+    batches = iter_batches(cursor)
+    pending = next(batches, None)
+    paths: List[str] = []
+    exported = 0
+    try:
+        while True:
+            part_path = os.path.join(directory, f"{stem}_part{len(paths) + 1}{dot}{extension}")
+            paths.append(part_path)
+            with open_export(part_path, newline="" if export_format == "csv" else None) as f:
+                def part_batches() -> Iterator[List[tuple]]:
+                    nonlocal pending
+                    size = growth = 0
+                    while pending is not None:
+                        yield pending
+                        pending = next(batches, None)
+                        # Следующая пачка не должна вывести часть за max_bytes
+                        previous, size = size, _written_bytes(f, part_path)
+                        growth = max(growth, size - previous)
+                        if size + growth > max_bytes:
+                            return
+
+                def part_progress(rows: int, offset: int = exported):
+                    if progress:
+                        progress(offset + rows)
+
+                exported += write_rows(f, export_format, selected, part_batches(), part_progress)
+            if pending is None:
+                break
+    finally:
+        cursor.close()
+
+    if len(paths) == 1:
+        os.replace(paths[0], path)
+        paths = [path]
+    return paths
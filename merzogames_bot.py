@@ -4,17 +4,24 @@ import json
 import logging
 import os
 import re
+import shutil
 import sqlite3
-from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, List, Any, Tuple
-from dataclasses import dataclass, asdict
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Dict, List, Any, Tuple, AsyncIterator, Callable
+from collections import OrderedDict, deque
+from dataclasses import dataclass, asdict, field, fields
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
 from aiogram.types import (
     Message,
     CallbackQuery,
@@ -23,6 +30,7 @@ from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
     ReplyKeyboardRemove,
+    FSInputFile,
     WebAppInfo,
     InlineQueryResultArticle,
     InputTextMessageContent,
@@ -30,6 +38,19 @@ from aiogram.types import (
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from aiogram.filters.callback_data import CallbackData
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError
+)
+
+from db_pool import ConnectionPool, get_pool, close_pool
+from exporters import export_users_parts
+from migrations import migrate
+from texts import loaded_languages, reload_texts, render_text
+from timestamps import day_start_epoch, from_epoch, to_epoch
 
 # ════════════════════════════════════════════════════════════════
 # КОНФИГУРАЦИЯ
@@ -42,625 +63,64 @@ BOT_LINK = "https://t.me/mrztnbot"
 WEBAPP_LINK = "https://makfje.pages.dev/"
 
 DB_PATH = "merzogames.db"
+DB_WORKERS = 4  # Потоки для выполнения запросов к БД вне event loop
+DB_READERS = DB_WORKERS  # Подключения-читатели в пуле (по одному на поток)
+USER_PAGE_SIZE = 1000    # Размер страницы при потоковом переборе пользователей
+REFERRAL_LEADERBOARD_SIZE = 10  # Мест в рейтинге пригласивших
 LOG_PATH = "bot.log"
+MESSAGE_LIMIT = 4096  # Лимит текста сообщения Telegram, единиц UTF-16
+
+# Антиспам
+RATE_LIMIT_COMMANDS = 5               # Команд за окно
+RATE_LIMIT_WINDOW = 60                # Длина окна, сек
+FLOOD_STRIKES_LIMIT = 3               # Превышений до флуд-блокировки
+FLOOD_BLOCK_DURATION = 3600           # Длительность флуд-блокировки, сек
+RATE_LIMIT_SNAPSHOT_INTERVAL = 60     # Период сохранения блокировок в БД, сек
+
+# Журнал действий (таблица logs)
+LOG_QUEUE_SIZE = 10000                # Максимум записей в очереди
+LOG_BATCH_SIZE = 200                  # Записей в одной транзакции
+LOG_FLUSH_INTERVAL = 0.5              # Максимальная задержка записи, сек
+LOG_QUEUE_POLICY = "drop_oldest"      # block / drop_new / drop_oldest
+
+# Кэш пользователей
+USER_CACHE_SIZE = 10000               # Максимум объектов User в памяти
+USER_CACHE_TTL = 300                  # Время жизни записи, сек
+
+# Хранилище FSM
+FSM_CACHE_SIZE = 10000                # Максимум состояний в памяти
+FSM_FLUSH_INTERVAL = 1.0              # Период пакетной записи изменений, сек
+FSM_TTL = 86400                       # Брошенный сценарий удаляется через, сек
+FSM_PURGE_INTERVAL = 3600             # Период очистки устаревших состояний, сек
+
+# Рассылки
+BROADCAST_RATE = 30                   # Сообщений в секунду (глобальный лимит Telegram)
+BROADCAST_BURST = 5                   # Допустимый всплеск сверх темпа
+BROADCAST_CONCURRENCY = 20            # Одновременных отправок
+BROADCAST_CHAT_INTERVAL = 1.0         # Минимальный интервал сообщений в один чат, сек
+BROADCAST_MAX_RETRIES = 3             # Повторов при временных ошибках
+BROADCAST_MAX_FLOOD_WAITS = 10        # Ожиданий RetryAfter на одно сообщение
+BROADCAST_PROGRESS_INTERVAL = 5.0     # Период обновления прогресса, сек
+BROADCAST_CHECKPOINT_INTERVAL = 2.0   # Период сохранения курсора в БД, сек
+BROADCAST_POLL_INTERVAL = 30.0        # Период проверки очереди заданий, сек
+BROADCAST_JOB_MAX_FAILURES = 3        # Падений задания до статуса failed
+
+# Выгрузка из админки
+EXPORT_PART_SIZE = 45 * 1024 * 1024   # Максимум байт в одном файле (лимит загрузки бота — 50 МБ)
+EXPORT_PROGRESS_INTERVAL = 3.0        # Период обновления прогресса, сек
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(levelname)-8s | %(name)s | %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_PATH, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# ════════════════════════════════════════════════════════════════
-# МНОГОЯЗЫЧНОСТЬ
-# ════════════════════════════════════════════════════════════════
-
-TEXTS = {
-    "ru": {
-        "start_welcome": (
-            "🎮 <b>Добро пожаловать в MERZOGAMES!</b>\n\n"
-            "Это развлекательная платформа для любителей интерактивных игр и соревнований. "
-            "Здесь вы найдёте увлекательные игры, турниры и сообщество единомышленников.\n\n"
-            "⚠️ <b>ВАЖНО:</b> Все игры носят исключительно <u>развлекательный характер</u>. "
-            "Виртуальная валюта, очки и достижения <b>не имеют реальной денежной ценности</b> "
-            "и не могут быть обменены на деньги или материальные ценности.\n\n"
-            "Перед началом использования необходимо ознакомиться с документами:"
-        ),
-        "btn_policy": "📜 Политика конфиденциальности",
-        "btn_terms": "📘 Условия пользования",
-        "btn_accept": "✅ Принять",
-        "btn_decline": "❌ Отказаться",
-        "btn_back": "◀️ Назад",
-        "policy_title": "📜 <b>ПОЛИТИКА КОНФИДЕНЦИАЛЬНОСТИ MERZOGAMES</b>",
-        "policy_text": (
-            "\n\n<b>1. ОБЩИЕ ПОЛОЖЕНИЯ</b>\n"
-            "Настоящая Политика конфиденциальности регулирует порядок обработки и защиты персональных данных "
-            "пользователей развлекательной платформы MERZOGAMES (далее — «Сервис»).\n\n"
-            
-            "<b>2. РАЗВЛЕКАТЕЛЬНЫЙ ХАРАКТЕР</b>\n"
-            "2.1. Сервис предоставляет исключительно развлекательные игры и активности.\n"
-            "2.2. Все виртуальные предметы, очки, валюта, достижения и бонусы НЕ ИМЕЮТ реальной денежной стоимости.\n"
-            "2.3. Сервис НЕ ЯВЛЯЕТСЯ азартной игрой и не предусматривает выплат, вывода средств или обмена на реальные деньги.\n"
-            "2.4. Использование Сервиса носит добровольный характер и осуществляется на свой страх и риск.\n\n"
-            
-            "<b>3. СОБИРАЕМЫЕ ДАННЫЕ</b>\n"
-            "3.1. Telegram ID (уникальный идентификатор)\n"
-            "3.2. Имя пользователя (username)\n"
-            "3.3. Номер телефона (для верификации)\n"
-            "3.4. Дата и время регистрации\n"
-            "3.5. Техническая информация: язык интерфейса, часовой пояс\n"
-            "3.6. Логи действий внутри бота (команды, нажатия кнопок)\n\n"
-            
-            "<b>4. ЦЕЛИ ОБРАБОТКИ ДАННЫХ</b>\n"
-            "4.1. Идентификация пользователя и предоставление доступа к Сервису\n"
-            "4.2. Предотвращение мошенничества и злоупотреблений (мультиаккаунты)\n"
-            "4.3. Обеспечение безопасности и защиты от спама\n"
-            "4.4. Улучшение качества сервиса и пользовательского опыта\n"
-            "4.5. Рассылка информационных уведомлений (с возможностью отписки)\n"
-            "4.6. Выполнение законных требований регуляторов\n\n"
-            
-            "<b>5. ХРАНЕНИЕ ДАННЫХ</b>\n"
-            "5.1. Данные хранятся в защищённой базе данных на серверах Сервиса.\n"
-            "5.2. Применяются современные методы шифрования и защиты.\n"
-            "5.3. Доступ к данным имеют только авторизованные администраторы.\n"
-            "5.4. Персональные данные удалённых аккаунтов анонимизируются через 7 дней.\n\n"
-            
-            "<b>6. ПЕРЕДАЧА ДАННЫХ ТРЕТЬИМ ЛИЦАМ</b>\n"
-            "6.1. Данные НЕ ПРОДАЮТСЯ и НЕ ПЕРЕДАЮТСЯ третьим лицам в коммерческих целях.\n"
-            "6.2. Данные могут быть переданы по запросу уполномоченных государственных органов.\n"
-            "6.3. Telegram API обрабатывает данные в соответствии с политикой Telegram.\n\n"
-            
-            "<b>7. ПРАВА ПОЛЬЗОВАТЕЛЯ (GDPR)</b>\n"
-            "7.1. Право на доступ к своим данным (команда /export_my_data)\n"
-            "7.2. Право на удаление аккаунта (команда /delete_account)\n"
-            "7.3. Право на исправление некорректных данных\n"
-            "7.4. Право на отзыв согласия на обработку данных (удаление аккаунта)\n\n"
-            
-            "<b>8. ВОЗРАСТНЫЕ ОГРАНИЧЕНИЯ</b>\n"
-            "8.1. Сервис предназначен для лиц старше 18 лет.\n"
-            "8.2. Регистрация несовершеннолетних ЗАПРЕЩЕНА.\n"
-            "8.3. При обнаружении несовершеннолетнего аккаунт блокируется без предупреждения.\n\n"
-            
-            "<b>9. ОТВЕТСТВЕННОСТЬ</b>\n"
-            "9.1. Сервис НЕ НЕСЁТ ответственности за действия пользователей.\n"
-            "9.2. Пользователь самостоятельно несёт ответственность за сохранность своего аккаунта.\n"
-            "9.3. Сервис не гарантирует бесперебойную работу и отсутствие технических сбоев.\n\n"
-            
-            "<b>10. ИЗМЕНЕНИЯ ПОЛИТИКИ</b>\n"
-            "10.1. Администрация вправе изменять Политику в одностороннем порядке.\n"
-            "10.2. Уведомление об изменениях публикуется в боте.\n"
-            "10.3. Продолжение использования Сервиса означает согласие с новой версией Политики.\n\n"
-            
-            "<b>11. КОНТАКТЫ</b>\n"
-            "По вопросам обработки данных: @mrztn\n"
-            "Дата последнего обновления: 27.02.2026"
-        ),
-        "terms_title": "📘 <b>УСЛОВИЯ ПОЛЬЗОВАНИЯ MERZOGAMES</b>",
-        "terms_text": (
-            "\n\n<b>1. ПРЕДМЕТ СОГЛАШЕНИЯ</b>\n"
-            "1.1. Настоящие Условия регулируют отношения между Администрацией MERZOGAMES (далее — «Сервис») "
-            "и пользователями (далее — «Пользователь») при использовании Telegram-бота и веб-приложения.\n"
-            "1.2. Регистрация в Сервисе означает ПОЛНОЕ И БЕЗОГОВОРОЧНОЕ принятие настоящих Условий.\n\n"
-            
-            "<b>2. РАЗВЛЕКАТЕЛЬНЫЙ ХАРАКТЕР</b>\n"
-            "2.1. Сервис предоставляет ИСКЛЮЧИТЕЛЬНО развлекательный контент без реальных денежных ставок.\n"
-            "2.2. Все виртуальные предметы, валюта, очки, бонусы НЕ ИМЕЮТ реальной стоимости.\n"
-            "2.3. ЗАПРЕЩЕНЫ любые попытки обмена виртуальных активов на реальные деньги.\n"
-            "2.4. Сервис НЕ ЯВЛЯЕТСЯ азартной игрой по законодательству РФ и других юрисдикций.\n\n"
-            
-            "<b>3. РЕГИСТРАЦИЯ И АККАУНТ</b>\n"
-            "3.1. Один пользователь = ОДИН аккаунт. Создание мультиаккаунтов СТРОГО ЗАПРЕЩЕНО.\n"
-            "3.2. Регистрация возможна ТОЛЬКО с верифицированным номером телефона.\n"
-            "3.3. Передача аккаунта третьим лицам ЗАПРЕЩЕНА.\n"
-            "3.4. Пользователь обязан предоставлять достоверные данные.\n"
-            "3.5. При обнаружении ложных данных аккаунт блокируется без возврата прогресса.\n\n"
-            
-            "<b>4. ВОЗРАСТНЫЕ ОГРАНИЧЕНИЯ</b>\n"
-            "4.1. Использование Сервиса разрешено лицам старше 18 лет.\n"
-            "4.2. Пользователь подтверждает, что ему исполнилось 18 лет на момент регистрации.\n"
-            "4.3. Администрация вправе запросить подтверждение возраста.\n"
-            "4.4. Несовершеннолетние аккаунты удаляются немедленно без права восстановления.\n\n"
-            
-            "<b>5. ЗАПРЕЩЁННЫЕ ДЕЙСТВИЯ</b>\n"
-            "5.1. Использование ботов, скриптов, автоматизации\n"
-            "5.2. Эксплуатация багов и уязвимостей\n"
-            "5.3. Создание мультиаккаунтов\n"
-            "5.4. Спам, флуд, массовая рассылка\n"
-            "5.5. Оскорбления, угрозы, дискриминация\n"
-            "5.6. Попытки взлома или DDoS-атаки\n"
-            "5.7. Публикация чужих персональных данных\n"
-            "5.8. Размещение незаконного контента\n"
-            "5.9. Мошенничество и введение в заблуждение\n"
-            "5.10. Любые действия, нарушающие законодательство\n\n"
-            
-            "<b>6. САНКЦИИ</b>\n"
-            "6.1. При нарушении Условий Администрация вправе:\n"
-            "   • Вынести предупреждение\n"
-            "   • Временно заблокировать аккаунт (от 1 часа до 30 дней)\n"
-            "   • Навсегда заблокировать аккаунт без права восстановления\n"
-            "   • Обнулить прогресс и виртуальные активы\n"
-            "6.2. Решение о санкциях принимается Администрацией единолично и обжалованию не подлежит.\n"
-            "6.3. Заблокированные пользователи НЕ ИМЕЮТ права на компенсацию.\n\n"
-            
-            "<b>7. ОТКАЗ ОТ ГАРАНТИЙ</b>\n"
-            "7.1. Сервис предоставляется «КАК ЕСТЬ» (AS IS) без каких-либо гарантий.\n"
-            "7.2. Администрация НЕ ГАРАНТИРУЕТ:\n"
-            "   • Бесперебойную работу\n"
-            "   • Отсутствие ошибок\n"
-            "   • Сохранность прогресса\n"
-            "   • Доступность в любое время\n"
-            "7.3. Сервис может быть изменён, приостановлен или прекращён в любой момент.\n\n"
-            
-            "<b>8. ОГРАНИЧЕНИЕ ОТВЕТСТВЕННОСТИ</b>\n"
-            "8.1. Администрация НЕ НЕСЁТ ответственности за:\n"
-            "   • Потерю виртуального прогресса\n"
-            "   • Технические сбои\n"
-            "   • Действия третьих лиц\n"
-            "   • Косвенные убытки\n"
-            "8.2. Максимальная ответственность Администрации: 0 (ноль) рублей.\n"
-            "8.3. Пользователь использует Сервис НА СВОЙ РИСК.\n\n"
-            
-            "<b>9. ИНТЕЛЛЕКТУАЛЬНАЯ СОБСТВЕННОСТЬ</b>\n"
-            "9.1. Все права на Сервис принадлежат Администрации.\n"
-            "9.2. ЗАПРЕЩЕНО копирование, распространение, модификация контента.\n"
-            "9.3. Логотипы, тексты, графика защищены авторским правом.\n\n"
-            
-            "<b>10. ИЗМЕНЕНИЕ УСЛОВИЙ</b>\n"
-            "10.1. Администрация вправе изменять Условия без предварительного уведомления.\n"
-            "10.2. Новая версия вступает в силу с момента публикации.\n"
-            "10.3. Продолжение использования = согласие с новыми Условиями.\n\n"
-            
-            "<b>11. ПРИМЕНИМОЕ ПРАВО</b>\n"
-            "11.1. К настоящим Условиям применяется законодательство Российской Федерации.\n"
-            "11.2. Споры рассматриваются в соответствии с законодательством РФ.\n\n"
-            
-            "<b>12. ЗАКЛЮЧИТЕЛЬНЫЕ ПОЛОЖЕНИЯ</b>\n"
-            "12.1. Условия являются публичной офертой.\n"
-            "12.2. Недействительность одного пункта не влечёт недействительность остальных.\n"
-            "12.3. Администрация оставляет за собой право отказать в доступе любому лицу без объяснения причин.\n\n"
-            
-            "<b>КОНТАКТЫ:</b> @mrztn\n"
-            "<b>Версия:</b> 1.0 от 27.02.2026"
-        ),
-        "policy_accepted": "✅ Вы приняли Политику конфиденциальности.",
-        "terms_accepted": "✅ Вы приняли Условия пользования.",
-        "declined_message": (
-            "❌ Вы отказались от принятия необходимых документов.\n\n"
-            "К сожалению, без согласия с Политикой и Условиями использование бота невозможно.\n\n"
-            "Если передумаете, напишите /start"
-        ),
-        "age_verification": (
-            "🔞 <b>ПОДТВЕРЖДЕНИЕ ВОЗРАСТА</b>\n\n"
-            "В соответствии с законодательством и условиями сервиса, "
-            "использование MERZOGAMES разрешено только лицам старше 18 лет.\n\n"
-            "❓ <b>Вам исполнилось 18 лет?</b>"
-        ),
-        "btn_age_yes": "✅ Да, мне есть 18 лет",
-        "btn_age_no": "❌ Нет, мне нет 18 лет",
-        "age_declined": (
-            "⛔️ <b>ДОСТУП ЗАПРЕЩЁН</b>\n\n"
-            "К сожалению, использование MERZOGAMES разрешено только лицам старше 18 лет.\n\n"
-            "Ваш аккаунт заблокирован. Возвращайтесь, когда вам исполнится 18! 👋"
-        ),
-        "age_confirmed": "✅ Возраст подтверждён. Спасибо!",
-        "registration_phone": (
-            "📱 <b>РЕГИСТРАЦИЯ</b>\n\n"
-            "Для завершения регистрации необходимо предоставить номер телефона.\n\n"
-            "⚠️ Это нужно для:\n"
-            "• Защиты от мультиаккаунтов\n"
-            "• Обеспечения безопасности\n"
-            "• Соблюдения правил сервиса\n\n"
-            "Нажмите кнопку ниже, чтобы отправить номер."
-        ),
-        "btn_send_phone": "📱 Отправить номер телефона",
-        "registration_success": (
-            "🎉 <b>ДОБРО ПОЖАЛОВАТЬ В MERZOGAMES!</b>\n\n"
-            "Поздравляем! Вы успешно зарегистрировались на нашей развлекательной платформе.\n\n"
-            "Теперь вам доступны:\n"
-            "🎮 Увлекательные игры\n"
-            "🏆 Турниры и соревнования\n"
-            "👥 Сообщество игроков\n"
-            "🎁 Развлекательные бонусы\n\n"
-            "Помните: все игры носят <b>исключительно развлекательный характер</b> "
-            "и не предполагают реальных денежных выигрышей.\n\n"
-            "Желаем честной игры, отличного настроения и ярких эмоций! 🚀\n\n"
-            "Используйте меню ниже для навигации."
-        ),
-        "btn_open_webapp": "🌐 Открыть MERZOGAMES",
-        "btn_profile": "👤 Профиль",
-        "btn_info": "ℹ️ Информация",
-        "btn_referral": "🔗 Реферальная ссылка",
-        "btn_export_data": "📥 Экспорт моих данных",
-        "btn_delete_account": "🗑 Удалить аккаунт",
-        "btn_language": "🌐 Язык",
-        "profile_text": (
-            "👤 <b>ВАШ ПРОФИЛЬ</b>\n\n"
-            "🆔 Telegram ID: {telegram_id}\n"
-            "👤 Username: @{username}\n"
-            "📱 Телефон: {phone}\n"
-            "📅 Регистрация: {registration_date}\n"
-            "🌍 Язык: {language}\n"
-            "🎖 Статус: {status}\n\n"
-            "{badges}"
-        ),
-        "info_text": (
-            "ℹ️ <b>ИНФОРМАЦИЯ О MERZOGAMES</b>\n\n"
-            "<b>Что это?</b>\n"
-            "MERZOGAMES — развлекательная платформа для интерактивных игр, турниров и соревнований.\n\n"
-            "<b>Важно знать:</b>\n"
-            "• Все игры носят развлекательный характер\n"
-            "• Виртуальная валюта не имеет денежной ценности\n"
-            "• Запрещены мультиаккаунты и читерство\n"
-            "• Доступ только для лиц 18+\n\n"
-            "<b>Контакты:</b>\n"
-            "👨‍💼 Администратор: @mrztn\n"
-            "🤖 Бот: {bot_link}\n"
-            "🌐 WebApp: {webapp_link}\n\n"
-            "<b>Полезные команды:</b>\n"
-            "/start - Главное меню\n"
-            "/profile - Профиль\n"
-            "/referral - Реферальная ссылка\n"
-            "/export_my_data - Экспорт данных\n"
-            "/delete_account - Удаление аккаунта\n"
-            "/language - Сменить язык"
-        ),
-        "referral_text": (
-            "🔗 <b>ВАША РЕФЕРАЛЬНАЯ ССЫЛКА</b>\n\n"
-            "Пригласите друзей в MERZOGAMES!\n\n"
-            "Ваша ссылка:\n"
-            "<code>{referral_link}</code>\n\n"
-            "📊 Статистика:\n"
-            "Приглашено: {referrals_count} чел.\n\n"
-            "⚠️ Внимание: реферальная система носит исключительно развлекательный характер "
-            "и не предполагает материальных выплат."
-        ),
-        "export_data_text": (
-            "📥 <b>ЭКСПОРТ ДАННЫХ (GDPR)</b>\n\n"
-            "В соответствии с правом на доступ к персональным данным, "
-            "мы подготовили файл со всеми вашими данными, хранящимися в нашей системе.\n\n"
-            "📄 Файл содержит:\n"
-            "• Регистрационные данные\n"
-            "• Историю активности\n"
-            "• Статистику использования\n"
-            "• Логи действий (обезличенные)\n\n"
-            "Файл будет отправлен в течение минуты."
-        ),
-        "delete_account_confirm": (
-            "🗑 <b>УДАЛЕНИЕ АККАУНТА</b>\n\n"
-            "⚠️ <b>ВНИМАНИЕ!</b> Это необратимое действие.\n\n"
-            "После удаления:\n"
-            "❌ Будут удалены все ваши данные\n"
-            "❌ Весь прогресс будет потерян\n"
-            "❌ Восстановление невозможно\n\n"
-            "Однако у вас будет <b>7 дней</b> на отмену удаления.\n"
-            "В течение этого времени аккаунт будет заморожен, но данные сохранятся.\n\n"
-            "Вы уверены, что хотите удалить аккаунт?"
-        ),
-        "btn_delete_confirm": "🗑 Да, удалить навсегда",
-        "btn_cancel": "❌ Отмена",
-        "delete_account_scheduled": (
-            "⏳ <b>АККАУНТ ПОМЕЧЕН НА УДАЛЕНИЕ</b>\n\n"
-            "Ваш аккаунт будет удалён через 7 дней.\n\n"
-            "До этого момента вы можете отменить удаление, написав /cancel_deletion\n\n"
-            "Дата окончательного удаления: {deletion_date}"
-        ),
-        "admin_new_user": (
-            "🆕 <b>НОВЫЙ ПОЛЬЗОВАТЕЛЬ</b>\n\n"
-            "👤 Профиль: <a href='tg://user?id={telegram_id}'>ссылка</a>\n"
-            "🆔 ID: <code>{telegram_id}</code>\n"
-            "👤 Username: @{username}\n"
-            "📱 Телефон: <code>{phone}</code>\n"
-            "📅 Дата: {registration_date}\n"
-            "🌍 Язык: {language}"
-        ),
-        "admin_duplicate_attempt": (
-            "⚠️ <b>ПОПЫТКА МУЛЬТИАККАУНТА!</b>\n\n"
-            "Пользователь пытается зарегистрировать второй аккаунт:\n\n"
-            "🆔 Новый ID: <code>{new_id}</code>\n"
-            "📱 Номер: <code>{phone}</code>\n"
-            "🔗 Существующий ID: <code>{existing_id}</code>\n"
-            "👤 Username: @{username}"
-        ),
-        "duplicate_phone_error": (
-            "⛔️ <b>ОШИБКА РЕГИСТРАЦИИ</b>\n\n"
-            "Этот номер телефона уже зарегистрирован в системе.\n\n"
-            "Согласно правилам, один пользователь может иметь только один аккаунт.\n\n"
-            "Если вы потеряли доступ к предыдущему аккаунту, обратитесь к администратору: @mrztn"
-        ),
-        "rate_limit_warning": (
-            "⚠️ Слишком много команд. Подождите {seconds} секунд."
-        ),
-        "flood_blocked": (
-            "🚫 <b>АНТИСПАМ</b>\n\n"
-            "Обнаружена подозрительная активность (флуд).\n"
-            "Ваш аккаунт временно заблокирован на {minutes} минут.\n\n"
-            "Пожалуйста, используйте бот в разумных пределах."
-        ),
-        "language_select": "🌐 Выберите язык / Select language:",
-        "btn_lang_ru": "🇷🇺 Русский",
-        "btn_lang_en": "🇬🇧 English",
-        "language_changed": "✅ Язык изменён на: {language}"
-    },
-    "en": {
-        "start_welcome": (
-            "🎮 <b>Welcome to MERZOGAMES!</b>\n\n"
-            "This is an entertainment platform for fans of interactive games and competitions. "
-            "Here you'll find exciting games, tournaments, and a community of like-minded people.\n\n"
-            "⚠️ <b>IMPORTANT:</b> All games are <u>purely entertainment</u>. "
-            "Virtual currency, points, and achievements <b>have no real monetary value</b> "
-            "and cannot be exchanged for money or material assets.\n\n"
-            "Before using, please review the documents:"
-        ),
-        "btn_policy": "📜 Privacy Policy",
-        "btn_terms": "📘 Terms of Service",
-        "btn_accept": "✅ Accept",
-        "btn_decline": "❌ Decline",
-        "btn_back": "◀️ Back",
-        "policy_title": "📜 <b>MERZOGAMES PRIVACY POLICY</b>",
-        "policy_text": (
-            "\n\n<b>1. GENERAL PROVISIONS</b>\n"
-            "This Privacy Policy governs the processing and protection of personal data "
-            "of MERZOGAMES entertainment platform users (hereinafter - 'Service').\n\n"
-            
-            "<b>2. ENTERTAINMENT NATURE</b>\n"
-            "2.1. Service provides exclusively entertainment games and activities.\n"
-            "2.2. All virtual items, points, currency, achievements DO NOT HAVE real monetary value.\n"
-            "2.3. Service IS NOT gambling and does not provide payouts or withdrawals.\n"
-            "2.4. Using Service is voluntary and at your own risk.\n\n"
-            
-            "<b>3. COLLECTED DATA</b>\n"
-            "3.1. Telegram ID (unique identifier)\n"
-            "3.2. Username\n"
-            "3.3. Phone number (for verification)\n"
-            "3.4. Registration date and time\n"
-            "3.5. Technical info: language, timezone\n"
-            "3.6. Activity logs (commands, button clicks)\n\n"
-            
-            "<b>4. DATA PROCESSING PURPOSES</b>\n"
-            "4.1. User identification and service access\n"
-            "4.2. Fraud prevention (multi-accounting)\n"
-            "4.3. Security and anti-spam\n"
-            "4.4. Service improvement\n"
-            "4.5. Informational newsletters\n"
-            "4.6. Legal compliance\n\n"
-            
-            "<b>5. DATA STORAGE</b>\n"
-            "5.1. Data stored in secure database.\n"
-            "5.2. Modern encryption applied.\n"
-            "5.3. Access limited to authorized admins.\n"
-            "5.4. Deleted accounts anonymized after 7 days.\n\n"
-            
-            "<b>6. DATA SHARING</b>\n"
-            "6.1. Data NOT SOLD or shared commercially.\n"
-            "6.2. May be disclosed to authorities by legal request.\n\n"
-            
-            "<b>7. USER RIGHTS (GDPR)</b>\n"
-            "7.1. Right to access data (/export_my_data)\n"
-            "7.2. Right to delete account (/delete_account)\n"
-            "7.3. Right to correct data\n"
-            "7.4. Right to withdraw consent\n\n"
-            
-            "<b>8. AGE RESTRICTIONS</b>\n"
-            "8.1. Service for 18+ only.\n"
-            "8.2. Minors registration PROHIBITED.\n\n"
-            
-            "<b>9. LIABILITY</b>\n"
-            "9.1. Service NOT LIABLE for user actions.\n"
-            "9.2. No uptime guarantees.\n\n"
-            
-            "<b>10. POLICY CHANGES</b>\n"
-            "10.1. Administration may change Policy unilaterally.\n\n"
-            
-            "<b>11. CONTACT</b>\n"
-            "Data questions: @mrztn\n"
-            "Last updated: 2026-02-27"
-        ),
-        "terms_title": "📘 <b>MERZOGAMES TERMS OF SERVICE</b>",
-        "terms_text": (
-            "\n\n<b>1. AGREEMENT</b>\n"
-            "These Terms govern relationships between MERZOGAMES Administration and Users.\n"
-            "Registration means FULL ACCEPTANCE of these Terms.\n\n"
-            
-            "<b>2. ENTERTAINMENT NATURE</b>\n"
-            "2.1. Service provides EXCLUSIVELY entertainment without real money betting.\n"
-            "2.2. Virtual items have NO real value.\n"
-            "2.3. NOT gambling.\n\n"
-            
-            "<b>3. REGISTRATION</b>\n"
-            "3.1. One user = ONE account. Multi-accounting STRICTLY PROHIBITED.\n"
-            "3.2. Phone verification required.\n"
-            "3.3. Account transfer PROHIBITED.\n\n"
-            
-            "<b>4. AGE RESTRICTIONS</b>\n"
-            "4.1. 18+ only.\n"
-            "4.2. User confirms being 18+.\n\n"
-            
-            "<b>5. PROHIBITED ACTIONS</b>\n"
-            "5.1. Bots, scripts, automation\n"
-            "5.2. Bug exploitation\n"
-            "5.3. Multi-accounting\n"
-            "5.4. Spam, flood\n"
-            "5.5. Harassment\n"
-            "5.6. Hacking attempts\n\n"
-            
-            "<b>6. SANCTIONS</b>\n"
-            "6.1. Warning, temp ban, permanent ban.\n"
-            "6.2. No compensation for banned users.\n\n"
-            
-            "<b>7. DISCLAIMER</b>\n"
-            "7.1. Service AS IS.\n"
-            "7.2. No guarantees.\n\n"
-            
-            "<b>8. LIMITATION OF LIABILITY</b>\n"
-            "8.1. Administration NOT LIABLE.\n"
-            "8.2. Use at your own risk.\n\n"
-            
-            "<b>CONTACT:</b> @mrztn\n"
-            "<b>Version:</b> 1.0 - 2026-02-27"
-        ),
-        "policy_accepted": "✅ You accepted Privacy Policy.",
-        "terms_accepted": "✅ You accepted Terms of Service.",
-        "declined_message": (
-            "❌ You declined required documents.\n\n"
-            "Without accepting Policy and Terms, bot usage is impossible.\n\n"
-            "If you change your mind, type /start"
-        ),
-        "age_verification": (
-            "🔞 <b>AGE VERIFICATION</b>\n\n"
-            "MERZOGAMES is allowed only for persons 18+.\n\n"
-            "❓ <b>Are you 18 years old or older?</b>"
-        ),
-        "btn_age_yes": "✅ Yes, I'm 18+",
-        "btn_age_no": "❌ No, I'm under 18",
-        "age_declined": (
-            "⛔️ <b>ACCESS DENIED</b>\n\n"
-            "Sorry, MERZOGAMES is for 18+ only.\n\n"
-            "Your account is blocked. Come back when you're 18! 👋"
-        ),
-        "age_confirmed": "✅ Age confirmed. Thank you!",
-        "registration_phone": (
-            "📱 <b>REGISTRATION</b>\n\n"
-            "Please share your phone number to complete registration.\n\n"
-            "⚠️ This is needed for:\n"
-            "• Multi-account protection\n"
-            "• Security\n"
-            "• Rules compliance\n\n"
-            "Tap button below to send your number."
-        ),
-        "btn_send_phone": "📱 Send Phone Number",
-        "registration_success": (
-            "🎉 <b>WELCOME TO MERZOGAMES!</b>\n\n"
-            "Congrats! You've successfully registered on our entertainment platform.\n\n"
-            "Now available:\n"
-            "🎮 Exciting games\n"
-            "🏆 Tournaments\n"
-            "👥 Community\n"
-            "🎁 Entertainment bonuses\n\n"
-            "Remember: all games are <b>purely entertainment</b> "
-            "with no real money prizes.\n\n"
-            "We wish you fair play, great mood and bright emotions! 🚀\n\n"
-            "Use menu below for navigation."
-        ),
-        "btn_open_webapp": "🌐 Open MERZOGAMES",
-        "btn_profile": "👤 Profile",
-        "btn_info": "ℹ️ Information",
-        "btn_referral": "🔗 Referral Link",
-        "btn_export_data": "📥 Export My Data",
-        "btn_delete_account": "🗑 Delete Account",
-        "btn_language": "🌐 Language",
-        "profile_text": (
-            "👤 <b>YOUR PROFILE</b>\n\n"
-            "🆔 Telegram ID: {telegram_id}\n"
-            "👤 Username: @{username}\n"
-            "📱 Phone: {phone}\n"
-            "📅 Registration: {registration_date}\n"
-            "🌍 Language: {language}\n"
-            "🎖 Status: {status}\n\n"
-            "{badges}"
-        ),
-        "info_text": (
-            "ℹ️ <b>ABOUT MERZOGAMES</b>\n\n"
-            "<b>What is it?</b>\n"
-            "MERZOGAMES is entertainment platform for interactive games, tournaments and competitions.\n\n"
-            "<b>Important:</b>\n"
-            "• All games are entertainment only\n"
-            "• Virtual currency has no monetary value\n"
-            "• Multi-accounting prohibited\n"
-            "• 18+ only\n\n"
-            "<b>Contacts:</b>\n"
-            "👨‍💼 Admin: @mrztn\n"
-            "🤖 Bot: {bot_link}\n"
-            "🌐 WebApp: {webapp_link}\n\n"
-            "<b>Useful commands:</b>\n"
-            "/start - Main menu\n"
-            "/profile - Profile\n"
-            "/referral - Referral link\n"
-            "/export_my_data - Export data\n"
-            "/delete_account - Delete account\n"
-            "/language - Change language"
-        ),
-        "referral_text": (
-            "🔗 <b>YOUR REFERRAL LINK</b>\n\n"
-            "Invite friends to MERZOGAMES!\n\n"
-            "Your link:\n"
-            "<code>{referral_link}</code>\n\n"
-            "📊 Stats:\n"
-            "Invited: {referrals_count} people\n\n"
-            "⚠️ Note: referral system is purely entertainment "
-            "with no material payouts."
-        ),
-        "export_data_text": (
-            "📥 <b>DATA EXPORT (GDPR)</b>\n\n"
-            "According to your right to access personal data, "
-            "we've prepared a file with all your data stored in our system.\n\n"
-            "📄 File contains:\n"
-            "• Registration data\n"
-            "• Activity history\n"
-            "• Usage statistics\n"
-            "• Action logs (anonymized)\n\n"
-            "File will be sent within a minute."
-        ),
-        "delete_account_confirm": (
-            "🗑 <b>DELETE ACCOUNT</b>\n\n"
-            "⚠️ <b>WARNING!</b> This is irreversible.\n\n"
-            "After deletion:\n"
-            "❌ All your data will be deleted\n"
-            "❌ All progress will be lost\n"
-            "❌ Recovery impossible\n\n"
-            "However, you'll have <b>7 days</b> to cancel deletion.\n"
-            "During this time account will be frozen but data preserved.\n\n"
-            "Are you sure you want to delete your account?"
-        ),
-        "btn_delete_confirm": "🗑 Yes, delete forever",
-        "btn_cancel": "❌ Cancel",
-        "delete_account_scheduled": (
-            "⏳ <b>ACCOUNT MARKED FOR DELETION</b>\n\n"
-            "Your account will be deleted in 7 days.\n\n"
-            "Until then you can cancel deletion by typing /cancel_deletion\n\n"
-            "Final deletion date: {deletion_date}"
-        ),
-        "admin_new_user": (
-            "🆕 <b>NEW USER</b>\n\n"
-            "👤 Profile: <a href='tg://user?id={telegram_id}'>link</a>\n"
-            "🆔 ID: <code>{telegram_id}</code>\n"
-            "👤 Username: @{username}\n"
-            "📱 Phone: <code>{phone}</code>\n"
-            "📅 Date: {registration_date}\n"
-            "🌍 Language: {language}"
-        ),
-        "admin_duplicate_attempt": (
-            "⚠️ <b>MULTI-ACCOUNT ATTEMPT!</b>\n\n"
-            "User trying to register second account:\n\n"
-            "🆔 New ID: <code>{new_id}</code>\n"
-            "📱 Phone: <code>{phone}</code>\n"
-            "🔗 Existing ID: <code>{existing_id}</code>\n"
-            "👤 Username: @{username}"
-        ),
-        "duplicate_phone_error": (
-            "⛔️ <b>REGISTRATION ERROR</b>\n\n"
-            "This phone number is already registered.\n\n"
-            "According to rules, one user can have only one account.\n\n"
-            "If you lost access to previous account, contact admin: @mrztn"
-        ),
-        "rate_limit_warning": (
-            "⚠️ Too many commands. Wait {seconds} seconds."
-        ),
-        "flood_blocked": (
-            "🚫 <b>ANTI-SPAM</b>\n\n"
-            "Suspicious activity detected (flood).\n"
-            "Your account temporarily blocked for {minutes} minutes.\n\n"
-            "Please use bot reasonably."
-        ),
-        "language_select": "🌐 Выберите язык / Select language:",
-        "btn_lang_ru": "🇷🇺 Русский",
-        "btn_lang_en": "🇬🇧 English",
-        "language_changed": "✅ Language changed to: {language}"
-    }
-}
+def setup_logging():
+    """Настройка логирования (при запуске бота, а не при импорте модуля)"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)-8s | %(name)s | %(message)s',
+        handlers=[
+            logging.FileHandler(LOG_PATH, encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
 
 # ════════════════════════════════════════════════════════════════
 # МОДЕЛИ ДАННЫХ
@@ -681,9 +141,27 @@ class User:
     is_admin: bool = False
     referred_by: Optional[int] = None
     deletion_scheduled: Optional[datetime] = None
+    is_reachable: bool = True  # False — рассылка не доставлена (бот заблокирован и т.п.)
     
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        """Словарь для FSM: время — в секундах Unix, как в БД"""
+        data = asdict(self)
+        for key in ("registration_date", "deletion_scheduled"):
+            if data[key] is not None:
+                data[key] = to_epoch(data[key])
+        return data
+
+USER_FIELDS = frozenset(f.name for f in fields(User))
+
+# Колонки таблицы users (в порядке схемы)
+USER_COLUMNS = (
+    "telegram_id", "username", "phone", "phone_hash", "language",
+    "registration_date", "policy_accepted", "policy_accepted_date",
+    "terms_accepted", "terms_accepted_date", "age_confirmed",
+    "age_confirmed_date", "is_blocked", "block_reason", "block_date",
+    "is_admin", "referred_by", "deletion_scheduled", "last_activity",
+    "is_reachable", "unreachable_since", "referral_count"
+)
 
 @dataclass
 class LogEntry:
@@ -696,6 +174,136 @@ class LogEntry:
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
 
+# Статусы заданий рассылки
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_CANCELLED = "cancelled"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+BROADCAST_STATUS_LABELS = {
+    JOB_PENDING: "⏳ В очереди",
+    JOB_RUNNING: "📤 Выполняется",
+    JOB_PAUSED: "⏸ На паузе",
+    JOB_CANCELLED: "⏹ Отменена",
+    JOB_DONE: "✅ Завершена",
+    JOB_FAILED: "❌ Ошибка"
+}
+
+@dataclass
+class BroadcastSegment:
+    """
+    Сегмент получателей рассылки.
+    Задаётся строкой вида:
+    lang=ru registered=2026-01-01..2026-02-01 active=7 referred=yes badge=pioneer
+    """
+    language: Optional[str] = None
+    registered_from: Optional[str] = None   # Дата YYYY-MM-DD, включительно
+    registered_to: Optional[str] = None     # Дата YYYY-MM-DD, включительно
+    active_since: Optional[int] = None      # Epoch, фиксируется при создании
+    referred: Optional[bool] = None
+    badge: Optional[str] = None
+    
+    @classmethod
+    def parse(cls, text: str) -> "BroadcastSegment":
+        """Разобрать описание сегмента (ValueError при ошибке)"""
+        segment = cls()
+        for token in text.split():
+            if token.lower() == "all":
+                continue
+            if "=" not in token:
+                raise ValueError(f"Ожидалось ключ=значение: {token}")
+            key, value = token.split("=", 1)
+            key = key.lower()
+            
+            if key == "lang":
+                segment.language = value.lower()
+            elif key == "registered":
+                start, _, end = value.partition("..")
+                for date_value in (start, end):
+                    if date_value:
+                        datetime.strptime(date_value, "%Y-%m-%d")
+                segment.registered_from = start or None
+                segment.registered_to = end or None
+            elif key == "active":
+                days = int(value)
+                segment.active_since = to_epoch(datetime.now(timezone.utc) - timedelta(days=days))
+            elif key == "referred":
+                if value.lower() not in ("yes", "no"):
+                    raise ValueError("referred: ожидалось yes или no")
+                segment.referred = value.lower() == "yes"
+            elif key == "badge":
+                segment.badge = value
+            else:
+                raise ValueError(f"Неизвестный фильтр: {key}")
+        return segment
+    
+    def describe(self) -> str:
+        parts = []
+        if self.language:
+            parts.append(f"язык {self.language}")
+        if self.registered_from or self.registered_to:
+            parts.append(f"регистрация {self.registered_from or '…'} — {self.registered_to or '…'}")
+        if self.active_since:
+            parts.append(f"активны с {from_epoch(self.active_since):%Y-%m-%d}")
+        if self.referred is not None:
+            parts.append("пришли по рефералке" if self.referred else "без реферала")
+        if self.badge:
+            parts.append(f"бейдж {self.badge}")
+        return ", ".join(parts) or "все пользователи"
+    
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+    
+    @classmethod
+    def from_json(cls, data: Optional[str]) -> Optional["BroadcastSegment"]:
+        return cls(**json.loads(data)) if data else None
+
+def parse_broadcast_variants(text: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Разобрать текст рассылки на языковые варианты.
+    Строка вида [ru] или [en] начинает вариант для языка,
+    текст до первого маркера — вариант по умолчанию.
+    Возвращает: (текст по умолчанию, {язык: текст})
+    """
+    default_lines: List[str] = []
+    variants: Dict[str, List[str]] = {}
+    current = default_lines
+    for line in text.splitlines():
+        marker = re.fullmatch(r"\[([a-z]{2,3})\]\s*", line.strip().lower())
+        if marker:
+            current = variants.setdefault(marker.group(1), [])
+            continue
+        current.append(line)
+    
+    rendered = {lang: "\n".join(lines).strip() for lang, lines in variants.items()}
+    rendered = {lang: variant for lang, variant in rendered.items() if variant}
+    default = "\n".join(default_lines).strip()
+    if not default and rendered:
+        default = next(iter(rendered.values()))
+    return default, rendered
+
+@dataclass
+class BroadcastJob:
+    """Модель задания рассылки"""
+    id: int
+    admin_id: int
+    text: str
+    status: str
+    cursor: int = 0  # Последний обработанный telegram_id
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    progress_chat_id: Optional[int] = None
+    progress_message_id: Optional[int] = None
+    segment: Optional[BroadcastSegment] = None
+    variants: Dict[str, str] = field(default_factory=dict)  # Тексты по языкам
+    
+    def text_for(self, language: Optional[str]) -> str:
+        """Текст для пользователя с данным языком"""
+        return self.variants.get(language, self.text)
+
 # ════════════════════════════════════════════════════════════════
 # FSM СОСТОЯНИЯ
 # ════════════════════════════════════════════════════════════════
@@ -751,131 +359,59 @@ class Database:
     
     def __init__(self, db_path: str):
         self.db_path = db_path
-        self.init_database()
-    
-    def get_connection(self) -> sqlite3.Connection:
-        """Получить подключение к БД"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
-    
-    def init_database(self):
-        """Инициализация базы данных"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Таблица пользователей
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                telegram_id INTEGER PRIMARY KEY,
-                username TEXT,
-                phone TEXT UNIQUE,
-                phone_hash TEXT,
-                language TEXT DEFAULT 'ru',
-                registration_date TIMESTAMP,
-                policy_accepted BOOLEAN DEFAULT 0,
-                policy_accepted_date TIMESTAMP,
-                terms_accepted BOOLEAN DEFAULT 0,
-                terms_accepted_date TIMESTAMP,
-                age_confirmed BOOLEAN DEFAULT 0,
-                age_confirmed_date TIMESTAMP,
-                is_blocked BOOLEAN DEFAULT 0,
-                block_reason TEXT,
-                block_date TIMESTAMP,
-                is_admin BOOLEAN DEFAULT 0,
-                referred_by INTEGER,
-                deletion_scheduled TIMESTAMP,
-                last_activity TIMESTAMP
-            )
-        """)
-        
-        # Таблица логов
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                action TEXT,
-                details TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица рейт-лимитов
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS rate_limits (
-                user_id INTEGER PRIMARY KEY,
-                command_count INTEGER DEFAULT 0,
-                last_command_time TIMESTAMP,
-                flood_strikes INTEGER DEFAULT 0,
-                flood_blocked_until TIMESTAMP
-            )
-        """)
-        
-        # Таблица бейджей
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS badges (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                badge_type TEXT,
-                earned_date TIMESTAMP,
-                UNIQUE(user_id, badge_type)
-            )
-        """)
-        
-        # Таблица статистики WebApp
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS webapp_stats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                opened_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Индексы для оптимизации
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_phone_hash ON users(phone_hash)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_user_id ON logs(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp)")
-        
-        conn.commit()
-        conn.close()
-        
-        logger.info("✅ База данных инициализирована")
+        self._pool: Optional[ConnectionPool] = None
+        self._pool_lock = threading.Lock()
+    
+    @property
+    def pool(self) -> ConnectionPool:
+        """Пул подключений; файл БД открывается и мигрируется при первом обращении"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = self.init_database()
+        return self._pool
+    
+    def init_database(self) -> ConnectionPool:
+        """Инициализация базы данных (миграции схемы, см. migrations.py)"""
+        pool = get_pool(self.db_path, readers=DB_READERS)
+        version = migrate(pool)
+        logger.info(f"✅ База данных инициализирована (схема v{version})")
+        return pool
     
     def add_user(self, user: User) -> bool:
         """Добавить пользователя"""
+        phone_hash = self._hash_phone(user.phone) if user.phone else None
+        
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            phone_hash = self._hash_phone(user.phone) if user.phone else None
-            
-            cursor.execute("""
-                INSERT INTO users (
-                    telegram_id, username, phone, phone_hash, language,
-                    registration_date, policy_accepted, terms_accepted,
-                    age_confirmed, is_admin, referred_by
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                user.telegram_id, user.username, user.phone, phone_hash,
-                user.language, user.registration_date, user.policy_accepted,
-                user.terms_accepted, user.age_confirmed, user.is_admin,
-                user.referred_by
-            ))
-            
-            conn.commit()
-            conn.close()
+            with self.pool.writer() as conn:
+                conn.execute("""
+                    INSERT INTO users (
+                        telegram_id, username, phone, phone_hash, language,
+                        registration_date, policy_accepted, terms_accepted,
+                        age_confirmed, is_admin, referred_by
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    user.telegram_id, user.username, user.phone, phone_hash,
+                    user.language, user.registration_date, user.policy_accepted,
+                    user.terms_accepted, user.age_confirmed, user.is_admin,
+                    user.referred_by
+                ))
+                if user.referred_by:
+                    # В той же транзакции, что и регистрация приглашённого
+                    conn.execute(
+                        "UPDATE users SET referral_count = referral_count + 1 WHERE telegram_id = ?",
+                        (user.referred_by,)
+                    )
             return True
         except sqlite3.IntegrityError:
             return False
     
     def get_user(self, telegram_id: int) -> Optional[User]:
         """Получить пользователя по ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with self.pool.reader() as conn:
+            row = conn.execute(
+                "SELECT * FROM users WHERE telegram_id = ?", (telegram_id,)
+            ).fetchone()
         
         if row:
             return User(
@@ -883,356 +419,1598 @@ class Database:
                 username=row['username'],
                 phone=row['phone'],
                 language=row['language'],
-                registration_date=datetime.fromisoformat(row['registration_date']),
+                registration_date=from_epoch(row['registration_date']),
                 policy_accepted=bool(row['policy_accepted']),
                 terms_accepted=bool(row['terms_accepted']),
                 age_confirmed=bool(row['age_confirmed']),
                 is_blocked=bool(row['is_blocked']),
                 is_admin=bool(row['is_admin']),
                 referred_by=row['referred_by'],
-                deletion_scheduled=datetime.fromisoformat(row['deletion_scheduled']) if row['deletion_scheduled'] else None
+                deletion_scheduled=from_epoch(row['deletion_scheduled']),
+                is_reachable=bool(row['is_reachable'])
             )
         return None
     
     def update_user(self, telegram_id: int, **kwargs):
         """Обновить данные пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         # Формируем динамический запрос
         set_clause = ", ".join([f"{key} = ?" for key in kwargs.keys()])
         values = list(kwargs.values())
         values.append(telegram_id)
         
-        cursor.execute(f"UPDATE users SET {set_clause} WHERE telegram_id = ?", values)
-        conn.commit()
-        conn.close()
+        with self.pool.writer() as conn:
+            conn.execute(f"UPDATE users SET {set_clause} WHERE telegram_id = ?", values)
     
     def check_phone_exists(self, phone: str) -> Optional[int]:
         """Проверить, существует ли телефон (возвращает telegram_id владельца)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         phone_hash = self._hash_phone(phone)
-        cursor.execute("SELECT telegram_id FROM users WHERE phone_hash = ?", (phone_hash,))
-        row = cursor.fetchone()
-        conn.close()
+        
+        with self.pool.reader() as conn:
+            row = conn.execute(
+                "SELECT telegram_id FROM users WHERE phone_hash = ?", (phone_hash,)
+            ).fetchone()
         
         return row['telegram_id'] if row else None
     
-    def add_log(self, log: LogEntry):
-        """Добавить запись в лог"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO logs (user_id, action, details, timestamp)
-            VALUES (?, ?, ?, ?)
-        """, (log.user_id, log.action, log.details, log.timestamp))
-        
-        conn.commit()
-        conn.close()
+    def add_logs(self, logs: List[LogEntry]):
+        """Добавить пачку записей в лог одной транзакцией"""
+        with self.pool.writer() as conn:
+            conn.executemany("""
+                INSERT INTO logs (user_id, action, details, timestamp)
+                VALUES (?, ?, ?, ?)
+            """, [(log.user_id, log.action, log.details, log.timestamp) for log in logs])
     
     def get_statistics(self) -> Dict[str, Any]:
-        """Получить статистику"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Всего пользователей
-        cursor.execute("SELECT COUNT(*) FROM users WHERE is_blocked = 0")
-        total_users = cursor.fetchone()[0]
-        
-        # Регистрации сегодня
+        """Получить статистику (из rollup-таблицы stats_registrations)"""
         today = datetime.now(timezone.utc).date()
-        cursor.execute("""
-            SELECT COUNT(*) FROM users 
-            WHERE DATE(registration_date) = ? AND is_blocked = 0
-        """, (today.isoformat(),))
-        today_users = cursor.fetchone()[0]
-        
-        # Регистрации за неделю
-        week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        cursor.execute("""
-            SELECT COUNT(*) FROM users 
-            WHERE registration_date >= ? AND is_blocked = 0
-        """, (week_ago.isoformat(),))
-        week_users = cursor.fetchone()[0]
-        
-        conn.close()
+        week_start = today - timedelta(days=6)
+        
+        with self.pool.reader() as conn:
+            row = conn.execute("""
+                SELECT
+                    COALESCE(SUM(registered - blocked), 0) AS total,
+                    COALESCE(SUM(CASE WHEN day = ? THEN registered - blocked END), 0) AS today,
+                    COALESCE(SUM(CASE WHEN day >= ? THEN registered - blocked END), 0) AS week,
+                    COALESCE(SUM(unreachable), 0) AS unreachable
+                FROM stats_registrations
+            """, (today.isoformat(), week_start.isoformat())).fetchone()
         
         return {
-            "total": total_users,
-            "today": today_users,
-            "week": week_users
+            "total": row['total'],
+            "today": row['today'],
+            "week": row['week'],
+            "unreachable": row['unreachable']
         }
     
-    def get_all_users(self) -> List[Dict]:
-        """Получить всех пользователей"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def count_registered(self) -> int:
+        """Количество незаблокированных пользователей (из rollup-таблицы)"""
+        with self.pool.reader() as conn:
+            return conn.execute(
+                "SELECT COALESCE(SUM(registered - blocked), 0) FROM stats_registrations"
+            ).fetchone()[0]
+    
+    @staticmethod
+    def _users_filter(
+        reachable_only: bool,
+        segment: Optional[BroadcastSegment]
+    ) -> Tuple[str, List[Any]]:
+        """Условие WHERE для выборки пользователей и его параметры"""
+        conditions = ["is_blocked = 0"]
+        params: List[Any] = []
         
-        cursor.execute("SELECT * FROM users WHERE is_blocked = 0")
-        rows = cursor.fetchall()
-        conn.close()
+        if reachable_only:
+            conditions.append("is_reachable = 1")
+        
+        if segment:
+            if segment.language:
+                conditions.append("language = ?")
+                params.append(segment.language)
+            if segment.registered_from:
+                conditions.append("registration_date >= ?")
+                params.append(day_start_epoch(date.fromisoformat(segment.registered_from)))
+            if segment.registered_to:
+                # Верхняя граница включительно: всё, что раньше следующего дня
+                next_day = date.fromisoformat(segment.registered_to) + timedelta(days=1)
+                conditions.append("registration_date < ?")
+                params.append(day_start_epoch(next_day))
+            if segment.active_since:
+                conditions.append("last_activity >= ?")
+                params.append(segment.active_since)
+            if segment.referred is not None:
+                # referred_by > 0 (id пользователей положительны) — диапазон по индексу,
+                # в отличие от IS NOT NULL
+                conditions.append("referred_by > 0" if segment.referred else "referred_by IS NULL")
+            if segment.badge:
+                conditions.append(
+                    "telegram_id IN (SELECT user_id FROM badges WHERE badge_type = ?)"
+                )
+                params.append(segment.badge)
+        
+        return " AND ".join(conditions), params
+    
+    def count_users(
+        self,
+        reachable_only: bool = False,
+        segment: Optional[BroadcastSegment] = None
+    ) -> int:
+        """Количество незаблокированных пользователей (с учётом сегмента)"""
+        if not segment or segment == BroadcastSegment():
+            # Без фильтров — из rollup-таблицы, без прохода по users
+            unreachable = " - unreachable" if reachable_only else ""
+            with self.pool.reader() as conn:
+                return conn.execute(
+                    f"SELECT COALESCE(SUM(registered - blocked{unreachable}), 0) FROM stats_registrations"
+                ).fetchone()[0]
+        
+        where, params = self._users_filter(reachable_only, segment)
+        with self.pool.reader() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM users WHERE {where}", params).fetchone()[0]
+    
+    def get_users_page(
+        self,
+        columns: Tuple[str, ...],
+        after_id: int = 0,
+        limit: int = USER_PAGE_SIZE,
+        reachable_only: bool = False,
+        segment: Optional[BroadcastSegment] = None
+    ) -> List[Dict]:
+        """
+        Страница незаблокированных пользователей (keyset-пагинация по telegram_id).
+        Возвращает только запрошенные колонки.
+        """
+        unknown = set(columns) - set(USER_COLUMNS)
+        if unknown:
+            raise ValueError(f"Неизвестные колонки users: {', '.join(sorted(unknown))}")
+        
+        where, params = self._users_filter(reachable_only, segment)
+        with self.pool.reader() as conn:
+            rows = conn.execute(f"""
+                SELECT telegram_id, {", ".join(columns)} FROM users
+                WHERE {where} AND telegram_id > ?
+                ORDER BY telegram_id
+                LIMIT ?
+            """, (*params, after_id, limit)).fetchall()
         
         return [dict(row) for row in rows]
     
-    def check_rate_limit(self, user_id: int) -> Tuple[bool, int]:
+    def export_users(
+        self,
+        path: str,
+        max_bytes: int = EXPORT_PART_SIZE,
+        progress: Optional[Callable[[int], None]] = None
+    ) -> List[str]:
         """
-        Проверить рейт-лимит
-        Возвращает: (разрешено, секунд до разблокировки)
+        Выгрузить незаблокированных пользователей в сжатые файлы не больше max_bytes.
+        Строки пишутся потоково; progress(строк) вызывается из потока выгрузки.
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+        with self.pool.reader() as conn:
+            return export_users_parts(
+                conn, path, max_bytes, "csv", USER_COLUMNS,
+                active_only=True, progress=progress
+            )
+    
+    def load_flood_blocks(self) -> Dict[int, datetime]:
+        """Загрузить действующие флуд-блокировки (для восстановления после рестарта)"""
         now = datetime.now(timezone.utc)
         
-        # Проверяем флуд-блокировку
-        cursor.execute("""
-            SELECT flood_blocked_until FROM rate_limits WHERE user_id = ?
-        """, (user_id,))
-        row = cursor.fetchone()
-        
-        if row and row['flood_blocked_until']:
-            blocked_until = datetime.fromisoformat(row['flood_blocked_until'])
-            if now < blocked_until:
-                seconds_left = int((blocked_until - now).total_seconds())
-                conn.close()
-                return False, seconds_left
-        
-        # Проверяем лимит команд
-        cursor.execute("""
-            SELECT command_count, last_command_time FROM rate_limits WHERE user_id = ?
-        """, (user_id,))
-        row = cursor.fetchone()
+        with self.pool.reader() as conn:
+            rows = conn.execute("""
+                SELECT user_id, flood_blocked_until FROM rate_limits
+                WHERE flood_blocked_until > ?
+            """, (now,)).fetchall()
         
-        if row:
-            last_time = datetime.fromisoformat(row['last_command_time'])
-            time_diff = (now - last_time).total_seconds()
-            
-            if time_diff < 60:  # В пределах минуты
-                count = row['command_count']
-                if count >= 5:  # Превышен лимит
-                    # Инкрементируем флуд-страйки
-                    cursor.execute("""
-                        UPDATE rate_limits 
-                        SET flood_strikes = flood_strikes + 1
-                        WHERE user_id = ?
-                    """, (user_id,))
-                    
-                    # Проверяем количество страйков
-                    cursor.execute("SELECT flood_strikes FROM rate_limits WHERE user_id = ?", (user_id,))
-                    strikes = cursor.fetchone()['flood_strikes']
-                    
-                    if strikes >= 3:  # Блокируем на час
-                        block_until = now + timedelta(hours=1)
-                        cursor.execute("""
-                            UPDATE rate_limits 
-                            SET flood_blocked_until = ?, flood_strikes = 0
-                            WHERE user_id = ?
-                        """, (block_until.isoformat(), user_id))
-                        conn.commit()
-                        conn.close()
-                        return False, 3600
-                    
-                    conn.commit()
-                    conn.close()
-                    return False, int(60 - time_diff)
-                else:
-                    # Инкрементируем счётчик
-                    cursor.execute("""
-                        UPDATE rate_limits 
-                        SET command_count = command_count + 1
-                        WHERE user_id = ?
-                    """, (user_id,))
-            else:
-                # Прошла минута, сбрасываем счётчик
-                cursor.execute("""
-                    UPDATE rate_limits 
-                    SET command_count = 1, last_command_time = ?
-                    WHERE user_id = ?
-                """, (now.isoformat(), user_id))
-        else:
-            # Первая команда
-            cursor.execute("""
-                INSERT INTO rate_limits (user_id, command_count, last_command_time)
-                VALUES (?, 1, ?)
-            """, (user_id, now.isoformat()))
-        
-        conn.commit()
-        conn.close()
-        return True, 0
+        return {row['user_id']: from_epoch(row['flood_blocked_until']) for row in rows}
+    
+    def save_flood_blocks(self, blocks: Dict[int, datetime]):
+        """Сохранить снимок флуд-блокировок в таблицу rate_limits (истёкшие удаляются)"""
+        with self.pool.writer() as conn:
+            conn.execute(
+                "DELETE FROM rate_limits WHERE flood_blocked_until <= ?", (datetime.now(timezone.utc),)
+            )
+            conn.executemany("""
+                INSERT INTO rate_limits (user_id, flood_blocked_until)
+                VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    flood_blocked_until = excluded.flood_blocked_until
+            """, list(blocks.items()))
     
     def add_badge(self, user_id: int, badge_type: str):
         """Добавить бейдж пользователю"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO badges (user_id, badge_type, earned_date)
-                VALUES (?, ?, ?)
-            """, (user_id, badge_type, datetime.now(timezone.utc).isoformat()))
-            
-            conn.commit()
-            conn.close()
+            with self.pool.writer() as conn:
+                conn.execute("""
+                    INSERT INTO badges (user_id, badge_type, earned_date)
+                    VALUES (?, ?, ?)
+                """, (user_id, badge_type, datetime.now(timezone.utc)))
             return True
         except sqlite3.IntegrityError:
             return False  # Бейдж уже есть
     
     def get_user_badges(self, user_id: int) -> List[str]:
         """Получить бейджи пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT badge_type FROM badges WHERE user_id = ?", (user_id,))
-        rows = cursor.fetchall()
-        conn.close()
+        with self.pool.reader() as conn:
+            rows = conn.execute(
+                "SELECT badge_type FROM badges WHERE user_id = ?", (user_id,)
+            ).fetchall()
         
         return [row['badge_type'] for row in rows]
     
     def get_referral_count(self, user_id: int) -> int:
         """Получить количество рефералов"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.pool.reader() as conn:
+            row = conn.execute(
+                "SELECT referral_count FROM users WHERE telegram_id = ?", (user_id,)
+            ).fetchone()
         
-        cursor.execute("SELECT COUNT(*) FROM users WHERE referred_by = ?", (user_id,))
-        count = cursor.fetchone()[0]
-        conn.close()
+        return row['referral_count'] if row else 0
+    
+    def get_top_referrers(self, limit: int = REFERRAL_LEADERBOARD_SIZE) -> List[Dict]:
+        """Рейтинг пригласивших (по индексу idx_users_referral_count)"""
+        with self.pool.reader() as conn:
+            rows = conn.execute("""
+                SELECT telegram_id, username, referral_count FROM users
+                WHERE referral_count > 0
+                ORDER BY referral_count DESC
+                LIMIT ?
+            """, (limit,)).fetchall()
         
-        return count
+        return [dict(row) for row in rows]
     
     def log_webapp_open(self, user_id: int):
         """Залогировать открытие WebApp"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO webapp_stats (user_id, opened_date)
-            VALUES (?, ?)
-        """, (user_id, datetime.now(timezone.utc).isoformat()))
-        
-        conn.commit()
-        conn.close()
+        with self.pool.writer() as conn:
+            conn.execute("""
+                INSERT INTO webapp_stats (user_id, opened_date)
+                VALUES (?, ?)
+            """, (user_id, datetime.now(timezone.utc)))
     
     def get_webapp_opens(self, user_id: int) -> int:
         """Получить количество открытий WebApp"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.pool.reader() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM webapp_stats WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+    
+    def mark_unreachable(self, telegram_ids: List[int]):
+        """Пометить пользователей недоступными для рассылок (одной транзакцией)"""
+        now = datetime.now(timezone.utc)
+        with self.pool.writer() as conn:
+            conn.executemany("""
+                UPDATE users SET is_reachable = 0, unreachable_since = ?
+                WHERE telegram_id = ? AND is_reachable = 1
+            """, [(now, telegram_id) for telegram_id in telegram_ids])
+    
+    def create_broadcast_job(
+        self,
+        admin_id: int,
+        text: str,
+        total: int,
+        segment: Optional[BroadcastSegment] = None,
+        variants: Optional[Dict[str, str]] = None
+    ) -> int:
+        """Создать задание рассылки"""
+        now = datetime.now(timezone.utc)
+        with self.pool.writer() as conn:
+            cursor = conn.execute("""
+                INSERT INTO broadcast_jobs (
+                    admin_id, text, status, total, segment, variants, created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                admin_id, text, JOB_PENDING, total,
+                segment.to_json() if segment else None,
+                json.dumps(variants or {}, ensure_ascii=False),
+                now, now
+            ))
+            return cursor.lastrowid
+    
+    def update_broadcast_job(self, job_id: int, **kwargs):
+        """Обновить задание рассылки"""
+        kwargs["updated_at"] = datetime.now(timezone.utc)
+        set_clause = ", ".join([f"{key} = ?" for key in kwargs.keys()])
+        values = list(kwargs.values())
+        values.append(job_id)
         
-        cursor.execute("SELECT COUNT(*) FROM webapp_stats WHERE user_id = ?", (user_id,))
-        count = cursor.fetchone()[0]
-        conn.close()
+        with self.pool.writer() as conn:
+            conn.execute(f"UPDATE broadcast_jobs SET {set_clause} WHERE id = ?", values)
+    
+    def get_broadcast_job(self, job_id: int) -> Optional[BroadcastJob]:
+        """Получить задание рассылки"""
+        with self.pool.reader() as conn:
+            row = conn.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+    
+    def get_next_broadcast_job(self) -> Optional[BroadcastJob]:
+        """Следующее задание к выполнению (в т.ч. прерванное рестартом)"""
+        with self.pool.reader() as conn:
+            row = conn.execute("""
+                SELECT * FROM broadcast_jobs
+                WHERE status IN (?, ?)
+                ORDER BY id
+                LIMIT 1
+            """, (JOB_RUNNING, JOB_PENDING)).fetchone()
+        return self._row_to_job(row) if row else None
+    
+    def get_recent_broadcast_jobs(self, limit: int = 5) -> List[BroadcastJob]:
+        """Последние задания рассылки"""
+        with self.pool.reader() as conn:
+            rows = conn.execute(
+                "SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+    
+    def get_fsm_record(self, key: str) -> Optional[Tuple[Optional[str], Dict[str, Any], int]]:
+        """Состояние FSM: (state, data, updated_at) или None"""
+        with self.pool.reader() as conn:
+            row = conn.execute(
+                "SELECT state, data, updated_at FROM fsm_states WHERE key = ?", (key,)
+            ).fetchone()
         
-        return count
+        if not row:
+            return None
+        return row['state'], json.loads(row['data']) if row['data'] else {}, row['updated_at']
+    
+    def save_fsm_records(self, records: List[Tuple[str, Optional[str], str, int]]):
+        """
+        Записать пачку состояний FSM одной транзакцией.
+        records: (key, state, data в JSON, updated_at); пустые состояния удаляются.
+        """
+        upserts = [record for record in records if record[1] is not None or record[2] != "{}"]
+        deletes = [(record[0],) for record in records if record[1] is None and record[2] == "{}"]
+        with self.pool.writer() as conn:
+            conn.executemany("""
+                INSERT INTO fsm_states (key, state, data, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = excluded.state,
+                    data = excluded.data,
+                    updated_at = excluded.updated_at
+            """, upserts)
+            conn.executemany("DELETE FROM fsm_states WHERE key = ?", deletes)
+    
+    def purge_fsm_records(self, before: datetime) -> int:
+        """Удалить состояния FSM, не менявшиеся с before"""
+        with self.pool.writer() as conn:
+            return conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (before,)).rowcount
+    
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> BroadcastJob:
+        return BroadcastJob(
+            id=row['id'],
+            admin_id=row['admin_id'],
+            text=row['text'],
+            status=row['status'],
+            cursor=row['cursor'],
+            total=row['total'],
+            sent=row['sent'],
+            failed=row['failed'],
+            progress_chat_id=row['progress_chat_id'],
+            progress_message_id=row['progress_message_id'],
+            segment=BroadcastSegment.from_json(row['segment']),
+            variants=json.loads(row['variants']) if row['variants'] else {}
+        )
+    
+    def close(self):
+        """Закрыть пул подключений"""
+        with self._pool_lock:
+            self._pool = None
+            close_pool(self.db_path)
     
     @staticmethod
     def _hash_phone(phone: str) -> str:
         """Хешировать номер телефона"""
         return hashlib.sha256(phone.encode()).hexdigest()
 
+class UserCache:
+    """LRU-кэш объектов User с ограничением по времени жизни"""
+    
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = 0  # Растёт при каждой инвалидации
+        self._items: "OrderedDict[int, Tuple[float, User]]" = OrderedDict()
+    
+    def get(self, telegram_id: int) -> Optional[User]:
+        item = self._items.get(telegram_id)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._items[telegram_id]
+            self.misses += 1
+            return None
+        
+        self._items.move_to_end(telegram_id)
+        self.hits += 1
+        return item[1]
+    
+    def put(self, user: User):
+        self._items[user.telegram_id] = (time.monotonic() + self.ttl, user)
+        self._items.move_to_end(user.telegram_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+    
+    def invalidate(self, telegram_id: int):
+        self.version += 1
+        self._items.pop(telegram_id, None)
+    
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+class AsyncDatabase:
+    """
+    Асинхронная обёртка над Database.
+    Синхронные запросы sqlite3 выполняются в пуле потоков,
+    поэтому медленная запись не блокирует event loop.
+    """
+    
+    def __init__(self, database: Database, max_workers: int = DB_WORKERS):
+        self.sync = database
+        self.users = UserCache()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="db"
+        )
+    
+    async def _run(self, func, *args, **kwargs):
+        """Выполнить синхронный метод в потоке БД"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+    
+    async def add_user(self, user: User) -> bool:
+        success = await self._run(self.sync.add_user, user)
+        self.users.invalidate(user.telegram_id)
+        return success
+    
+    async def get_user(self, telegram_id: int) -> Optional[User]:
+        user = self.users.get(telegram_id)
+        if user is not None:
+            return user
+        
+        version = self.users.version
+        user = await self._run(self.sync.get_user, telegram_id)
+        # Не кэшируем, если за время запроса кто-то изменил пользователей
+        if user is not None and version == self.users.version:
+            self.users.put(user)
+        return user
+    
+    async def update_user(self, telegram_id: int, **kwargs):
+        await self._run(self.sync.update_user, telegram_id, **kwargs)
+        # Поля вроде last_activity в User не входят — кэш остаётся валидным
+        if USER_FIELDS.intersection(kwargs):
+            self.users.invalidate(telegram_id)
+    
+    async def check_phone_exists(self, phone: str) -> Optional[int]:
+        return await self._run(self.sync.check_phone_exists, phone)
+    
+    async def add_logs(self, logs: List[LogEntry]):
+        await self._run(self.sync.add_logs, logs)
+    
+    async def get_statistics(self) -> Dict[str, Any]:
+        return await self._run(self.sync.get_statistics)
+    
+    async def count_registered(self) -> int:
+        return await self._run(self.sync.count_registered)
+    
+    async def count_users(
+        self,
+        reachable_only: bool = False,
+        segment: Optional[BroadcastSegment] = None
+    ) -> int:
+        return await self._run(self.sync.count_users, reachable_only, segment)
+    
+    async def iter_users(
+        self,
+        columns: Tuple[str, ...] = ("telegram_id",),
+        after_id: int = 0,
+        page_size: int = USER_PAGE_SIZE,
+        reachable_only: bool = False,
+        segment: Optional[BroadcastSegment] = None
+    ) -> AsyncIterator[Dict]:
+        """Потоково перебрать незаблокированных пользователей страницами"""
+        while True:
+            page = await self._run(
+                self.sync.get_users_page, columns, after_id, page_size, reachable_only, segment
+            )
+            for row in page:
+                yield {column: row[column] for column in columns}
+            if len(page) < page_size:
+                return
+            after_id = page[-1]['telegram_id']
+    
+    async def export_users(
+        self,
+        path: str,
+        max_bytes: int = EXPORT_PART_SIZE,
+        progress: Optional[Callable[[int], None]] = None
+    ) -> List[str]:
+        return await self._run(self.sync.export_users, path, max_bytes, progress)
+    
+    async def load_flood_blocks(self) -> Dict[int, datetime]:
+        return await self._run(self.sync.load_flood_blocks)
+    
+    async def save_flood_blocks(self, blocks: Dict[int, datetime]):
+        await self._run(self.sync.save_flood_blocks, blocks)
+    
+    async def add_badge(self, user_id: int, badge_type: str) -> bool:
+        return await self._run(self.sync.add_badge, user_id, badge_type)
+    
+    async def get_user_badges(self, user_id: int) -> List[str]:
+        return await self._run(self.sync.get_user_badges, user_id)
+    
+    async def get_referral_count(self, user_id: int) -> int:
+        return await self._run(self.sync.get_referral_count, user_id)
+    
+    async def get_top_referrers(self, limit: int = REFERRAL_LEADERBOARD_SIZE) -> List[Dict]:
+        return await self._run(self.sync.get_top_referrers, limit)
+    
+    async def log_webapp_open(self, user_id: int):
+        await self._run(self.sync.log_webapp_open, user_id)
+    
+    async def get_webapp_opens(self, user_id: int) -> int:
+        return await self._run(self.sync.get_webapp_opens, user_id)
+    
+    async def mark_unreachable(self, telegram_ids: List[int]):
+        await self._run(self.sync.mark_unreachable, telegram_ids)
+        for telegram_id in telegram_ids:
+            self.users.invalidate(telegram_id)
+    
+    async def create_broadcast_job(
+        self,
+        admin_id: int,
+        text: str,
+        total: int,
+        segment: Optional[BroadcastSegment] = None,
+        variants: Optional[Dict[str, str]] = None
+    ) -> int:
+        return await self._run(
+            self.sync.create_broadcast_job, admin_id, text, total, segment, variants
+        )
+    
+    async def update_broadcast_job(self, job_id: int, **kwargs):
+        await self._run(self.sync.update_broadcast_job, job_id, **kwargs)
+    
+    async def get_broadcast_job(self, job_id: int) -> Optional[BroadcastJob]:
+        return await self._run(self.sync.get_broadcast_job, job_id)
+    
+    async def get_next_broadcast_job(self) -> Optional[BroadcastJob]:
+        return await self._run(self.sync.get_next_broadcast_job)
+    
+    async def get_fsm_record(self, key: str) -> Optional[Tuple[Optional[str], Dict[str, Any], int]]:
+        return await self._run(self.sync.get_fsm_record, key)
+    
+    async def save_fsm_records(self, records: List[Tuple[str, Optional[str], str, int]]):
+        await self._run(self.sync.save_fsm_records, records)
+    
+    async def purge_fsm_records(self, before: datetime) -> int:
+        return await self._run(self.sync.purge_fsm_records, before)
+    
+    async def get_recent_broadcast_jobs(self, limit: int = 5) -> List[BroadcastJob]:
+        return await self._run(self.sync.get_recent_broadcast_jobs, limit)
+    
+    def close(self):
+        """Дождаться завершения запросов, остановить потоки и закрыть пул"""
+        self._executor.shutdown(wait=True)
+        self.sync.close()
+
+# ════════════════════════════════════════════════════════════════
+# РЕЙТ-ЛИМИТЫ
+# ════════════════════════════════════════════════════════════════
+
+class _RateState:
+    """Состояние рейт-лимита одного пользователя"""
+    __slots__ = ("window_start", "count", "strikes", "blocked_until")
+    
+    def __init__(self, now: float):
+        self.window_start = now
+        self.count = 1
+        self.strikes = 0
+        self.blocked_until = 0.0
+
+class RateLimiter:
+    """
+    Рейт-лимитер в памяти процесса.
+    Окно RATE_LIMIT_WINDOW секунд на RATE_LIMIT_COMMANDS команд,
+    каждое превышение — страйк, FLOOD_STRIKES_LIMIT страйков — флуд-блокировка.
+    В БД периодически сохраняются только флуд-блокировки.
+    """
+    
+    def __init__(self):
+        self._states: Dict[int, _RateState] = {}
+        self._dirty_blocks: Dict[int, float] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    def check(self, user_id: int) -> Tuple[bool, int]:
+        """
+        Проверить рейт-лимит
+        Возвращает: (разрешено, секунд до разблокировки)
+        """
+        now = time.time()
+        state = self._states.get(user_id)
+        
+        if state is None:
+            # Первая команда
+            self._states[user_id] = _RateState(now)
+            return True, 0
+        
+        # Проверяем флуд-блокировку
+        if now < state.blocked_until:
+            return False, int(state.blocked_until - now)
+        
+        time_diff = now - state.window_start
+        if time_diff >= RATE_LIMIT_WINDOW:
+            # Прошла минута, сбрасываем счётчик
+            state.window_start = now
+            state.count = 1
+            return True, 0
+        
+        if state.count < RATE_LIMIT_COMMANDS:
+            state.count += 1
+            return True, 0
+        
+        # Превышен лимит — страйк
+        state.strikes += 1
+        if state.strikes >= FLOOD_STRIKES_LIMIT:
+            state.blocked_until = now + FLOOD_BLOCK_DURATION
+            state.strikes = 0
+            self._dirty_blocks[user_id] = state.blocked_until
+            return False, FLOOD_BLOCK_DURATION
+        
+        return False, int(RATE_LIMIT_WINDOW - time_diff)
+    
+    def purge_expired(self):
+        """Удалить записи неактивных пользователей"""
+        now = time.time()
+        expired = [
+            user_id for user_id, state in self._states.items()
+            if now >= state.blocked_until
+            and now - state.window_start >= (FLOOD_BLOCK_DURATION if state.strikes else RATE_LIMIT_WINDOW)
+        ]
+        for user_id in expired:
+            del self._states[user_id]
+    
+    async def restore(self, database: "AsyncDatabase"):
+        """Восстановить флуд-блокировки из БД"""
+        blocks = await database.load_flood_blocks()
+        now = time.time()
+        for user_id, blocked_until in blocks.items():
+            state = _RateState(now)
+            state.count = 0
+            state.blocked_until = blocked_until.timestamp()
+            self._states[user_id] = state
+        logger.info(f"🛡 Восстановлено флуд-блокировок: {len(blocks)}")
+    
+    async def snapshot(self, database: "AsyncDatabase"):
+        """Сохранить новые флуд-блокировки в БД"""
+        if not self._dirty_blocks:
+            return
+        blocks, self._dirty_blocks = self._dirty_blocks, {}
+        try:
+            await database.save_flood_blocks({
+                user_id: datetime.fromtimestamp(until, timezone.utc)
+                for user_id, until in blocks.items()
+            })
+        except BaseException:
+            # Не сохранилось — вернуть в очередь; более свежие блокировки не трогаем
+            for user_id, until in blocks.items():
+                self._dirty_blocks.setdefault(user_id, until)
+            raise
+    
+    async def _snapshot_loop(self, database: "AsyncDatabase"):
+        while True:
+            await asyncio.sleep(RATE_LIMIT_SNAPSHOT_INTERVAL)
+            self.purge_expired()
+            try:
+                await self.snapshot(database)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения флуд-блокировок: {e}")
+    
+    async def start(self, database: "AsyncDatabase"):
+        """Восстановить состояние и запустить периодическое сохранение"""
+        await self.restore(database)
+        self._task = asyncio.create_task(self._snapshot_loop(database))
+    
+    async def stop(self, database: "AsyncDatabase"):
+        """Остановить фоновую задачу и сохранить последний снимок"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.snapshot(database)
+
+# ════════════════════════════════════════════════════════════════
+# ЖУРНАЛ ДЕЙСТВИЙ
+# ════════════════════════════════════════════════════════════════
+
+class LogWriter:
+    """
+    Отложенная пакетная запись логов.
+    Хэндлеры кладут LogEntry в ограниченную очередь, фоновая задача
+    пишет их пачками одной транзакцией раз в LOG_FLUSH_INTERVAL секунд
+    или по набору LOG_BATCH_SIZE записей.
+    
+    Политики при переполнении очереди:
+    - "block"       — хэндлер ждёт освобождения места
+    - "drop_new"    — новая запись отбрасывается
+    - "drop_oldest" — отбрасывается самая старая запись в очереди
+    """
+    
+    POLICIES = ("block", "drop_new", "drop_oldest")
+    
+    def __init__(
+        self,
+        max_size: int = LOG_QUEUE_SIZE,
+        batch_size: int = LOG_BATCH_SIZE,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        policy: str = LOG_QUEUE_POLICY
+    ):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Неизвестная политика очереди логов: {policy}")
+        
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.dropped = 0
+        self.written = 0
+        self._task: Optional[asyncio.Task] = None
+    
+    async def add(self, log: LogEntry):
+        """Поставить запись в очередь на запись"""
+        if self.policy == "block":
+            await self._queue.put(log)
+            return
+        
+        try:
+            self._queue.put_nowait(log)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.policy == "drop_oldest":
+                self._queue.get_nowait()
+                self._queue.put_nowait(log)
+    
+    async def _write(self, database: "AsyncDatabase", batch: List[LogEntry]):
+        try:
+            await database.add_logs(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.error(f"Ошибка записи {len(batch)} логов: {e}")
+    
+    async def _flush_loop(self, database: "AsyncDatabase"):
+        loop = asyncio.get_running_loop()
+        batch: List[LogEntry] = []
+        try:
+            while True:
+                batch.append(await self._queue.get())
+                deadline = loop.time() + self.flush_interval
+                
+                while len(batch) < self.batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                
+                pending, batch = batch, []
+                await self._write(database, pending)
+        except asyncio.CancelledError:
+            if batch:
+                await self._write(database, batch)
+            raise
+    
+    def start(self, database: "AsyncDatabase"):
+        """Запустить фоновую запись"""
+        self._task = asyncio.create_task(self._flush_loop(database))
+    
+    async def stop(self, database: "AsyncDatabase"):
+        """Остановить фоновую запись и сбросить остаток очереди"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._write(database, batch)
+        
+        if self.dropped:
+            logger.warning(f"⚠️ Потеряно записей лога: {self.dropped}")
+
+# ════════════════════════════════════════════════════════════════
+# ХРАНИЛИЩЕ FSM
+# ════════════════════════════════════════════════════════════════
+
+class _FSMRecord:
+    __slots__ = ("state", "data", "updated")
+    
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None, updated: float = 0.0):
+        self.state = state
+        self.data = data or {}
+        self.updated = updated
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в таблице fsm_states.
+    Состояния кэшируются в ограниченном LRU (FSM_CACHE_SIZE), изменения
+    копятся в памяти и пишутся одной транзакцией раз в FSM_FLUSH_INTERVAL —
+    несколько set_state/set_data за апдейт дают одну запись в БД.
+    Сценарии без изменений дольше FSM_TTL (брошенная регистрация)
+    удаляются из БД и памяти.
+    """
+    
+    def __init__(
+        self,
+        database: "AsyncDatabase",
+        cache_size: int = FSM_CACHE_SIZE,
+        ttl: float = FSM_TTL,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        purge_interval: float = FSM_PURGE_INTERVAL
+    ):
+        self.db = database
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.purge_interval = purge_interval
+        self._records: "OrderedDict[str, _FSMRecord]" = OrderedDict()
+        self._dirty: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+    
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) if part is not None else "" for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id,
+            key.business_connection_id, key.destiny
+        ))
+    
+    def _expired(self, record: _FSMRecord) -> bool:
+        return record.updated < time.time() - self.ttl
+    
+    async def _record(self, key: StorageKey) -> Tuple[str, _FSMRecord]:
+        storage_key = self._key(key)
+        record = self._records.get(storage_key)
+        if record is not None:
+            if self._expired(record) and (record.state or record.data):
+                record.state, record.data = None, {}
+                self._dirty.add(storage_key)
+            self._records.move_to_end(storage_key)
+            return storage_key, record
+        
+        stored = await self.db.get_fsm_record(storage_key)
+        if stored and stored[2] >= time.time() - self.ttl:
+            loaded = _FSMRecord(stored[0], stored[1], stored[2])
+        else:
+            # Пустые записи тоже кэшируются: у большинства пользователей нет состояния
+            loaded = _FSMRecord(updated=time.time())
+        
+        # Пока шло чтение, запись могла появиться из параллельного апдейта
+        record = self._records.setdefault(storage_key, loaded)
+        self._evict()
+        return storage_key, record
+    
+    def _evict(self):
+        """Вытеснить старые сохранённые записи сверх лимита"""
+        excess = len(self._records) - self.cache_size
+        if excess <= 0:
+            return
+        for storage_key in list(self._records):
+            if excess <= 0:
+                break
+            if storage_key not in self._dirty:
+                del self._records[storage_key]
+                excess -= 1
+    
+    def _touch(self, storage_key: str, record: _FSMRecord):
+        record.updated = time.time()
+        self._dirty.add(storage_key)
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(storage_key, record)
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._record(key)
+        return record.state
+    
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key, record = await self._record(key)
+        record.data = dict(data)
+        self._touch(storage_key, record)
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._record(key)
+        # Копия через JSON: данные должны быть сериализуемы для записи в БД
+        return json.loads(json.dumps(record.data))
+    
+    async def flush(self):
+        """Записать накопленные изменения одной транзакцией"""
+        if not self._dirty:
+            return
+        
+        keys, self._dirty = self._dirty, set()
+        records = []
+        for storage_key in keys:
+            record = self._records.get(storage_key)
+            if record is not None:
+                records.append((
+                    storage_key, record.state,
+                    json.dumps(record.data, ensure_ascii=False), int(record.updated)
+                ))
+        
+        try:
+            await self.db.save_fsm_records(records)
+        except Exception as e:
+            self._dirty |= keys
+            logger.error(f"Ошибка записи {len(records)} состояний FSM: {e}")
+        self._evict()
+    
+    async def purge(self):
+        """Удалить брошенные сценарии из БД и памяти"""
+        cutoff = time.time() - self.ttl
+        deleted = await self.db.purge_fsm_records(from_epoch(cutoff))
+        for storage_key, record in list(self._records.items()):
+            if record.updated < cutoff and storage_key not in self._dirty:
+                del self._records[storage_key]
+        if deleted:
+            logger.info(f"🧹 Удалено брошенных FSM-сценариев: {deleted}")
+    
+    async def _loop(self):
+        last_purge = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_purge >= self.purge_interval:
+                    last_purge = time.monotonic()
+                    await self.purge()
+            except Exception as e:
+                logger.warning(f"Ошибка обслуживания хранилища FSM: {e}")
+    
+    def start(self):
+        """Запустить фоновую запись и очистку"""
+        self._closed = False
+        self._task = asyncio.create_task(self._loop())
+    
+    async def close(self) -> None:
+        """Остановить фоновую задачу и записать несохранённые изменения"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+# ════════════════════════════════════════════════════════════════
+# РАССЫЛКИ
+# ════════════════════════════════════════════════════════════════
+
+class TokenBucket:
+    """Асинхронный token bucket: не более rate операций в секунду"""
+    
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def pause(self, seconds: float):
+        """Приостановить выдачу токенов (например, по RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+    
+    async def acquire(self):
+        """Дождаться и забрать один токен"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+@dataclass
+class BroadcastReport:
+    """Итоги рассылки"""
+    total: Optional[int] = None
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    cursor: int = 0  # Все telegram_id <= cursor обработаны
+    stopped: bool = False
+    pruned: int = 0
+    unreachable: List[int] = field(default_factory=list)  # Ещё не помечены в БД
+    failures: Dict[str, int] = field(default_factory=dict)
+    started: float = field(default_factory=time.monotonic)
+    finished: Optional[float] = None
+    
+    def __post_init__(self):
+        # При продолжении рассылки скорость считаем только по текущему запуску
+        self._initial_sent = self.sent
+    
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed
+    
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+    
+    @property
+    def rate(self) -> float:
+        """Скорость отправки, сообщений в секунду"""
+        sent = self.sent - self._initial_sent
+        return sent / self.elapsed if self.elapsed > 0 else 0.0
+    
+    def add_failure(self, failure_class: str):
+        self.failed += 1
+        self.failures[failure_class] = self.failures.get(failure_class, 0) + 1
+    
+    def progress_text(self) -> str:
+        total = self.total if self.total is not None else "?"
+        return (
+            f"📤 Отправка: {self.processed}/{total}\n"
+            f"⚡️ {self.rate:.1f} сообщ./с"
+        )
+    
+    def summary_text(self) -> str:
+        lines = [
+            "✅ Рассылка завершена!\n",
+            f"Успешно: {self.sent}",
+            f"Ошибок: {self.failed}",
+            f"Повторов: {self.retries}",
+            f"Исключены из рассылок: {self.pruned}",
+            f"Время: {self.elapsed:.1f} с",
+            f"Скорость: {self.rate:.1f} сообщ./с",
+        ]
+        if self.failures:
+            lines.append("\nОшибки по типам:")
+            lines.extend(f"• {name}: {count}" for name, count in sorted(self.failures.items()))
+        return "\n".join(lines)
+
+class _CursorTracker:
+    """
+    Отслеживает курсор рассылки: id выдаются по возрастанию,
+    а завершаются в произвольном порядке из-за параллельной отправки.
+    Курсор — последний id, до которого включительно всё обработано.
+    """
+    
+    def __init__(self, report: BroadcastReport):
+        self.report = report
+        self._dispatched: deque = deque()
+        self._done: set = set()
+    
+    def dispatch(self, chat_id: int):
+        self._dispatched.append(chat_id)
+    
+    def complete(self, chat_id: int):
+        self._done.add(chat_id)
+        while self._dispatched and self._dispatched[0] in self._done:
+            self.report.cursor = self._dispatched.popleft()
+            self._done.discard(self.report.cursor)
+
+# Ошибки, после которых пользователю больше нельзя доставить сообщение
+UNREACHABLE_FAILURES = frozenset({"blocked", "deactivated", "chat_not_found", "forbidden"})
+
+BROADCAST_VARIANTS_HELP = (
+    "Для разных языков начните варианты строками <code>[ru]</code> и <code>[en]</code> — "
+    "остальные получат текст до первого маркера (или первый вариант)."
+)
+
+def classify_send_error(error: Exception) -> Tuple[str, bool]:
+    """
+    Классифицировать ошибку отправки
+    Возвращает: (класс ошибки, можно ли повторить)
+    """
+    if isinstance(error, TelegramForbiddenError):
+        message = error.message.lower()
+        if "blocked" in message:
+            return "blocked", False
+        if "deactivated" in message:
+            return "deactivated", False
+        return "forbidden", False
+    if isinstance(error, TelegramBadRequest):
+        message = error.message.lower()
+        if "chat not found" in message or "user not found" in message:
+            return "chat_not_found", False
+        return "bad_request", False
+    if isinstance(error, TelegramServerError):
+        return "server", True
+    if isinstance(error, (TelegramNetworkError, asyncio.TimeoutError)):
+        return "network", True
+    return type(error).__name__, False
+
+class Broadcaster:
+    """
+    Рассылка с ограниченным параллелизмом.
+    Общий темп задаётся token bucket (лимит Telegram ~30 сообщ./с),
+    дополнительно выдерживается интервал между сообщениями в один чат.
+    RetryAfter приостанавливает всю рассылку на указанное время
+    (не больше max_flood_waits раз на сообщение), временные ошибки
+    повторяются с экспоненциальной задержкой.
+    """
+    
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = BROADCAST_RATE,
+        burst: float = BROADCAST_BURST,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        chat_interval: float = BROADCAST_CHAT_INTERVAL,
+        max_retries: int = BROADCAST_MAX_RETRIES,
+        max_flood_waits: int = BROADCAST_MAX_FLOOD_WAITS,
+        progress_interval: float = BROADCAST_PROGRESS_INTERVAL,
+        checkpoint_interval: float = BROADCAST_CHECKPOINT_INTERVAL
+    ):
+        self.bot = bot
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self.max_flood_waits = max_flood_waits
+        self.progress_interval = progress_interval
+        self.checkpoint_interval = checkpoint_interval
+        self._last_sent: Dict[int, float] = {}
+    
+    async def _pace_chat(self, chat_id: int):
+        """Выдержать интервал между сообщениями в один чат"""
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._last_sent[chat_id] = time.monotonic()
+    
+    async def _send(self, chat_id: int, text: str, report: BroadcastReport):
+        attempt = 0
+        flood_waits = 0
+        while True:
+            await self.bucket.acquire()
+            await self._pace_chat(chat_id)
+            try:
+                await self.bot.send_message(chat_id, text)
+                report.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                # Flood control: ждут все воркеры, попытки временных ошибок не расходуются,
+                # но один чат не может держать воркер бесконечно
+                self.bucket.pause(e.retry_after)
+                if flood_waits < self.max_flood_waits:
+                    flood_waits += 1
+                    report.retries += 1
+                    continue
+                logger.error(f"Ошибка отправки пользователю {chat_id}: RetryAfter {flood_waits} раз подряд")
+                report.add_failure("flood")
+                return
+            except Exception as e:
+                failure_class, retryable = classify_send_error(e)
+                if retryable and attempt < self.max_retries:
+                    attempt += 1
+                    report.retries += 1
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+                logger.error(f"Ошибка отправки пользователю {chat_id}: {e}")
+                report.add_failure(failure_class)
+                if failure_class in UNREACHABLE_FAILURES:
+                    report.unreachable.append(chat_id)
+                    report.pruned += 1
+                return
+    
+    async def _worker(
+        self,
+        queue: asyncio.Queue,
+        report: BroadcastReport,
+        tracker: _CursorTracker,
+        stop_event: asyncio.Event
+    ):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            chat_id, text = item
+            if stop_event.is_set():
+                continue  # Не отправлено — останется за курсором
+            await self._send(chat_id, text, report)
+            self._last_sent.pop(chat_id, None)
+            tracker.complete(chat_id)
+    
+    @staticmethod
+    async def _every(interval: float, callback, report: BroadcastReport):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await callback(report)
+            except Exception as e:
+                logger.warning(f"Ошибка периодического обработчика рассылки: {e}")
+    
+    async def run(
+        self,
+        chat_ids,
+        text: str,
+        report: Optional[BroadcastReport] = None,
+        on_progress=None,
+        on_checkpoint=None,
+        stop_event: Optional[asyncio.Event] = None
+    ) -> BroadcastReport:
+        """
+        Разослать текст по chat_ids (итерируемый или асинхронно итерируемый,
+        id по возрастанию — иначе курсор не имеет смысла).
+        Элемент может быть парой (chat_id, текст) — тогда получатель
+        получит свой вариант текста вместо общего.
+        on_progress(report) вызывается раз в progress_interval секунд,
+        on_checkpoint(report) — раз в checkpoint_interval секунд.
+        Установка stop_event останавливает рассылку после текущих отправок.
+        """
+        report = report or BroadcastReport()
+        stop_event = stop_event or asyncio.Event()
+        tracker = _CursorTracker(report)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [
+            asyncio.create_task(self._worker(queue, report, tracker, stop_event))
+            for _ in range(self.concurrency)
+        ]
+        tickers = []
+        if on_progress:
+            tickers.append(asyncio.create_task(self._every(self.progress_interval, on_progress, report)))
+        if on_checkpoint:
+            tickers.append(asyncio.create_task(self._every(self.checkpoint_interval, on_checkpoint, report)))
+        
+        async def produce():
+            if hasattr(chat_ids, "__aiter__"):
+                async for chat_id in chat_ids:
+                    yield chat_id
+            else:
+                for chat_id in chat_ids:
+                    yield chat_id
+        
+        try:
+            async for item in produce():
+                if stop_event.is_set():
+                    break
+                chat_id, item_text = item if isinstance(item, tuple) else (item, text)
+                tracker.dispatch(chat_id)
+                await queue.put((chat_id, item_text))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers + tickers:
+                task.cancel()
+            report.finished = time.monotonic()
+            report.stopped = stop_event.is_set()
+        
+        for callback in (on_checkpoint, on_progress):
+            if callback:
+                try:
+                    await callback(report)
+                except Exception as e:
+                    logger.warning(f"Ошибка обработчика рассылки: {e}")
+        
+        logger.info(
+            f"📤 Рассылка: отправлено {report.sent}, ошибок {report.failed}, "
+            f"{report.rate:.1f} сообщ./с, ошибки: {report.failures}"
+        )
+        return report
+
+class BroadcastWorker:
+    """
+    Фоновый исполнитель заданий рассылки.
+    Задания и их курсор хранятся в БД, поэтому после рестарта
+    прерванная рассылка продолжается с последнего сохранённого id.
+    """
+    
+    def __init__(self, bot: Bot, database: "AsyncDatabase"):
+        self.bot = bot
+        self.db = database
+        self._wakeup = asyncio.Event()
+        self._stop_job = asyncio.Event()
+        self._requested_status: Optional[str] = None
+        self._current_job_id: Optional[int] = None
+        self._failures: Dict[int, int] = {}
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+    
+    def wake(self):
+        """Проверить очередь заданий немедленно"""
+        self._wakeup.set()
+    
+    def status_of(self, job: BroadcastJob) -> str:
+        """Статус задания с учётом команды, которую текущая рассылка ещё не сохранила"""
+        if job.id == self._current_job_id and self._requested_status:
+            return self._requested_status
+        return job.status
+    
+    async def set_status(self, job_id: int, status: str):
+        """Поставить на паузу / отменить / возобновить задание"""
+        if job_id == self._current_job_id:
+            # Текущее задание сохранит статус само после остановки,
+            # иначе запись в БД будет перезаписана
+            if status in (JOB_PAUSED, JOB_CANCELLED):
+                self._requested_status = status
+                self._stop_job.set()
+            elif status == JOB_PENDING and self._requested_status == JOB_PAUSED:
+                # Возобновление до того, как пауза вступила в силу
+                self._requested_status = JOB_PENDING
+                self.wake()
+            return
+        await self.db.update_broadcast_job(job_id, status=status)
+        if status == JOB_PENDING:
+            self.wake()
+    
+    async def _update_progress_message(self, job: BroadcastJob, text: str, status: str):
+        if not job.progress_chat_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                text=f"📤 <b>Рассылка #{job.id}</b>\n\n{text}",
+                chat_id=job.progress_chat_id,
+                message_id=job.progress_message_id,
+                reply_markup=get_broadcast_job_keyboard(job.id, status)
+            )
+        except TelegramBadRequest:
+            pass  # Текст не изменился
+    
+    async def _run_job(self, job: BroadcastJob):
+        self._current_job_id = job.id
+        self._requested_status = None
+        self._stop_job.clear()
+        await self.db.update_broadcast_job(job.id, status=JOB_RUNNING)
+        logger.info(f"📤 Рассылка #{job.id}: старт с telegram_id > {job.cursor}")
+        
+        report = BroadcastReport(total=job.total, sent=job.sent, failed=job.failed, cursor=job.cursor)
+        
+        async def checkpoint(report: BroadcastReport):
+            if report.unreachable:
+                unreachable, report.unreachable = report.unreachable, []
+                await self.db.mark_unreachable(unreachable)
+            await self.db.update_broadcast_job(
+                job.id, cursor=report.cursor, sent=report.sent, failed=report.failed
+            )
+        
+        async def progress(report: BroadcastReport):
+            await self._update_progress_message(job, report.progress_text(), JOB_RUNNING)
+        
+        recipients = self.db.iter_users(
+            ("telegram_id", "language"), after_id=job.cursor, reachable_only=True, segment=job.segment
+        )
+        try:
+            report = await Broadcaster(self.bot).run(
+                (
+                    (user_dict['telegram_id'], job.text_for(user_dict['language']))
+                    async for user_dict in recipients
+                ),
+                job.text,
+                report=report,
+                on_progress=progress,
+                on_checkpoint=checkpoint,
+                stop_event=self._stop_job
+            )
+            
+            if not report.stopped:
+                status = JOB_DONE
+            else:
+                # Без явной команды (остановка бота) задание останется running и продолжится
+                status = self._requested_status or JOB_RUNNING
+            
+            updates = {"status": status}
+            if status in (JOB_DONE, JOB_CANCELLED):
+                updates["finished_at"] = datetime.now(timezone.utc)
+            await self.db.update_broadcast_job(job.id, **updates)
+        finally:
+            # Сбрасываем после записи статуса: до этого set_status только запоминает команду
+            self._current_job_id = None
+        
+        if status == JOB_DONE:
+            await self._update_progress_message(job, report.summary_text(), status)
+            await log_writer.add(LogEntry(
+                user_id=job.admin_id,
+                action="broadcast",
+                details=f"job={job.id}, success={report.sent}, fail={report.failed}, rate={report.rate:.1f}",
+                timestamp=datetime.now(timezone.utc)
+            ))
+        elif status != JOB_RUNNING:
+            await self._update_progress_message(
+                job, report.progress_text() + f"\n\n{BROADCAST_STATUS_LABELS[status]}", status
+            )
+    
+    async def _loop(self):
+        while not self._closing:
+            job = await self.db.get_next_broadcast_job()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), BROADCAST_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run_job(job)
+            except Exception as e:
+                failures = self._failures.get(job.id, 0) + 1
+                logger.error(
+                    f"Ошибка выполнения рассылки #{job.id} "
+                    f"(попытка {failures}/{BROADCAST_JOB_MAX_FAILURES}): {e}"
+                )
+                if failures < BROADCAST_JOB_MAX_FAILURES:
+                    self._failures[job.id] = failures
+                    await asyncio.sleep(BROADCAST_POLL_INTERVAL)
+                    continue
+                self._failures.pop(job.id, None)
+                try:
+                    await self._fail_job(job, e)
+                except Exception as fail_error:
+                    logger.error(f"Не удалось отметить рассылку #{job.id} как failed: {fail_error}")
+                    await asyncio.sleep(BROADCAST_POLL_INTERVAL)
+            else:
+                self._failures.pop(job.id, None)
+    
+    async def _fail_job(self, job: BroadcastJob, error: Exception):
+        """Снять задание с очереди после BROADCAST_JOB_MAX_FAILURES падений"""
+        await self.db.update_broadcast_job(
+            job.id, status=JOB_FAILED, finished_at=datetime.now(timezone.utc)
+        )
+        job = await self.db.get_broadcast_job(job.id) or job
+        await self._update_progress_message(
+            job,
+            f"📤 Отправка: {job.sent + job.failed}/{job.total} (ошибок: {job.failed})\n\n"
+            f"{BROADCAST_STATUS_LABELS[JOB_FAILED]}: {error}",
+            JOB_FAILED
+        )
+        await log_writer.add(LogEntry(
+            user_id=job.admin_id,
+            action="broadcast_failed",
+            details=f"job={job.id}, sent={job.sent}, failed={job.failed}, error={error}",
+            timestamp=datetime.now(timezone.utc)
+        ))
+    
+    def start(self):
+        """Запустить обработку очереди заданий"""
+        self._task = asyncio.create_task(self._loop())
+    
+    async def stop(self):
+        """Остановить текущую рассылку с сохранением курсора"""
+        self._closing = True
+        if self._current_job_id is not None:
+            self._stop_job.set()
+            # Даём рассылке дописать курсор
+            for _ in range(int(BROADCAST_CHECKPOINT_INTERVAL * 10) + 50):
+                if self._current_job_id is None:
+                    break
+                await asyncio.sleep(0.1)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
 # ════════════════════════════════════════════════════════════════
 # КЛАВИАТУРЫ
 # ════════════════════════════════════════════════════════════════
 
-def get_start_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+def _build_start_keyboard(lang: str) -> InlineKeyboardMarkup:
     """Клавиатура приветствия"""
     builder = InlineKeyboardBuilder()
     builder.button(
-        text=TEXTS[lang]["btn_policy"],
+        text=render_text(lang, "btn_policy"),
         callback_data=PolicyCallback(action="show")
     )
     builder.button(
-        text=TEXTS[lang]["btn_terms"],
+        text=render_text(lang, "btn_terms"),
         callback_data=TermsCallback(action="show")
     )
     builder.adjust(1)
     return builder.as_markup()
 
-def get_policy_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+def _build_policy_keyboard(lang: str) -> InlineKeyboardMarkup:
     """Клавиатура политики"""
     builder = InlineKeyboardBuilder()
     builder.button(
-        text=TEXTS[lang]["btn_accept"],
+        text=render_text(lang, "btn_accept"),
         callback_data=PolicyCallback(action="accept")
     )
     builder.button(
-        text=TEXTS[lang]["btn_decline"],
+        text=render_text(lang, "btn_decline"),
         callback_data=PolicyCallback(action="decline")
     )
     builder.button(
-        text=TEXTS[lang]["btn_back"],
+        text=render_text(lang, "btn_back"),
         callback_data=PolicyCallback(action="back")
     )
     builder.adjust(2, 1)
     return builder.as_markup()
 
-def get_terms_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+def _build_terms_keyboard(lang: str) -> InlineKeyboardMarkup:
     """Клавиатура условий"""
     builder = InlineKeyboardBuilder()
     builder.button(
-        text=TEXTS[lang]["btn_accept"],
+        text=render_text(lang, "btn_accept"),
         callback_data=TermsCallback(action="accept")
     )
     builder.button(
-        text=TEXTS[lang]["btn_decline"],
+        text=render_text(lang, "btn_decline"),
         callback_data=TermsCallback(action="decline")
     )
     builder.button(
-        text=TEXTS[lang]["btn_back"],
+        text=render_text(lang, "btn_back"),
         callback_data=TermsCallback(action="back")
     )
     builder.adjust(2, 1)
     return builder.as_markup()
 
-def get_age_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+def _build_age_keyboard(lang: str) -> InlineKeyboardMarkup:
     """Клавиатура подтверждения возраста"""
     builder = InlineKeyboardBuilder()
     builder.button(
-        text=TEXTS[lang]["btn_age_yes"],
+        text=render_text(lang, "btn_age_yes"),
         callback_data=AgeCallback(action="yes")
     )
     builder.button(
-        text=TEXTS[lang]["btn_age_no"],
+        text=render_text(lang, "btn_age_no"),
         callback_data=AgeCallback(action="no")
     )
     builder.adjust(1)
     return builder.as_markup()
 
-def get_phone_keyboard(lang: str = "ru") -> ReplyKeyboardMarkup:
+def _build_phone_keyboard(lang: str) -> ReplyKeyboardMarkup:
     """Клавиатура запроса телефона"""
     builder = ReplyKeyboardBuilder()
-    builder.button(text=TEXTS[lang]["btn_send_phone"], request_contact=True)
+    builder.button(text=render_text(lang, "btn_send_phone"), request_contact=True)
     builder.adjust(1)
     return builder.as_markup(resize_keyboard=True, one_time_keyboard=True)
 
-def get_main_menu_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+def _build_main_menu_keyboard(lang: str) -> InlineKeyboardMarkup:
     """Клавиатура главного меню"""
     builder = InlineKeyboardBuilder()
     builder.button(
-        text=TEXTS[lang]["btn_open_webapp"],
+        text=render_text(lang, "btn_open_webapp"),
         web_app=WebAppInfo(url=WEBAPP_LINK)
     )
     builder.button(
-        text=TEXTS[lang]["btn_profile"],
+        text=render_text(lang, "btn_profile"),
         callback_data=MainMenuCallback(action="profile")
     )
     builder.button(
-        text=TEXTS[lang]["btn_info"],
+        text=render_text(lang, "btn_info"),
         callback_data=MainMenuCallback(action="info")
     )
     builder.button(
-        text=TEXTS[lang]["btn_referral"],
+        text=render_text(lang, "btn_referral"),
         callback_data=MainMenuCallback(action="referral")
     )
     builder.button(
-        text=TEXTS[lang]["btn_language"],
+        text=render_text(lang, "btn_language"),
         callback_data=MainMenuCallback(action="language")
     )
     builder.adjust(1, 2, 2)
     return builder.as_markup()
 
-def get_language_keyboard() -> InlineKeyboardMarkup:
+def _build_language_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора языка"""
     builder = InlineKeyboardBuilder()
     builder.button(
@@ -1246,7 +2024,7 @@ def get_language_keyboard() -> InlineKeyboardMarkup:
     builder.adjust(2)
     return builder.as_markup()
 
-def get_admin_keyboard() -> InlineKeyboardMarkup:
+def _build_admin_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура админ-панели"""
     builder = InlineKeyboardBuilder()
     builder.button(
@@ -1265,51 +2043,315 @@ def get_admin_keyboard() -> InlineKeyboardMarkup:
         text="📥 Экспорт данных",
         callback_data=AdminCallback(action="export")
     )
-    builder.adjust(2, 2)
+    builder.button(
+        text="🎯 Рассылка по сегменту",
+        callback_data=AdminCallback(action="broadcast_segment")
+    )
+    builder.button(
+        text="📋 Рассылки",
+        callback_data=AdminCallback(action="broadcasts")
+    )
+    builder.button(
+        text="🏆 Топ пригласивших",
+        callback_data=AdminCallback(action="referrers")
+    )
+    builder.adjust(2, 2, 2, 1)
     return builder.as_markup()
 
-def get_delete_confirm_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+def _build_delete_confirm_keyboard(lang: str) -> InlineKeyboardMarkup:
     """Клавиатура подтверждения удаления"""
     builder = InlineKeyboardBuilder()
     builder.button(
-        text=TEXTS[lang]["btn_delete_confirm"],
+        text=render_text(lang, "btn_delete_confirm"),
         callback_data=MainMenuCallback(action="delete_confirm")
     )
     builder.button(
-        text=TEXTS[lang]["btn_cancel"],
+        text=render_text(lang, "btn_cancel"),
         callback_data=MainMenuCallback(action="delete_cancel")
     )
     builder.adjust(1)
     return builder.as_markup()
 
+# ─── Реестр ───
+# Разметка зависит только от языка: каждая клавиатура строится один раз
+# на язык и кэшируется. Модели aiogram изменяемы (MutableTelegramObject),
+# поэтому наружу отдаётся глубокая копия — правка результата вызывающим
+# не должна менять общий экземпляр
+
+KEYBOARD_BUILDERS: Dict[str, Callable[[str], Any]] = {
+    "start": _build_start_keyboard,
+    "policy": _build_policy_keyboard,
+    "terms": _build_terms_keyboard,
+    "age": _build_age_keyboard,
+    "phone": _build_phone_keyboard,
+    "main_menu": _build_main_menu_keyboard,
+    "delete_confirm": _build_delete_confirm_keyboard,
+}
+
+# Не зависят от языка — строятся один раз
+COMMON_KEYBOARD_BUILDERS: Dict[str, Callable[[], Any]] = {
+    "language": _build_language_keyboard,
+    "admin": _build_admin_keyboard,
+}
+
+_keyboards: Dict[Tuple[str, str], Any] = {}
+
+def build_keyboards() -> int:
+    """
+    Построить все клавиатуры для загруженных языков.
+    Вызывается при запуске и после перезагрузки текстов; возвращает число клавиатур.
+    """
+    keyboards = {
+        (name, lang): builder(lang)
+        for lang in loaded_languages()
+        for name, builder in KEYBOARD_BUILDERS.items()
+    }
+    for name, builder in COMMON_KEYBOARD_BUILDERS.items():
+        keyboards[(name, "")] = builder()
+    
+    global _keyboards
+    _keyboards = keyboards
+    return len(keyboards)
+
+def get_keyboard(name: str, lang: str = "") -> Any:
+    """Копия готовой клавиатуры по имени и языку (недостающая строится при первом обращении)"""
+    common = name in COMMON_KEYBOARD_BUILDERS
+    if common:
+        lang = ""
+    keyboard = _keyboards.get((name, lang))
+    if keyboard is None:
+        keyboard = COMMON_KEYBOARD_BUILDERS[name]() if common else KEYBOARD_BUILDERS[name](lang)
+        _keyboards[(name, lang)] = keyboard
+    return keyboard.model_copy(deep=True)
+
+def get_start_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+    return get_keyboard("start", lang)
+
+def get_policy_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+    return get_keyboard("policy", lang)
+
+def get_terms_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+    return get_keyboard("terms", lang)
+
+def get_age_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+    return get_keyboard("age", lang)
+
+def get_phone_keyboard(lang: str = "ru") -> ReplyKeyboardMarkup:
+    return get_keyboard("phone", lang)
+
+def get_main_menu_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+    return get_keyboard("main_menu", lang)
+
+def get_delete_confirm_keyboard(lang: str = "ru") -> InlineKeyboardMarkup:
+    return get_keyboard("delete_confirm", lang)
+
+def get_language_keyboard() -> InlineKeyboardMarkup:
+    return get_keyboard("language")
+
+def get_admin_keyboard() -> InlineKeyboardMarkup:
+    return get_keyboard("admin")
+
+# ─── Динамические ───
+
+def get_broadcast_job_keyboard(job_id: int, status: str) -> Optional[InlineKeyboardMarkup]:
+    """Клавиатура управления рассылкой"""
+    builder = InlineKeyboardBuilder()
+    if status in (JOB_PENDING, JOB_RUNNING):
+        builder.button(
+            text="⏸ Пауза",
+            callback_data=AdminCallback(action="job_pause", data=str(job_id))
+        )
+    elif status == JOB_PAUSED:
+        builder.button(
+            text="▶️ Продолжить",
+            callback_data=AdminCallback(action="job_resume", data=str(job_id))
+        )
+    else:
+        return None
+    builder.button(
+        text="⏹ Отменить",
+        callback_data=AdminCallback(action="job_cancel", data=str(job_id))
+    )
+    builder.adjust(2)
+    return builder.as_markup()
+
+# ════════════════════════════════════════════════════════════════
+# ДОКУМЕНТЫ
+# ════════════════════════════════════════════════════════════════
+
+# Документы: имя → ключи заголовка и текста
+DOCUMENTS = {
+    "policy": ("policy_title", "policy_text"),
+    "terms": ("terms_title", "terms_text"),
+}
+
+_HTML_TOKEN = re.compile(r"<[^>]+>|[^<\s]+|\s+")
+_HTML_MARKUP = re.compile(r"<[^>]+>")
+_HTML_TAG = re.compile(r"<(/?)([a-zA-Z-]+)")
+
+def utf16_len(text: str) -> int:
+    """Длина в единицах UTF-16 — так Telegram считает лимиты"""
+    return len(text.encode("utf-16-le")) // 2
+
+def split_html(text: str, limit: int = MESSAGE_LIMIT) -> Tuple[str, ...]:
+    """
+    Разбить HTML-текст на части не длиннее limit (UTF-16).
+    Режем по абзацам, при необходимости — по словам; теги, открытые
+    на границе части, закрываются в ней и открываются заново в следующей.
+    Тег, который не помещается в часть, отбрасывается вместе с закрытием:
+    текст сохраняется, пропадает только разметка.
+    """
+    if limit < 2:
+        raise ValueError("Часть должна вмещать хотя бы один символ")
+    
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    open_tags: List[Tuple[str, str]] = []  # (имя, открывающий тег)
+    dropped: List[str] = []  # Отброшенные теги: их закрытия пропускаются
+    
+    def closing() -> str:
+        return "".join(f"</{name}>" for name, _ in reversed(open_tags))
+    
+    def reopen():
+        nonlocal current, current_len
+        current = [tag for _, tag in open_tags]
+        current_len = sum(utf16_len(tag) for tag in current)
+    
+    def flush():
+        chunk = "".join(current).strip()
+        # Часть из одной разметки не отправляем
+        if _HTML_MARKUP.sub("", chunk).strip():
+            chunks.append(chunk + closing())
+        reopen()
+    
+    def make_room(need: int):
+        """Освободить в новой части need единиц, отказываясь от переоткрытия внутренних тегов"""
+        while open_tags and limit - current_len - utf16_len(closing()) < need:
+            dropped.append(open_tags.pop()[0])
+            reopen()
+    
+    def add(token: str):
+        nonlocal current_len
+        size = utf16_len(token)
+        tag = _HTML_TAG.match(token)
+        name = tag.group(2).lower() if tag else ""
+        opening = bool(tag) and not tag.group(1)
+        closes = bool(tag) and not opening and bool(open_tags) and open_tags[-1][0] == name
+        if tag and not opening and not closes and name in dropped:
+            dropped.remove(name)
+            return
+        # Открывающему тегу нужно место и под его закрытие,
+        # закрывающий уже учтён в closing()
+        reserve = utf16_len(f"</{name}>") if opening else 0
+        if opening and size + reserve > limit:
+            dropped.append(name)
+            return
+        if not closes and current_len + size + reserve + utf16_len(closing()) > limit:
+            if token.isspace():
+                return  # Пробелы на границе частей не нужны
+            flush()
+            # Тег переносится целиком; слову — хотя бы половина части,
+            # иначе переоткрытые теги разрежут его на обрывки
+            make_room(size + reserve if tag else min(size, max(2, limit // 2)))
+            # Слово длиннее целой части режется посимвольно
+            room = limit - current_len - utf16_len(closing())
+            while not tag and size > room:
+                head = token[:room]
+                while utf16_len(head) > room:
+                    head = head[:-1]
+                current.append(head)
+                flush()
+                token = token[len(head):]
+                size = utf16_len(token)
+        current.append(token)
+        current_len += size
+        
+        if opening:
+            open_tags.append((name, token))
+        elif closes:
+            open_tags.pop()
+    
+    for paragraph in re.split(r"(?<=\n\n)", text):
+        # Абзац, который целиком влезет в новую часть, не разрываем
+        size = utf16_len(paragraph)
+        if current_len + size > limit and size <= limit // 2:
+            flush()
+        for token in _HTML_TOKEN.findall(paragraph):
+            add(token)
+    flush()
+    return tuple(chunks)
+
+_documents: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+
+def build_documents() -> int:
+    """
+    Разбить все документы всех языков на сообщения.
+    Вызывается при запуске и после перезагрузки текстов; возвращает число частей.
+    """
+    documents = {
+        (name, lang): split_html(render_text(lang, title) + render_text(lang, body))
+        for lang in loaded_languages()
+        for name, (title, body) in DOCUMENTS.items()
+    }
+    
+    global _documents
+    _documents = documents
+    return sum(len(parts) for parts in documents.values())
+
+def get_document(name: str, lang: str) -> Tuple[str, ...]:
+    """Готовые части документа (недостающий язык разбивается при первом обращении)"""
+    parts = _documents.get((name, lang))
+    if parts is None:
+        title, body = DOCUMENTS[name]
+        parts = _documents[(name, lang)] = split_html(render_text(lang, title) + render_text(lang, body))
+    return parts
+
+async def show_document(callback: CallbackQuery, name: str, lang: str, keyboard: InlineKeyboardMarkup):
+    """Показать документ: одна часть — правкой сообщения, несколько — новыми сообщениями"""
+    parts = get_document(name, lang)
+    if len(parts) == 1:
+        await callback.message.edit_text(parts[0], reply_markup=keyboard, parse_mode="HTML")
+        return
+    
+    for part in parts[:-1]:
+        await callback.message.answer(part, parse_mode="HTML")
+    # Последняя часть — с кнопками
+    await callback.message.answer(parts[-1], reply_markup=keyboard, parse_mode="HTML")
+    await callback.message.delete()
+
 # ════════════════════════════════════════════════════════════════
 # ХЭНДЛЕРЫ
 # ════════════════════════════════════════════════════════════════
 
 # Инициализация
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
-db = Database(DB_PATH)
+db = AsyncDatabase(Database(DB_PATH))
+fsm_storage = SQLiteStorage(db)
+dp = Dispatcher(storage=fsm_storage)
+rate_limiter = RateLimiter()
+log_writer = LogWriter()
+broadcast_worker = BroadcastWorker(bot, db)
 router = Router()
 
 async def check_rate_limit_middleware(handler, event, data):
     """Middleware для проверки рейт-лимитов"""
     if isinstance(event, Message):
         user_id = event.from_user.id
-        allowed, seconds = db.check_rate_limit(user_id)
+        allowed, seconds = rate_limiter.check(user_id)
         
         if not allowed:
-            user = db.get_user(user_id)
+            user = await db.get_user(user_id)
             lang = user.language if user else "ru"
             
             if seconds > 3600:  # Флуд-блокировка
                 minutes = seconds // 60
                 await event.answer(
-                    TEXTS[lang]["flood_blocked"].format(minutes=minutes)
+                    render_text(lang, "flood_blocked", minutes=minutes)
                 )
             else:  # Обычное превышение лимита
                 await event.answer(
-                    TEXTS[lang]["rate_limit_warning"].format(seconds=seconds)
+                    render_text(lang, "rate_limit_warning", seconds=seconds)
                 )
             return
     
@@ -1324,14 +2366,15 @@ async def cmd_start(message: Message, state: FSMContext, command: Command = None
     lang = "ru" if user_lang and user_lang.startswith("ru") else "en"
     
     # Проверяем, зарегистрирован ли пользователь
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     if user:
-        # Обновляем последнюю активность
-        db.update_user(
-            user_id,
-            last_activity=datetime.now(timezone.utc).isoformat()
-        )
+        # Обновляем последнюю активность; доступность для рассылок — только если
+        # она изменилась, чтобы не запускать триггер rollup-таблиц на каждый /start
+        updates = {"last_activity": datetime.now(timezone.utc)}
+        if not user.is_reachable:
+            updates.update(is_reachable=True, unreachable_since=None)
+        await db.update_user(user_id, **updates)
         
         # Проверяем блокировку
         if user.is_blocked:
@@ -1341,12 +2384,12 @@ async def cmd_start(message: Message, state: FSMContext, command: Command = None
         # Пользователь уже зарегистрирован — показываем главное меню
         lang = user.language
         await message.answer(
-            TEXTS[lang]["registration_success"],
+            render_text(lang, "registration_success"),
             reply_markup=get_main_menu_keyboard(lang)
         )
         
         # Логируем
-        db.add_log(LogEntry(
+        await log_writer.add(LogEntry(
             user_id=user_id,
             action="start_existing",
             details=None,
@@ -1358,7 +2401,7 @@ async def cmd_start(message: Message, state: FSMContext, command: Command = None
         if command and command.args:
             try:
                 referred_by = int(command.args)
-                if not db.get_user(referred_by):
+                if not await db.get_user(referred_by):
                     referred_by = None
             except ValueError:
                 pass
@@ -1378,12 +2421,12 @@ async def cmd_start(message: Message, state: FSMContext, command: Command = None
         
         # Показываем приветствие
         await message.answer(
-            TEXTS[lang]["start_welcome"],
+            render_text(lang, "start_welcome"),
             reply_markup=get_start_keyboard(lang)
         )
         
         # Логируем
-        db.add_log(LogEntry(
+        await log_writer.add(LogEntry(
             user_id=user_id,
             action="start_new",
             details=f"referred_by={referred_by}",
@@ -1402,28 +2445,7 @@ async def show_policy(callback: CallbackQuery, callback_data: PolicyCallback, st
         return
     
     lang = user_dict.get("language", "ru")
-    
-    # Разбиваем текст на части (Telegram лимит 4096 символов)
-    policy_text = TEXTS[lang]["policy_title"] + TEXTS[lang]["policy_text"]
-    
-    if len(policy_text) > 4096:
-        # Отправляем частями
-        parts = [policy_text[i:i+4000] for i in range(0, len(policy_text), 4000)]
-        for i, part in enumerate(parts):
-            if i == len(parts) - 1:  # Последняя часть — с кнопками
-                await callback.message.answer(
-                    part,
-                    reply_markup=get_policy_keyboard(lang)
-                )
-            else:
-                await callback.message.answer(part)
-        await callback.message.delete()
-    else:
-        await callback.message.edit_text(
-            policy_text,
-            reply_markup=get_policy_keyboard(lang)
-        )
-    
+    await show_document(callback, "policy", lang, get_policy_keyboard(lang))
     await callback.answer()
 
 @router.callback_query(PolicyCallback.filter(F.action == "accept"))
@@ -1443,7 +2465,7 @@ async def accept_policy(callback: CallbackQuery, callback_data: PolicyCallback,
     await state.update_data(user=user_dict)
     
     await callback.message.edit_text(
-        TEXTS[lang]["policy_accepted"] + "\n\n" + TEXTS[lang]["start_welcome"],
+        render_text(lang, "policy_accepted") + "\n\n" + render_text(lang, "start_welcome"),
         reply_markup=get_start_keyboard(lang)
     )
     await callback.answer()
@@ -1455,7 +2477,7 @@ async def decline_policy(callback: CallbackQuery, callback_data: PolicyCallback,
     user_dict = data.get("user")
     lang = user_dict.get("language", "ru") if user_dict else "ru"
     
-    await callback.message.edit_text(TEXTS[lang]["declined_message"])
+    await callback.message.edit_text(render_text(lang, "declined_message"))
     await state.clear()
     await callback.answer()
 
@@ -1467,7 +2489,7 @@ async def policy_back(callback: CallbackQuery, callback_data: PolicyCallback, st
     lang = user_dict.get("language", "ru") if user_dict else "ru"
     
     await callback.message.edit_text(
-        TEXTS[lang]["start_welcome"],
+        render_text(lang, "start_welcome"),
         reply_markup=get_start_keyboard(lang)
     )
     await callback.answer()
@@ -1483,27 +2505,7 @@ async def show_terms(callback: CallbackQuery, callback_data: TermsCallback, stat
         return
     
     lang = user_dict.get("language", "ru")
-    
-    # Разбиваем текст на части
-    terms_text = TEXTS[lang]["terms_title"] + TEXTS[lang]["terms_text"]
-    
-    if len(terms_text) > 4096:
-        parts = [terms_text[i:i+4000] for i in range(0, len(terms_text), 4000)]
-        for i, part in enumerate(parts):
-            if i == len(parts) - 1:
-                await callback.message.answer(
-                    part,
-                    reply_markup=get_terms_keyboard(lang)
-                )
-            else:
-                await callback.message.answer(part)
-        await callback.message.delete()
-    else:
-        await callback.message.edit_text(
-            terms_text,
-            reply_markup=get_terms_keyboard(lang)
-        )
-    
+    await show_document(callback, "terms", lang, get_terms_keyboard(lang))
     await callback.answer()
 
 @router.callback_query(TermsCallback.filter(F.action == "accept"))
@@ -1526,12 +2528,12 @@ async def accept_terms(callback: CallbackQuery, callback_data: TermsCallback, st
     if user_dict.get("policy_accepted") and user_dict.get("terms_accepted"):
         # Переходим к подтверждению возраста
         await callback.message.edit_text(
-            TEXTS[lang]["age_verification"],
+            render_text(lang, "age_verification"),
             reply_markup=get_age_keyboard(lang)
         )
     else:
         await callback.message.edit_text(
-            TEXTS[lang]["terms_accepted"] + "\n\n" + TEXTS[lang]["start_welcome"],
+            render_text(lang, "terms_accepted") + "\n\n" + render_text(lang, "start_welcome"),
             reply_markup=get_start_keyboard(lang)
         )
     
@@ -1544,7 +2546,7 @@ async def decline_terms(callback: CallbackQuery, callback_data: TermsCallback, s
     user_dict = data.get("user")
     lang = user_dict.get("language", "ru") if user_dict else "ru"
     
-    await callback.message.edit_text(TEXTS[lang]["declined_message"])
+    await callback.message.edit_text(render_text(lang, "declined_message"))
     await state.clear()
     await callback.answer()
 
@@ -1556,7 +2558,7 @@ async def terms_back(callback: CallbackQuery, callback_data: TermsCallback, stat
     lang = user_dict.get("language", "ru") if user_dict else "ru"
     
     await callback.message.edit_text(
-        TEXTS[lang]["start_welcome"],
+        render_text(lang, "start_welcome"),
         reply_markup=get_start_keyboard(lang)
     )
     await callback.answer()
@@ -1578,9 +2580,9 @@ async def age_confirmed(callback: CallbackQuery, callback_data: AgeCallback, sta
     await state.update_data(user=user_dict)
     
     # Переходим к регистрации телефона
-    await callback.message.edit_text(TEXTS[lang]["age_confirmed"])
+    await callback.message.edit_text(render_text(lang, "age_confirmed"))
     await callback.message.answer(
-        TEXTS[lang]["registration_phone"],
+        render_text(lang, "registration_phone"),
         reply_markup=get_phone_keyboard(lang)
     )
     await state.set_state(RegistrationStates.waiting_for_phone)
@@ -1605,15 +2607,15 @@ async def age_declined(callback: CallbackQuery, callback_data: AgeCallback, stat
         registration_date=datetime.now(timezone.utc),
         is_blocked=True
     )
-    db.add_user(blocked_user)
-    db.update_user(
+    await db.add_user(blocked_user)
+    await db.update_user(
         user_id,
         is_blocked=True,
         block_reason="age_under_18",
-        block_date=datetime.now(timezone.utc).isoformat()
+        block_date=datetime.now(timezone.utc)
     )
     
-    await callback.message.edit_text(TEXTS[lang]["age_declined"])
+    await callback.message.edit_text(render_text(lang, "age_declined"))
     await state.clear()
     await callback.answer()
 
@@ -1639,18 +2641,19 @@ async def phone_received(message: Message, state: FSMContext):
     lang = user_dict.get("language", "ru")
     
     # Проверяем, не зарегистрирован ли этот номер
-    existing_id = db.check_phone_exists(phone)
+    existing_id = await db.check_phone_exists(phone)
     if existing_id and existing_id != user_id:
         # Мультиаккаунт!
         await message.answer(
-            TEXTS[lang]["duplicate_phone_error"],
+            render_text(lang, "duplicate_phone_error"),
             reply_markup=ReplyKeyboardRemove()
         )
         
         # Уведомляем админа
         await bot.send_message(
             ADMIN_ID,
-            TEXTS[lang]["admin_duplicate_attempt"].format(
+            render_text(
+                lang, "admin_duplicate_attempt",
                 new_id=user_id,
                 phone=phone,
                 existing_id=existing_id,
@@ -1659,7 +2662,7 @@ async def phone_received(message: Message, state: FSMContext):
         )
         
         # Логируем
-        db.add_log(LogEntry(
+        await log_writer.add(LogEntry(
             user_id=user_id,
             action="duplicate_phone_attempt",
             details=f"phone={phone}, existing_id={existing_id}",
@@ -1677,7 +2680,7 @@ async def phone_received(message: Message, state: FSMContext):
         username=user_dict.get("username"),
         phone=phone,
         language=lang,
-        registration_date=datetime.fromisoformat(user_dict["registration_date"]),
+        registration_date=from_epoch(user_dict["registration_date"]),
         policy_accepted=True,
         terms_accepted=True,
         age_confirmed=True,
@@ -1685,25 +2688,24 @@ async def phone_received(message: Message, state: FSMContext):
         referred_by=user_dict.get("referred_by")
     )
     
-    success = db.add_user(user)
+    success = await db.add_user(user)
     
     if success:
         # Обновляем timestamps
-        db.update_user(
+        await db.update_user(
             user_id,
-            policy_accepted_date=datetime.now(timezone.utc).isoformat(),
-            terms_accepted_date=datetime.now(timezone.utc).isoformat(),
-            age_confirmed_date=datetime.now(timezone.utc).isoformat()
+            policy_accepted_date=datetime.now(timezone.utc),
+            terms_accepted_date=datetime.now(timezone.utc),
+            age_confirmed_date=datetime.now(timezone.utc)
         )
         
         # Бейдж "Первопроходец" (если входит в первые 100)
-        stats = db.get_statistics()
-        if stats["total"] <= 100:
-            db.add_badge(user_id, "pioneer")
+        if await db.count_registered() <= 100:
+            await db.add_badge(user_id, "pioneer")
         
         # Отправляем приветствие
         await message.answer(
-            TEXTS[lang]["registration_success"],
+            render_text(lang, "registration_success"),
             reply_markup=ReplyKeyboardRemove()
         )
         await message.answer(
@@ -1714,7 +2716,8 @@ async def phone_received(message: Message, state: FSMContext):
         # Уведомляем админа
         await bot.send_message(
             ADMIN_ID,
-            TEXTS[lang]["admin_new_user"].format(
+            render_text(
+                lang, "admin_new_user",
                 telegram_id=user_id,
                 username=user.username or "N/A",
                 phone=phone,
@@ -1724,7 +2727,7 @@ async def phone_received(message: Message, state: FSMContext):
         )
         
         # Логируем
-        db.add_log(LogEntry(
+        await log_writer.add(LogEntry(
             user_id=user_id,
             action="registration_complete",
             details=f"phone={phone}",
@@ -1739,7 +2742,7 @@ async def phone_received(message: Message, state: FSMContext):
 async def show_profile(callback: CallbackQuery):
     """Показать профиль"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     if not user:
         await callback.answer("❌ Ошибка: пользователь не найден", show_alert=True)
@@ -1748,7 +2751,7 @@ async def show_profile(callback: CallbackQuery):
     lang = user.language
     
     # Получаем бейджи
-    badges = db.get_user_badges(user_id)
+    badges = await db.get_user_badges(user_id)
     badge_emojis = {
         "pioneer": "🌟 Первопроходец",
         "active": "🎯 Активист",
@@ -1764,7 +2767,8 @@ async def show_profile(callback: CallbackQuery):
     else:
         status = "✅ Активен"
     
-    profile_text = TEXTS[lang]["profile_text"].format(
+    profile_text = render_text(
+        lang, "profile_text",
         telegram_id=user.telegram_id,
         username=user.username or "N/A",
         phone=user.phone or "N/A",
@@ -1781,7 +2785,7 @@ async def show_profile(callback: CallbackQuery):
 async def show_info(callback: CallbackQuery):
     """Показать информацию"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     if not user:
         await callback.answer("❌ Ошибка: пользователь не найден", show_alert=True)
@@ -1789,7 +2793,8 @@ async def show_info(callback: CallbackQuery):
     
     lang = user.language
     
-    info_text = TEXTS[lang]["info_text"].format(
+    info_text = render_text(
+        lang, "info_text",
         bot_link=BOT_LINK,
         webapp_link=WEBAPP_LINK
     )
@@ -1801,7 +2806,7 @@ async def show_info(callback: CallbackQuery):
 async def show_referral(callback: CallbackQuery):
     """Показать реферальную ссылку"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     if not user:
         await callback.answer("❌ Ошибка: пользователь не найден", show_alert=True)
@@ -1810,13 +2815,14 @@ async def show_referral(callback: CallbackQuery):
     lang = user.language
     
     referral_link = f"{BOT_LINK}?start={user_id}"
-    referrals_count = db.get_referral_count(user_id)
+    referrals_count = await db.get_referral_count(user_id)
     
     # Проверяем бейджи
     if referrals_count >= 5:
-        db.add_badge(user_id, "referrer")
+        await db.add_badge(user_id, "referrer")
     
-    referral_text = TEXTS[lang]["referral_text"].format(
+    referral_text = render_text(
+        lang, "referral_text",
         referral_link=referral_link,
         referrals_count=referrals_count
     )
@@ -1839,10 +2845,11 @@ async def change_language(callback: CallbackQuery, callback_data: LanguageCallba
     user_id = callback.from_user.id
     new_lang = callback_data.code
     
-    db.update_user(user_id, language=new_lang)
+    await db.update_user(user_id, language=new_lang)
     
     await callback.message.edit_text(
-        TEXTS[new_lang]["language_changed"].format(
+        render_text(
+            new_lang, "language_changed",
             language="🇷🇺 Русский" if new_lang == "ru" else "🇬🇧 English"
         )
     )
@@ -1858,7 +2865,7 @@ async def change_language(callback: CallbackQuery, callback_data: LanguageCallba
 async def cmd_profile(message: Message):
     """Команда /profile"""
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     if not user:
         await message.answer("❌ Вы не зарегистрированы. Напишите /start")
@@ -1866,7 +2873,7 @@ async def cmd_profile(message: Message):
     
     lang = user.language
     
-    badges = db.get_user_badges(user_id)
+    badges = await db.get_user_badges(user_id)
     badge_emojis = {
         "pioneer": "🌟 Первопроходец",
         "active": "🎯 Активист",
@@ -1876,7 +2883,8 @@ async def cmd_profile(message: Message):
     
     status = "👑 Администратор" if user.is_admin else ("✅ Активен" if not user.is_blocked else "🚫 Заблокирован")
     
-    profile_text = TEXTS[lang]["profile_text"].format(
+    profile_text = render_text(
+        lang, "profile_text",
         telegram_id=user.telegram_id,
         username=user.username or "N/A",
         phone=user.phone or "N/A",
@@ -1892,7 +2900,7 @@ async def cmd_profile(message: Message):
 async def cmd_referral(message: Message):
     """Команда /referral"""
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     if not user:
         await message.answer("❌ Вы не зарегистрированы. Напишите /start")
@@ -1901,9 +2909,10 @@ async def cmd_referral(message: Message):
     lang = user.language
     
     referral_link = f"{BOT_LINK}?start={user_id}"
-    referrals_count = db.get_referral_count(user_id)
+    referrals_count = await db.get_referral_count(user_id)
     
-    referral_text = TEXTS[lang]["referral_text"].format(
+    referral_text = render_text(
+        lang, "referral_text",
         referral_link=referral_link,
         referrals_count=referrals_count
     )
@@ -1914,7 +2923,7 @@ async def cmd_referral(message: Message):
 async def cmd_export_data(message: Message):
     """Команда /export_my_data"""
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     if not user:
         await message.answer("❌ Вы не зарегистрированы. Напишите /start")
@@ -1922,7 +2931,7 @@ async def cmd_export_data(message: Message):
     
     lang = user.language
     
-    await message.answer(TEXTS[lang]["export_data_text"])
+    await message.answer(render_text(lang, "export_data_text"))
     
     # Собираем данные
     user_data = {
@@ -1936,9 +2945,9 @@ async def cmd_export_data(message: Message):
         "age_confirmed": user.age_confirmed,
         "is_blocked": user.is_blocked,
         "referred_by": user.referred_by,
-        "referrals_count": db.get_referral_count(user_id),
-        "badges": db.get_user_badges(user_id),
-        "webapp_opens": db.get_webapp_opens(user_id)
+        "referrals_count": await db.get_referral_count(user_id),
+        "badges": await db.get_user_badges(user_id),
+        "webapp_opens": await db.get_webapp_opens(user_id)
     }
     
     # Создаём JSON
@@ -1955,7 +2964,7 @@ async def cmd_export_data(message: Message):
     await message.answer_document(document)
     
     # Логируем
-    db.add_log(LogEntry(
+    await log_writer.add(LogEntry(
         user_id=user_id,
         action="export_data",
         details=None,
@@ -1966,7 +2975,7 @@ async def cmd_export_data(message: Message):
 async def cmd_delete_account(message: Message):
     """Команда /delete_account"""
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     if not user:
         await message.answer("❌ Вы не зарегистрированы. Напишите /start")
@@ -1975,7 +2984,7 @@ async def cmd_delete_account(message: Message):
     lang = user.language
     
     await message.answer(
-        TEXTS[lang]["delete_account_confirm"],
+        render_text(lang, "delete_account_confirm"),
         reply_markup=get_delete_confirm_keyboard(lang)
     )
 
@@ -1983,7 +2992,7 @@ async def cmd_delete_account(message: Message):
 async def delete_account_confirmed(callback: CallbackQuery):
     """Подтверждение удаления аккаунта"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     if not user:
         await callback.answer("❌ Ошибка", show_alert=True)
@@ -1993,22 +3002,23 @@ async def delete_account_confirmed(callback: CallbackQuery):
     
     # Планируем удаление через 7 дней
     deletion_date = datetime.now(timezone.utc) + timedelta(days=7)
-    db.update_user(
+    await db.update_user(
         user_id,
-        deletion_scheduled=deletion_date.isoformat(),
+        deletion_scheduled=deletion_date,
         is_blocked=True,
         block_reason="deletion_scheduled"
     )
     
     await callback.message.edit_text(
-        TEXTS[lang]["delete_account_scheduled"].format(
+        render_text(
+            lang, "delete_account_scheduled",
             deletion_date=deletion_date.strftime("%Y-%m-%d %H:%M UTC")
         )
     )
     await callback.answer()
     
     # Логируем
-    db.add_log(LogEntry(
+    await log_writer.add(LogEntry(
         user_id=user_id,
         action="deletion_scheduled",
         details=f"date={deletion_date.isoformat()}",
@@ -2047,6 +3057,26 @@ async def cmd_admin(message: Message):
         reply_markup=get_admin_keyboard()
     )
 
+@router.message(Command("reload_texts"))
+async def cmd_reload_texts(message: Message):
+    """Перечитать тексты из locales/ и пересобрать клавиатуры и документы"""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("🚫 У вас нет доступа.")
+        return
+
+    try:
+        languages = reload_texts()
+    except (OSError, ValueError) as e:
+        await message.answer(f"❌ Тексты не перезагружены: {e}")
+        return
+
+    keyboards = build_keyboards()
+    documents = build_documents()
+    await message.answer(
+        f"✅ Тексты перезагружены: {', '.join(languages)}\n"
+        f"Клавиатур: {keyboards}, частей документов: {documents}"
+    )
+
 @router.callback_query(AdminCallback.filter(F.action == "stats"))
 async def admin_stats(callback: CallbackQuery):
     """Статистика"""
@@ -2054,13 +3084,17 @@ async def admin_stats(callback: CallbackQuery):
         await callback.answer("🚫 Доступ запрещён", show_alert=True)
         return
     
-    stats = db.get_statistics()
+    stats = await db.get_statistics()
+    cache = db.users.stats()
     
     stats_text = (
         "📈 <b>СТАТИСТИКА</b>\n\n"
         f"👥 Всего пользователей: {stats['total']}\n"
         f"📅 Сегодня: {stats['today']}\n"
-        f"📆 За неделю: {stats['week']}"
+        f"📆 За неделю: {stats['week']}\n"
+        f"📵 Недоступны для рассылок: {stats['unreachable']}\n\n"
+        f"🗄 Кэш пользователей: {cache['size']} "
+        f"(попаданий {cache['hit_rate']:.0%}, {cache['hits']}/{cache['hits'] + cache['misses']})"
     )
     
     await callback.message.answer(stats_text)
@@ -2073,97 +3107,222 @@ async def admin_broadcast_start(callback: CallbackQuery, state: FSMContext):
         await callback.answer("🚫 Доступ запрещён", show_alert=True)
         return
     
+    await state.update_data(segment=None)
     await callback.message.answer(
-        "✉️ <b>РАССЫЛКА</b>\n\nОтправьте текст сообщения для рассылки всем пользователям:"
+        "✉️ <b>РАССЫЛКА</b>\n\nОтправьте текст сообщения для рассылки всем пользователям.\n\n"
+        + BROADCAST_VARIANTS_HELP
     )
     await state.set_state(AdminStates.waiting_for_broadcast_text)
     await callback.answer()
 
+@router.callback_query(AdminCallback.filter(F.action == "broadcast_segment"))
+async def admin_broadcast_segment_start(callback: CallbackQuery, state: FSMContext):
+    """Начать рассылку по сегменту"""
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("🚫 Доступ запрещён", show_alert=True)
+        return
+    
+    await callback.message.answer(
+        "🎯 <b>РАССЫЛКА ПО СЕГМЕНТУ</b>\n\n"
+        "Отправьте фильтры через пробел:\n"
+        "<code>lang=ru</code> — язык пользователя\n"
+        "<code>registered=2026-01-01..2026-02-01</code> — дата регистрации (границы можно опустить)\n"
+        "<code>active=7</code> — активны за последние N дней\n"
+        "<code>referred=yes</code> / <code>referred=no</code> — пришли по рефералке\n"
+        "<code>badge=pioneer</code> — есть бейдж\n\n"
+        "<code>all</code> — без фильтров"
+    )
+    await state.set_state(AdminStates.waiting_for_broadcast_target)
+    await callback.answer()
+
+@router.message(AdminStates.waiting_for_broadcast_target)
+async def admin_broadcast_segment_set(message: Message, state: FSMContext):
+    """Задать сегмент рассылки"""
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    try:
+        segment = BroadcastSegment.parse(message.text or "")
+    except ValueError as e:
+        await message.answer(f"❌ Неверный сегмент: {e}\n\nПопробуйте ещё раз:")
+        return
+    
+    total = await db.count_users(reachable_only=True, segment=segment)
+    await state.update_data(segment=segment.to_json())
+    await message.answer(
+        f"🎯 Сегмент: {segment.describe()}\n"
+        f"👥 Получателей: {total}\n\n"
+        "Отправьте текст сообщения для рассылки.\n\n"
+        + BROADCAST_VARIANTS_HELP
+    )
+    await state.set_state(AdminStates.waiting_for_broadcast_text)
+
 @router.message(AdminStates.waiting_for_broadcast_text)
 async def admin_broadcast_execute(message: Message, state: FSMContext):
     """Выполнить рассылку"""
     if message.from_user.id != ADMIN_ID:
         return
     
-    text = message.text
-    users = db.get_all_users()
-    
-    success_count = 0
-    fail_count = 0
-    
-    progress_message = await message.answer(f"📤 Отправка: 0/{len(users)}")
+    data = await state.get_data()
+    segment = BroadcastSegment.from_json(data.get("segment"))
+    text, variants = parse_broadcast_variants(message.text or "")
+    if not text:
+        await message.answer("❌ Пустой текст рассылки. Отправьте текст ещё раз:")
+        return
     
-    for i, user_dict in enumerate(users):
-        try:
-            await bot.send_message(user_dict['telegram_id'], text)
-            success_count += 1
-        except Exception as e:
-            logger.error(f"Ошибка отправки пользователю {user_dict['telegram_id']}: {e}")
-            fail_count += 1
-        
-        # Обновляем прогресс каждые 10 пользователей
-        if (i + 1) % 10 == 0 or (i + 1) == len(users):
-            await progress_message.edit_text(
-                f"📤 Отправка: {i + 1}/{len(users)}"
-            )
-        
-        # Пауза, чтобы не словить лимиты
-        await asyncio.sleep(0.05)
+    total = await db.count_users(reachable_only=True, segment=segment)
     
-    await message.answer(
-        f"✅ Рассылка завершена!\n\n"
-        f"Успешно: {success_count}\n"
-        f"Ошибок: {fail_count}"
+    job_id = await db.create_broadcast_job(message.from_user.id, text, total, segment, variants)
+    target = f"\nСегмент: {segment.describe()}" if segment else ""
+    languages = f"\nВарианты: {', '.join(sorted(variants))}" if variants else ""
+    progress_message = await message.answer(
+        f"📤 <b>Рассылка #{job_id}</b>\n\n"
+        f"{BROADCAST_STATUS_LABELS[JOB_PENDING]}\nПолучателей: {total}{target}{languages}",
+        reply_markup=get_broadcast_job_keyboard(job_id, JOB_PENDING)
     )
-    
-    # Логируем
-    db.add_log(LogEntry(
-        user_id=message.from_user.id,
-        action="broadcast",
-        details=f"success={success_count}, fail={fail_count}",
-        timestamp=datetime.now(timezone.utc)
-    ))
+    await db.update_broadcast_job(
+        job_id,
+        progress_chat_id=progress_message.chat.id,
+        progress_message_id=progress_message.message_id
+    )
+    broadcast_worker.wake()
     
     await state.clear()
 
-@router.callback_query(AdminCallback.filter(F.action == "export"))
-async def admin_export(callback: CallbackQuery):
-    """Экспорт данных"""
+@router.callback_query(AdminCallback.filter(F.action == "broadcasts"))
+async def admin_broadcasts(callback: CallbackQuery):
+    """Список последних рассылок"""
     if callback.from_user.id != ADMIN_ID:
         await callback.answer("🚫 Доступ запрещён", show_alert=True)
         return
     
-    await callback.message.answer("📥 Экспортирую данные...")
+    jobs = await db.get_recent_broadcast_jobs()
+    if not jobs:
+        await callback.message.answer("📋 Рассылок пока не было.")
+        await callback.answer()
+        return
     
-    users = db.get_all_users()
+    lines = ["📋 <b>ПОСЛЕДНИЕ РАССЫЛКИ</b>\n"]
+    for job in jobs:
+        lines.append(
+            f"#{job.id} • {BROADCAST_STATUS_LABELS.get(job.status, job.status)} • "
+            f"{job.sent + job.failed}/{job.total} (ошибок: {job.failed})"
+        )
     
-    # Создаём CSV
-    import csv
-    from io import StringIO
+    await callback.message.answer("\n".join(lines))
+    await callback.answer()
+
+@router.callback_query(AdminCallback.filter(F.action == "referrers"))
+async def admin_referrers(callback: CallbackQuery):
+    """Рейтинг пригласивших"""
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("🚫 Доступ запрещён", show_alert=True)
+        return
     
-    output = StringIO()
-    writer = csv.DictWriter(output, fieldnames=users[0].keys())
-    writer.writeheader()
-    writer.writerows(users)
+    top = await db.get_top_referrers()
+    if not top:
+        await callback.message.answer("🏆 Приглашений пока нет.")
+        await callback.answer()
+        return
     
-    csv_data = output.getvalue()
+    lines = [f"🏆 <b>ТОП-{REFERRAL_LEADERBOARD_SIZE} ПРИГЛАСИВШИХ</b>\n"]
+    for place, referrer in enumerate(top, 1):
+        name = f"@{referrer['username']}" if referrer['username'] else "—"
+        lines.append(
+            f"{place}. {name} (<code>{referrer['telegram_id']}</code>) — {referrer['referral_count']}"
+        )
     
-    # Отправляем файл
-    from io import BytesIO
-    file = BytesIO(csv_data.encode('utf-8'))
-    file.name = f"users_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    await callback.message.answer("\n".join(lines))
+    await callback.answer()
+
+@router.callback_query(AdminCallback.filter(F.action.in_({"job_pause", "job_resume", "job_cancel"})))
+async def admin_broadcast_control(callback: CallbackQuery, callback_data: AdminCallback):
+    """Пауза / продолжение / отмена рассылки"""
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("🚫 Доступ запрещён", show_alert=True)
+        return
     
-    from aiogram.types import BufferedInputFile
-    document = BufferedInputFile(file.read(), filename=file.name)
+    job = await db.get_broadcast_job(int(callback_data.data))
+    if not job:
+        await callback.answer("❌ Рассылка не найдена", show_alert=True)
+        return
+    
+    allowed = {
+        "job_pause": ((JOB_PENDING, JOB_RUNNING), JOB_PAUSED),
+        "job_resume": ((JOB_PAUSED,), JOB_PENDING),
+        "job_cancel": ((JOB_PENDING, JOB_RUNNING, JOB_PAUSED), JOB_CANCELLED),
+    }
+    from_statuses, new_status = allowed[callback_data.action]
+    status = broadcast_worker.status_of(job)
+    if status not in from_statuses:
+        await callback.answer(
+            f"Статус рассылки: {BROADCAST_STATUS_LABELS.get(status, status)}",
+            show_alert=True
+        )
+        return
+    
+    await broadcast_worker.set_status(job.id, new_status)
+    await callback.message.edit_reply_markup(
+        reply_markup=get_broadcast_job_keyboard(job.id, new_status)
+    )
+    await callback.answer(BROADCAST_STATUS_LABELS[new_status])
+
+@router.callback_query(AdminCallback.filter(F.action == "export"))
+async def admin_export(callback: CallbackQuery):
+    """Экспорт данных: CSV.gz пишется в потоке БД и отправляется частями"""
+    if callback.from_user.id != ADMIN_ID:
+        await callback.answer("🚫 Доступ запрещён", show_alert=True)
+        return
     
-    await callback.message.answer_document(document)
     await callback.answer()
+    status = await callback.message.answer("📥 Экспортирую данные...")
+    total = await db.count_registered()
+    exported = 0
+    
+    def on_progress(rows: int):
+        # Вызывается из потока выгрузки; event loop только читает значение
+        nonlocal exported
+        exported = rows
+    
+    async def show_status(text: str):
+        try:
+            await status.edit_text(text)
+        except TelegramBadRequest:
+            pass  # Текст не изменился или сообщение удалено
+    
+    directory = tempfile.mkdtemp(prefix="merzogames_export_")
+    name = f"users_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv.gz"
+    try:
+        task = asyncio.create_task(
+            db.export_users(os.path.join(directory, name), EXPORT_PART_SIZE, on_progress)
+        )
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=EXPORT_PROGRESS_INTERVAL)
+            if done:
+                break
+            await show_status(f"📥 Экспортирую данные... {exported}/{total}")
+        
+        try:
+            paths = task.result()
+        except Exception as e:
+            logger.error(f"Ошибка экспорта: {e}")
+            await show_status(f"❌ Ошибка экспорта: {e}")
+            return
+        
+        await show_status(f"📤 Отправляю файлы: {len(paths)}, пользователей: {exported}")
+        for number, path in enumerate(paths, 1):
+            caption = f"Часть {number}/{len(paths)}" if len(paths) > 1 else None
+            await callback.message.answer_document(FSInputFile(path), caption=caption)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    
+    await show_status(f"✅ Экспорт завершён: пользователей {exported}, файлов {len(paths)}")
     
     # Логируем
-    db.add_log(LogEntry(
+    await log_writer.add(LogEntry(
         user_id=callback.from_user.id,
         action="admin_export",
-        details=f"users_count={len(users)}",
+        details=f"users_count={exported}, parts={len(paths)}",
         timestamp=datetime.now(timezone.utc)
     ))
 
@@ -2202,6 +3361,12 @@ async def inline_handler(inline_query: InlineQuery):
 
 async def on_startup():
     """Действия при запуске"""
+    logger.info(f"⌨️ Клавиатур построено: {build_keyboards()}")
+    logger.info(f"📜 Частей документов подготовлено: {build_documents()}")
+    await rate_limiter.start(db)
+    log_writer.start(db)
+    fsm_storage.start()
+    broadcast_worker.start()
     logger.info("🚀 Бот запущен!")
     await bot.send_message(
         ADMIN_ID,
@@ -2215,6 +3380,10 @@ async def on_shutdown():
         ADMIN_ID,
         "🤖 <b>БОТ ОСТАНОВЛЕН</b>"
     )
+    await broadcast_worker.stop()
+    await rate_limiter.stop(db)
+    await log_writer.stop(db)
+    db.close()
 
 async def main():
     """Главная функция"""
@@ -2231,6 +3400,7 @@ async def main():
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
+    setup_logging()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MERZOGAMES BOT - SCHEMA MIGRATIONS
+Версионированные миграции схемы по PRAGMA user_version
+
+Каждая миграция — упорядоченный список шагов; шаг выполняется
+в своей транзакции, поэтому долгие операции (индексы, пересчёты)
+не держат блокировку записи дольше одного шага, а читатели WAL
+не блокируются вовсе. Версия записывается после всех шагов
+миграции; шаги идемпотентны, так что прерванная миграция
+безопасно повторяется при следующем запуске.
+
+Если версия БД актуальна, migrate() читает одну PRAGMA и не
+выполняет DDL.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Callable, Tuple, Union
+
+from db_pool import ConnectionPool
+from rollups import drop_rollup_triggers, ensure_rollups
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 5000  # Строк на транзакцию при пересчёте данных
+
+# ════════════════════════════════════════════════════════════════
+# ШАГИ
+# ════════════════════════════════════════════════════════════════
+
+# Шаг — SQL-выражение или функция, получающая пул
+Step = Union[str, Callable[[ConnectionPool], None]]
+
+def _batched_by_key(pool: ConnectionPool, table: str, key: str, sql: str):
+    """
+    Выполнить UPDATE пачками по ключу: sql получает границы (после, до включительно)
+    и выполняется в отдельной транзакции на каждые MIGRATION_BATCH_SIZE строк
+    """
+    after_id = 0
+    while True:
+        with pool.writer() as conn:
+            last_id = conn.execute(f"""
+                SELECT MAX({key}) FROM (
+                    SELECT {key} FROM {table}
+                    WHERE {key} > ?
+                    ORDER BY {key}
+                    LIMIT ?
+                )
+            """, (after_id, MIGRATION_BATCH_SIZE)).fetchone()[0]
+            if last_id is None:
+                return
+            conn.execute(sql, (after_id, last_id))
+        after_id = last_id
+
+def add_column(table: str, column: str, definition: str) -> Step:
+    """Шаг: добавить колонку, если её ещё нет"""
+    def step(pool: ConnectionPool):
+        with pool.writer() as conn:
+            existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+def convert_timestamps(table: str, key: str, columns: Tuple[str, ...]) -> Step:
+    """Шаг: перевести текстовое время (ISO) в секунды Unix"""
+    assignments = ", ".join(
+        f"{column} = CASE WHEN typeof({column}) = 'text' "
+        f"THEN CAST(strftime('%s', {column}) AS INTEGER) ELSE {column} END"
+        for column in columns
+    )
+    sql = f"UPDATE {table} SET {assignments} WHERE {key} > ? AND {key} <= ?"
+
+    def step(pool: ConnectionPool):
+        _batched_by_key(pool, table, key, sql)
+    return step
+
+def _ensure_rollups(pool: ConnectionPool):
+    with pool.writer() as conn:
+        ensure_rollups(conn)
+
+def _drop_rollup_triggers(pool: ConnectionPool):
+    with pool.writer() as conn:
+        drop_rollup_triggers(conn)
+
+def _backfill_referral_counts(pool: ConnectionPool):
+    """Пересчитать users.referral_count пачками по telegram_id"""
+    _batched_by_key(pool, "users", "telegram_id", """
+        UPDATE users SET referral_count = (
+            SELECT COUNT(*) FROM users AS referred
+            WHERE referred.referred_by = users.telegram_id
+        )
+        WHERE telegram_id > ? AND telegram_id <= ?
+    """)
+
+# ════════════════════════════════════════════════════════════════
+# МИГРАЦИИ
+# ════════════════════════════════════════════════════════════════
+
+@dataclass(frozen=True)
+class Migration:
+    """Миграция схемы"""
+    version: int
+    description: str
+    steps: Tuple[Step, ...]
+
+MIGRATIONS: Tuple[Migration, ...] = (
+    Migration(1, "Базовая схема", (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            telegram_id INTEGER PRIMARY KEY,
+            username TEXT,
+            phone TEXT UNIQUE,
+            phone_hash TEXT,
+            language TEXT DEFAULT 'ru',
+            registration_date TIMESTAMP,
+            policy_accepted BOOLEAN DEFAULT 0,
+            policy_accepted_date TIMESTAMP,
+            terms_accepted BOOLEAN DEFAULT 0,
+            terms_accepted_date TIMESTAMP,
+            age_confirmed BOOLEAN DEFAULT 0,
+            age_confirmed_date TIMESTAMP,
+            is_blocked BOOLEAN DEFAULT 0,
+            block_reason TEXT,
+            block_date TIMESTAMP,
+            is_admin BOOLEAN DEFAULT 0,
+            referred_by INTEGER,
+            deletion_scheduled TIMESTAMP,
+            last_activity TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            action TEXT,
+            details TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            user_id INTEGER PRIMARY KEY,
+            command_count INTEGER DEFAULT 0,
+            last_command_time TIMESTAMP,
+            flood_strikes INTEGER DEFAULT 0,
+            flood_blocked_until TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS badges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            badge_type TEXT,
+            earned_date TIMESTAMP,
+            UNIQUE(user_id, badge_type)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS webapp_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            opened_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_phone_hash ON users(phone_hash)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_user_id ON logs(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp)",
+    )),
+    Migration(2, "Доступность пользователей для рассылок", (
+        add_column("users", "is_reachable", "BOOLEAN DEFAULT 1"),
+        add_column("users", "unreachable_since", "TIMESTAMP"),
+    )),
+    Migration(3, "Задания рассылки", (
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER,
+            text TEXT,
+            status TEXT DEFAULT 'pending',
+            cursor INTEGER DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            progress_chat_id INTEGER,
+            progress_message_id INTEGER,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+    )),
+    Migration(4, "Сегменты и языковые варианты рассылок", (
+        add_column("broadcast_jobs", "segment", "TEXT"),
+        add_column("broadcast_jobs", "variants", "TEXT"),
+        "CREATE INDEX IF NOT EXISTS idx_users_language ON users(language)",
+        "CREATE INDEX IF NOT EXISTS idx_users_registration_date ON users(registration_date)",
+        "CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users(last_activity)",
+        "CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users(referred_by)",
+    )),
+    Migration(5, "Rollup-таблицы статистики", (
+        _ensure_rollups,
+    )),
+    Migration(6, "Счётчики приглашённых", (
+        add_column("users", "referral_count", "INTEGER DEFAULT 0"),
+        _backfill_referral_counts,
+        "CREATE INDEX IF NOT EXISTS idx_users_referral_count ON users(referral_count)",
+    )),
+    Migration(7, "Индексы по аудиту запросов", (
+        # Логи пользователя сразу в порядке времени; заменяет idx_logs_user_id
+        "CREATE INDEX IF NOT EXISTS idx_logs_user_timestamp ON logs(user_id, timestamp)",
+        "DROP INDEX IF EXISTS idx_logs_user_id",
+        "CREATE INDEX IF NOT EXISTS idx_badges_type ON badges(badge_type, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_webapp_stats_user_id ON webapp_stats(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_rate_limits_blocked_until ON rate_limits(flood_blocked_until)",
+        """
+        CREATE INDEX IF NOT EXISTS idx_users_deletion_scheduled ON users(deletion_scheduled)
+        WHERE deletion_scheduled IS NOT NULL
+        """,
+    )),
+    Migration(8, "Время в секундах Unix", (
+        # Триггеры пересчитали бы rollup по старым значениям — снимаем
+        # их на время конвертации и пересоздаём с пересчётом в конце
+        _drop_rollup_triggers,
+        convert_timestamps("users", "telegram_id", (
+            "registration_date", "policy_accepted_date", "terms_accepted_date",
+            "age_confirmed_date", "block_date", "deletion_scheduled",
+            "last_activity", "unreachable_since"
+        )),
+        convert_timestamps("logs", "id", ("timestamp",)),
+        convert_timestamps("rate_limits", "user_id", ("last_command_time", "flood_blocked_until")),
+        convert_timestamps("badges", "id", ("earned_date",)),
+        convert_timestamps("webapp_stats", "id", ("opened_date",)),
+        convert_timestamps("broadcast_jobs", "id", ("created_at", "updated_at", "finished_at")),
+        _ensure_rollups,
+    )),
+    Migration(9, "Хранилище FSM", (
+        """
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at INTEGER
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)",
+    )),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# ════════════════════════════════════════════════════════════════
+# ЗАПУСК
+# ════════════════════════════════════════════════════════════════
+
+def get_schema_version(pool: ConnectionPool) -> int:
+    """Текущая версия схемы БД"""
+    with pool.reader() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(pool: ConnectionPool) -> int:
+    """Применить недостающие миграции, вернуть итоговую версию схемы"""
+    current = get_schema_version(pool)
+    if current >= LATEST_VERSION:
+        return current
+
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+
+        logger.info(f"🛠 Миграция v{migration.version}: {migration.description}")
+        for step in migration.steps:
+            if isinstance(step, str):
+                with pool.writer() as conn:
+                    conn.execute(step)
+            else:
+                step(pool)
+
+        with pool.writer() as conn:
+            conn.execute(f"PRAGMA user_version = {migration.version}")
+        current = migration.version
+
+    return current
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MERZOGAMES BOT - QUERY PLAN AUDIT
+Проверка планов запросов бота и утилит через EXPLAIN QUERY PLAN
+
+Список запросов не ведётся вручную: collect_queries() прогоняет методы
+Database (merzogames_bot.py), DatabaseUtils (utils.py) и выгрузку
+(exporters.py) на временной БД и записывает каждый выполненный SQL
+через set_trace_callback. Если план содержит SCAN, пара (метод, таблица)
+должна быть в ALLOWED_SCANS с причиной — иначе аудит (utils.py
+audit-queries, tests/test_query_audit.py) завершается ошибкой.
+Метод с SQL, который сценарий не вызвал, тоже считается ошибкой.
+"""
+
+import contextlib
+import inspect
+import io
+import os
+import re
+import sqlite3
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+# ════════════════════════════════════════════════════════════════
+# ДОПУСТИМЫЕ ПОЛНЫЕ ПРОХОДЫ
+# ════════════════════════════════════════════════════════════════
+
+@dataclass(frozen=True)
+class AllowedScan:
+    """Полный проход таблицы, допустимый для метода"""
+    source: str
+    table: str
+    reason: str
+    pattern: Optional[str] = None  # Только для SQL, подходящего под регулярное выражение
+
+ALLOWED_SCANS: Tuple[AllowedScan, ...] = (
+    # ─── rollup-таблицы: строк = дней × языков / типов / пользователей WebApp ───
+    AllowedScan("Database.get_statistics", "stats_registrations", "rollup: строк = дней × языков"),
+    AllowedScan("Database.count_registered", "stats_registrations", "rollup: строк = дней × языков"),
+    AllowedScan("Database.count_users", "stats_registrations", "rollup: строк = дней × языков"),
+    AllowedScan("DatabaseUtils.get_statistics", "stats_registrations", "rollup: строк = дней × языков"),
+    AllowedScan("DatabaseUtils.get_statistics", "stats_badges", "rollup: строка на тип бейджа"),
+    AllowedScan("DatabaseUtils.get_statistics", "stats_webapp_daily", "rollup: строка на день"),
+    AllowedScan(
+        "DatabaseUtils.get_statistics", "stats_webapp_users",
+        "COUNT(*) по rollup-таблице уникальных пользователей"
+    ),
+
+    # ─── Очередь рассылок: единицы строк ───
+    AllowedScan(
+        "Database.get_next_broadcast_job", "broadcast_jobs",
+        "очередь заданий рассылки: единицы строк, проход по rowid до первого совпадения"
+    ),
+    AllowedScan("Database.get_recent_broadcast_jobs", "broadcast_jobs", "последние N строк по rowid"),
+
+    # ─── Ручные команды и выгрузки ───
+    AllowedScan(
+        "DatabaseUtils.get_logs", "logs", "последние N строк по индексу idx_logs_timestamp",
+        pattern=r"FROM logs ORDER BY timestamp DESC"
+    ),
+    AllowedScan(
+        "DatabaseUtils.search_users", "users", "поиск по подстроке не использует индекс; ручная команда"
+    ),
+    # Выгрузка с --since идёт по индексу регистрации — без WHERE по дате допустим только полный проход
+    AllowedScan(
+        "exporters.export_users", "users", "полная выгрузка",
+        pattern=r"FROM users$"
+    ),
+    AllowedScan(
+        "exporters.export_users_parts", "users", "полная выгрузка из админки, в потоке БД",
+        pattern=r"FROM users WHERE is_blocked = 0$"
+    ),
+)
+
+# Методы с SQL, которые сценарий сознательно не вызывает
+WORKLOAD_SKIPPED: Dict[str, str] = {
+    "DatabaseUtils.vacuum_database": "VACUUM не имеет плана",
+}
+
+# ════════════════════════════════════════════════════════════════
+# ЗАПИСЬ ЗАПРОСОВ
+# ════════════════════════════════════════════════════════════════
+
+# Модули, чей SQL проверяется: имя файла → префикс имени источника
+AUDITED_MODULES = {
+    "merzogames_bot.py": "",
+    "utils.py": "",
+    "exporters.py": "exporters.",
+}
+
+_AUDITED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\bNULL\b")
+_EXECUTES_SQL = re.compile(r"\.execute(?:many|script)?\(")
+
+@dataclass
+class CapturedQuery:
+    """Выполненный SQL (значения параметров подставлены) и методы, которые его выполнили"""
+    sql: str
+    sources: Set[str] = field(default_factory=set)
+
+def _normalize(sql: str) -> str:
+    return " ".join(sql.split())
+
+def _qualname(frame) -> str:
+    """Имя функции вида Класс.метод (co_qualname есть только с Python 3.11)"""
+    code = frame.f_code
+    qualname = getattr(code, "co_qualname", None)
+    if qualname is not None:
+        return qualname
+    instance = frame.f_locals.get("self")
+    return f"{type(instance).__name__}.{code.co_name}" if instance is not None else code.co_name
+
+def _source() -> Optional[str]:
+    """Ближайший к sqlite3 метод проверяемого модуля в стеке вызова"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        prefix = AUDITED_MODULES.get(os.path.basename(frame.f_code.co_filename))
+        if prefix is not None:
+            return prefix + _qualname(frame)
+        frame = frame.f_back
+    return None
+
+class QueryRecorder:
+    """Callback для ConnectionPool.set_trace_callback: собирает запросы по форме SQL"""
+
+    def __init__(self):
+        self.queries: Dict[str, CapturedQuery] = {}
+        self.sources: Set[str] = set()  # Включая PRAGMA и служебные команды
+
+    def __call__(self, sql: str):
+        source = _source()
+        if source is None:
+            return
+        self.sources.add(source)
+        sql = _normalize(sql)
+        if not sql.upper().startswith(_AUDITED_STATEMENTS):
+            return
+        # Одна форма запроса — одна запись, какие бы значения ни подставлялись
+        query = self.queries.setdefault(_LITERAL.sub("?", sql), CapturedQuery(sql))
+        query.sources.add(source)
+
+def _sql_methods() -> List[str]:
+    """Методы Database, DatabaseUtils и функции exporters, выполняющие SQL"""
+    import exporters
+    import merzogames_bot
+    import utils
+
+    functions = [
+        *vars(merzogames_bot.Database).values(),
+        *vars(utils.DatabaseUtils).values(),
+        *(value for value in vars(exporters).values() if inspect.getmodule(value) is exporters),
+    ]
+    names = []
+    for function in functions:
+        function = getattr(function, "__func__", function)
+        if inspect.isfunction(function) and _EXECUTES_SQL.search(inspect.getsource(function)):
+            prefix = AUDITED_MODULES.get(os.path.basename(function.__code__.co_filename), "")
+            names.append(prefix + function.__qualname__)
+    return names
+
+def _run_workload(database, utils_db, db_path: str):
+    """Вызвать методы с SQL так, чтобы выполнилась каждая ветка построения запроса"""
+    import exporters
+    import merzogames_bot as bot
+
+    now = datetime.now(timezone.utc)
+    for telegram_id in range(1, 6):
+        database.add_user(bot.User(
+            telegram_id, f"user{telegram_id}", f"+7900000000{telegram_id}", "ru", now,
+            referred_by=1 if telegram_id > 1 else None
+        ))
+    database.update_user(2, last_activity=now, deletion_scheduled=now - timedelta(days=1))
+    database.get_user(1)
+    database.check_phone_exists("+79000000001")
+    database.add_logs([bot.LogEntry(1, "start", None, now)])
+    database.get_statistics()
+    database.count_registered()
+
+    # Все ветки фильтра сегмента по отдельности и вместе
+    segments = [
+        None,
+        bot.BroadcastSegment(language="ru"),
+        bot.BroadcastSegment(registered_from="2026-01-01", registered_to="2026-02-01"),
+        bot.BroadcastSegment(active_since=bot.to_epoch(now - timedelta(days=7))),
+        bot.BroadcastSegment(referred=True),
+        bot.BroadcastSegment(referred=False),
+        bot.BroadcastSegment(badge="pioneer"),
+        bot.BroadcastSegment.parse("lang=ru registered=2026-01-01..2026-02-01 active=7 referred=yes badge=pioneer"),
+    ]
+    for segment in segments:
+        for reachable_only in (False, True):
+            database.count_users(reachable_only, segment)
+            database.get_users_page(("language",), 0, 10, reachable_only, segment)
+
+    database.save_flood_blocks({1: now + timedelta(hours=1)})
+    database.load_flood_blocks()
+    database.add_badge(1, "pioneer")
+    database.add_badge(1, "pioneer")
+    database.get_user_badges(1)
+    database.get_referral_count(1)
+    database.get_top_referrers()
+    database.log_webapp_open(1)
+    database.get_webapp_opens(1)
+    database.mark_unreachable([5])
+
+    job_id = database.create_broadcast_job(1, "text", 5, bot.BroadcastSegment(language="ru"), {"en": "text"})
+    database.update_broadcast_job(job_id, status=bot.JOB_RUNNING, cursor=1, sent=1, failed=0)
+    database.get_broadcast_job(job_id)
+    database.get_next_broadcast_job()
+    database.get_recent_broadcast_jobs()
+
+    database.save_fsm_records([("1:1:1:::default", "state", "{}", bot.to_epoch(now)), ("1:2:2:::default", None, "{}", 0)])
+    database.get_fsm_record("1:1:1:::default")
+    database.purge_fsm_records(now - timedelta(days=1))
+
+    export_dir = os.path.dirname(os.path.abspath(db_path))
+    database.export_users(os.path.join(export_dir, "audit_export.csv.gz"))
+
+    utils_db.get_statistics()
+    utils_db.get_user_by_id(1)
+    utils_db.get_user_by_phone("+79000000001")
+    utils_db.search_users("user")
+    utils_db.block_user(4)
+    utils_db.unblock_user(4)
+    utils_db.get_logs(1)
+    utils_db.get_logs()
+    utils_db.cleanup_deleted_accounts()
+    with utils_db.pool.reader() as conn:
+        # То же, что DatabaseUtils.export_users, но без записи в exports/
+        exporters.export_users(conn, os.path.join(export_dir, "audit_export.csv"))
+        exporters.export_users(
+            conn, os.path.join(export_dir, "audit_export.ndjson"), "ndjson",
+            ["telegram_id", "registration_date"], bot.to_epoch(now - timedelta(days=1))
+        )
+
+def collect_queries(db_path: str) -> Tuple[List[CapturedQuery], List[str]]:
+    """
+    Создать БД в db_path (файл не должен существовать), выполнить на ней
+    сценарий и вернуть (запросы, методы с SQL, которые не были вызваны).
+    Импортирует merzogames_bot — нужен aiogram.
+    """
+    import merzogames_bot
+    import utils
+    from db_pool import close_pool
+
+    if os.path.exists(db_path):
+        raise FileExistsError(f"Аудит пишет в БД, нужен новый файл: {db_path}")
+
+    # Миграции выполняются до записи: проверяется только SQL методов
+    database = merzogames_bot.Database(db_path)
+    utils_db = utils.DatabaseUtils(db_path)
+    recorder = QueryRecorder()
+    database.pool.set_trace_callback(recorder)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            _run_workload(database, utils_db, db_path)
+    finally:
+        database.pool.set_trace_callback(None)
+        close_pool(db_path)
+
+    uncovered = [
+        name for name in _sql_methods()
+        if name not in recorder.sources and name not in WORKLOAD_SKIPPED
+    ]
+    return list(recorder.queries.values()), uncovered
+
+# ════════════════════════════════════════════════════════════════
+# АУДИТ
+# ════════════════════════════════════════════════════════════════
+
+@dataclass
+class AuditResult:
+    """Результат проверки одного запроса"""
+    query: CapturedQuery
+    plan: List[str] = field(default_factory=list)
+    scans: List[str] = field(default_factory=list)
+    allowed: List[str] = field(default_factory=list)  # Причины допущенных SCAN
+    error: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return ", ".join(sorted(self.query.sources))
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and len(self.allowed) == len(self.scans)
+
+def _is_scan(detail: str) -> bool:
+    """Строка плана означает проход по всей таблице или индексу"""
+    return detail.startswith("SCAN ") and detail != "SCAN CONSTANT ROW"
+
+def _allowed_scan(query: CapturedQuery, detail: str) -> Optional[str]:
+    """Причина, по которой SCAN допустим для всех источников запроса, или None"""
+    table = detail.split()[1]
+    reasons = []
+    for source in query.sources:
+        reason = next((
+            allowed.reason for allowed in ALLOWED_SCANS
+            if allowed.source == source and allowed.table == table
+            and (allowed.pattern is None or re.search(allowed.pattern, query.sql))
+        ), None)
+        if reason is None:
+            return None
+        reasons.append(reason)
+    return reasons[0] if reasons else None
+
+def audit_queries(conn: sqlite3.Connection, queries: List[CapturedQuery]) -> List[AuditResult]:
+    """Получить планы запросов и отметить полные проходы"""
+    results = []
+    for query in sorted(queries, key=lambda query: (sorted(query.sources), query.sql)):
+        result = AuditResult(query)
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {query.sql}").fetchall()
+        except sqlite3.Error as e:
+            result.error = str(e)
+        else:
+            result.plan = [row[3] for row in rows]
+            result.scans = [detail for detail in result.plan if _is_scan(detail)]
+            result.allowed = [
+                reason for reason in (_allowed_scan(query, detail) for detail in result.scans)
+                if reason is not None
+            ]
+        results.append(result)
+    return results
+
+def assert_no_full_scans(conn: sqlite3.Connection, queries: List[CapturedQuery]):
+    """Для тестов: AssertionError, если какой-то запрос неожиданно сканирует таблицу"""
+    failed = [result for result in audit_queries(conn, queries) if not result.ok]
+    if failed:
+        raise AssertionError("Запросы без индекса:\n" + "\n".join(
+            f"  {result.name}: {result.query.sql}\n    {result.error or '; '.join(result.scans)}"
+            for result in failed
+        ))
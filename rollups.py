@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MERZOGAMES BOT - STATISTICS ROLLUPS
+Предагрегированные таблицы статистики для бота и утилит
+
+Счётчики поддерживаются триггерами SQLite на каждой записи в users,
+badges и webapp_stats — поэтому они верны при любом источнике записи
+(бот, utils.py, ручные правки), а статистика читает несколько строк
+вместо сканирования исходных таблиц.
+"""
+
+import sqlite3
+
+# ════════════════════════════════════════════════════════════════
+# СХЕМА
+# ════════════════════════════════════════════════════════════════
+
+ROLLUP_TABLES = {
+    # Регистрации по дню и языку; blocked/unreachable/referred — среди них
+    "stats_registrations": """
+        CREATE TABLE IF NOT EXISTS stats_registrations (
+            day TEXT NOT NULL,
+            language TEXT NOT NULL,
+            registered INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            unreachable INTEGER NOT NULL DEFAULT 0,
+            referred INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, language)
+        ) WITHOUT ROWID
+    """,
+    "stats_badges": """
+        CREATE TABLE IF NOT EXISTS stats_badges (
+            badge_type TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """,
+    "stats_webapp_daily": """
+        CREATE TABLE IF NOT EXISTS stats_webapp_daily (
+            day TEXT PRIMARY KEY,
+            opens INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """,
+    # Одна строка на пользователя, открывавшего WebApp
+    "stats_webapp_users": """
+        CREATE TABLE IF NOT EXISTS stats_webapp_users (
+            user_id INTEGER PRIMARY KEY,
+            opens INTEGER NOT NULL DEFAULT 0
+        )
+    """,
+}
+
+# Вклад строки users в stats_registrations (row — NEW или OLD, sign — +1/-1).
+# Время хранится в секундах Unix (см. timestamps.py), день — дата UTC.
+_REGISTRATION_UPSERT = """
+    INSERT INTO stats_registrations (day, language, registered, blocked, unreachable, referred)
+    VALUES (
+        COALESCE(date({row}.registration_date, 'unixepoch'), ''),
+        COALESCE({row}.language, ''),
+        {sign},
+        {sign} * ({row}.is_blocked = 1),
+        {sign} * ({row}.is_blocked = 0 AND {row}.is_reachable = 0),
+        {sign} * ({row}.referred_by IS NOT NULL)
+    )
+    ON CONFLICT (day, language) DO UPDATE SET
+        registered = registered + excluded.registered,
+        blocked = blocked + excluded.blocked,
+        unreachable = unreachable + excluded.unreachable,
+        referred = referred + excluded.referred;
+"""
+
+_WEBAPP_UPSERT = """
+    INSERT INTO stats_webapp_daily (day, opens)
+    VALUES (COALESCE(date({row}.opened_date, 'unixepoch'), ''), {sign})
+    ON CONFLICT (day) DO UPDATE SET opens = opens + excluded.opens;
+    INSERT INTO stats_webapp_users (user_id, opens)
+    VALUES ({row}.user_id, {sign})
+    ON CONFLICT (user_id) DO UPDATE SET opens = opens + excluded.opens;
+    DELETE FROM stats_webapp_users WHERE user_id = {row}.user_id AND opens <= 0;
+"""
+
+ROLLUP_TRIGGERS = {
+    "trg_stats_users_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_insert AFTER INSERT ON users
+        BEGIN
+            {_REGISTRATION_UPSERT.format(row="NEW", sign=1)}
+        END
+    """,
+    "trg_stats_users_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users
+        BEGIN
+            {_REGISTRATION_UPSERT.format(row="OLD", sign=-1)}
+        END
+    """,
+    # Срабатывает только на колонки, влияющие на счётчики
+    "trg_stats_users_update": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_update
+        AFTER UPDATE OF registration_date, language, is_blocked, is_reachable, referred_by ON users
+        BEGIN
+            {_REGISTRATION_UPSERT.format(row="OLD", sign=-1)}
+            {_REGISTRATION_UPSERT.format(row="NEW", sign=1)}
+        END
+    """,
+    "trg_stats_badges_insert": """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_badges_insert AFTER INSERT ON badges
+        BEGIN
+            INSERT INTO stats_badges (badge_type, count) VALUES (NEW.badge_type, 1)
+            ON CONFLICT (badge_type) DO UPDATE SET count = count + 1;
+        END
+    """,
+    "trg_stats_badges_delete": """
+        CREATE TRIGGER IF NOT EXISTS trg_stats_badges_delete AFTER DELETE ON badges
+        BEGIN
+            UPDATE stats_badges SET count = count - 1 WHERE badge_type = OLD.badge_type;
+        END
+    """,
+    "trg_stats_webapp_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stats_webapp_insert AFTER INSERT ON webapp_stats
+        BEGIN
+            {_WEBAPP_UPSERT.format(row="NEW", sign=1)}
+        END
+    """,
+    "trg_stats_webapp_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_stats_webapp_delete AFTER DELETE ON webapp_stats
+        BEGIN
+            {_WEBAPP_UPSERT.format(row="OLD", sign=-1)}
+        END
+    """,
+}
+
+# ════════════════════════════════════════════════════════════════
+# СОЗДАНИЕ И ПЕРЕСЧЁТ
+# ════════════════════════════════════════════════════════════════
+
+def rebuild_rollups(conn: sqlite3.Connection):
+    """Пересчитать все rollup-таблицы из исходных данных"""
+    conn.execute("DELETE FROM stats_registrations")
+    conn.execute("""
+        INSERT INTO stats_registrations (day, language, registered, blocked, unreachable, referred)
+        SELECT COALESCE(date(registration_date, 'unixepoch'), ''),
+               COALESCE(language, ''),
+               COUNT(*),
+               SUM(is_blocked = 1),
+               SUM(is_blocked = 0 AND is_reachable = 0),
+               COUNT(referred_by)
+        FROM users
+        GROUP BY 1, 2
+    """)
+
+    conn.execute("DELETE FROM stats_badges")
+    conn.execute("""
+        INSERT INTO stats_badges (badge_type, count)
+        SELECT badge_type, COUNT(*) FROM badges GROUP BY badge_type
+    """)
+
+    conn.execute("DELETE FROM stats_webapp_daily")
+    conn.execute("""
+        INSERT INTO stats_webapp_daily (day, opens)
+        SELECT COALESCE(date(opened_date, 'unixepoch'), ''), COUNT(*)
+        FROM webapp_stats
+        GROUP BY 1
+    """)
+
+    conn.execute("DELETE FROM stats_webapp_users")
+    conn.execute("""
+        INSERT INTO stats_webapp_users (user_id, opens)
+        SELECT user_id, COUNT(*) FROM webapp_stats GROUP BY user_id
+    """)
+
+def drop_rollup_triggers(conn: sqlite3.Connection):
+    """
+    Удалить триггеры rollup-таблиц (перед массовым изменением исходных
+    данных; ensure_rollups затем создаст их заново и пересчитает таблицы)
+    """
+    for name in ROLLUP_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+def ensure_rollups(conn: sqlite3.Connection):
+    """
+    Создать rollup-таблицы и триггеры (идемпотентно).
+    Если таблиц ещё не было — заполнить их по существующим данным.
+    Вызывать внутри транзакции писателя, чтобы пересчёт и триггеры
+    не разошлись с параллельными записями.
+    """
+    existing = {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+    }
+    if "users" not in existing:
+        return  # Основная схема ещё не создана
+    missing = [name for name in (*ROLLUP_TABLES, *ROLLUP_TRIGGERS) if name not in existing]
+    if not missing:
+        return
+
+    for ddl in ROLLUP_TABLES.values():
+        conn.execute(ddl)
+    for ddl in ROLLUP_TRIGGERS.values():
+        conn.execute(ddl)
+    rebuild_rollups(conn)
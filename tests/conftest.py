@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+"""
+Общие фикстуры тестов.
+Бот при импорте создаёт merzogames.db и bot.log в текущем каталоге,
+поэтому тесты работают во временном каталоге.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="merzogames_tests_"))
+
+@pytest.fixture
+def database(tmp_path):
+    """AsyncDatabase на отдельном файле со свежей схемой"""
+    import merzogames_bot
+    from db_pool import close_pool
+    
+    path = str(tmp_path / "test.db")
+    database = merzogames_bot.AsyncDatabase(merzogames_bot.Database(path))
+    yield database
+    database._executor.shutdown(wait=True)
+    close_pool(path)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""Очередь рассылок: команды управления и падающие задания"""
+
+import asyncio
+from datetime import datetime, timezone
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+import merzogames_bot as bot_module
+
+class FakeBot:
+    """Бот без сети: запоминает отправленные и отредактированные сообщения"""
+    
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+        self.edits = []
+    
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.delay)
+        self.sent.append(chat_id)
+    
+    async def edit_message_text(self, **kwargs):
+        self.edits.append(kwargs["text"])
+
+async def add_users(database, count: int):
+    for telegram_id in range(1, count + 1):
+        await database.add_user(bot_module.User(
+            telegram_id, f"user{telegram_id}", None, "ru", datetime.now(timezone.utc)
+        ))
+
+async def wait_status(database, job_id: int, status: str, timeout: float = 10.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        job = await database.get_broadcast_job(job_id)
+        if job.status == status:
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"Рассылка #{job_id}: статус {job.status}, ожидался {status}")
+
+def test_resume_while_pause_is_stopping(database):
+    async def scenario():
+        await add_users(database, 60)
+        fake_bot = FakeBot(delay=0.2)
+        worker = bot_module.BroadcastWorker(fake_bot, database)
+        job_id = await database.create_broadcast_job(1, "hi", 60)
+        worker.start()
+        try:
+            await wait_status(database, job_id, bot_module.JOB_RUNNING)
+            await asyncio.sleep(0.3)
+            await worker.set_status(job_id, bot_module.JOB_PAUSED)
+            # Пауза ещё не вступила в силу: отправки в процессе
+            await worker.set_status(job_id, bot_module.JOB_PENDING)
+            await wait_status(database, job_id, bot_module.JOB_DONE)
+        finally:
+            await worker.stop()
+        return fake_bot
+    
+    fake_bot = asyncio.run(scenario())
+    assert sorted(fake_bot.sent) == list(range(1, 61))
+
+def test_failing_job_is_marked_failed(database, monkeypatch):
+    monkeypatch.setattr(bot_module, "BROADCAST_POLL_INTERVAL", 0.01)
+    original_run = bot_module.Broadcaster.run
+    attempts = []
+    
+    async def run(self, recipients, text, **kwargs):
+        if text == "boom":
+            attempts.append(text)
+            raise RuntimeError("boom")
+        return await original_run(self, recipients, text, **kwargs)
+    
+    monkeypatch.setattr(bot_module.Broadcaster, "run", run)
+    
+    async def scenario():
+        await add_users(database, 3)
+        fake_bot = FakeBot()
+        worker = bot_module.BroadcastWorker(fake_bot, database)
+        failing_id = await database.create_broadcast_job(1, "boom", 3)
+        await database.update_broadcast_job(failing_id, progress_chat_id=1, progress_message_id=2)
+        next_id = await database.create_broadcast_job(1, "hi", 3)
+        worker.start()
+        try:
+            failed = await wait_status(database, failing_id, bot_module.JOB_FAILED)
+            await wait_status(database, next_id, bot_module.JOB_DONE)
+        finally:
+            await worker.stop()
+        return fake_bot, failed
+    
+    fake_bot, failed = asyncio.run(scenario())
+    with database.sync.pool.reader() as conn:
+        finished_at = conn.execute(
+            "SELECT finished_at FROM broadcast_jobs WHERE id = ?", (failed.id,)
+        ).fetchone()[0]
+    assert len(attempts) == bot_module.BROADCAST_JOB_MAX_FAILURES
+    assert finished_at is not None
+    assert bot_module.BROADCAST_STATUS_LABELS[bot_module.JOB_FAILED] in fake_bot.edits[-1]
+    assert sorted(fake_bot.sent) == [1, 2, 3]
+
+def test_endless_retry_after_is_a_failure():
+    class FloodedBot(FakeBot):
+        async def send_message(self, chat_id, text, **kwargs):
+            if chat_id == 1:
+                raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=text), "Flood control", 0)
+            await super().send_message(chat_id, text, **kwargs)
+    
+    async def recipients():
+        for chat_id in (1, 2):
+            yield chat_id
+    
+    fake_bot = FloodedBot()
+    broadcaster = bot_module.Broadcaster(fake_bot, rate=1000, burst=1000, chat_interval=0, max_flood_waits=3)
+    report = asyncio.run(asyncio.wait_for(broadcaster.run(recipients(), "hi"), 10))
+    
+    assert fake_bot.sent == [2]
+    assert report.failures == {"flood": 1}
+    assert report.retries == 3
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""Выгрузка пользователей частями под лимит размера"""
+
+import csv
+import functools
+import gzip
+import hashlib
+import os
+
+import exporters
+from compression import open_compressed
+
+def add_users(database, count: int):
+    with database.sync.pool.writer() as conn:
+        conn.executemany("""
+            INSERT INTO users (telegram_id, username, phone_hash, language, registration_date)
+            VALUES (?, ?, ?, ?, ?)
+        """, [
+            (
+                telegram_id, f"user{telegram_id}",
+                hashlib.sha256(str(telegram_id).encode()).hexdigest(),
+                "ru", 1767225600 + telegram_id
+            )
+            for telegram_id in range(1, count + 1)
+        ])
+
+def test_parts_fill_up_to_limit(database, tmp_path, monkeypatch):
+    # Много потоков — много несжатых блоков в очереди, как на многоядерном сервере
+    monkeypatch.setattr(exporters, "open_compressed", functools.partial(open_compressed, threads=16))
+    add_users(database, 60000)
+    limit = 1024 * 1024
+    
+    with database.sync.pool.reader() as conn:
+        paths = exporters.export_users_parts(conn, str(tmp_path / "users.csv.gz"), limit)
+    
+    sizes = [os.path.getsize(path) for path in paths]
+    assert len(paths) > 1
+    for size in sizes[:-1]:
+        assert 0.6 * limit <= size <= limit, sizes
+    
+    rows = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+            part = list(csv.reader(f))
+        assert part[0][0] == "telegram_id"
+        rows.extend(part[1:])
+    assert [int(row[0]) for row in rows] == list(range(1, 60001))
+
+def test_single_part_keeps_name(database, tmp_path):
+    add_users(database, 10)
+    path = str(tmp_path / "users.csv.gz")
+    
+    with database.sync.pool.reader() as conn:
+        assert exporters.export_users_parts(conn, path, 1024 * 1024) == [path]
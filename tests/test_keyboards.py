@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+"""Реестр клавиатур: правка выданной клавиатуры не портит общий экземпляр"""
+
+from aiogram.types import InlineKeyboardButton
+
+import merzogames_bot as bot_module
+
+def test_mutating_keyboard_does_not_leak():
+    first = bot_module.get_main_menu_keyboard("ru")
+    rows = len(first.inline_keyboard)
+    text = first.inline_keyboard[0][0].text
+    
+    first.inline_keyboard.append([InlineKeyboardButton(text="extra", callback_data="extra")])
+    first.inline_keyboard[0][0].text = "changed"
+    
+    second = bot_module.get_main_menu_keyboard("ru")
+    assert len(second.inline_keyboard) == rows
+    assert second.inline_keyboard[0][0].text == text
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+"""Планы запросов: новый SQL без индекса или без проверки ломает тест"""
+
+from db_pool import close_pool, get_pool
+from migrations import migrate
+from query_audit import assert_no_full_scans, collect_queries
+
+def test_no_unexpected_full_scans(tmp_path):
+    queries, uncovered = collect_queries(str(tmp_path / "workload.db"))
+    assert queries
+    assert not uncovered, f"Методы с SQL не вызваны сценарием аудита: {uncovered}"
+    
+    path = str(tmp_path / "audit.db")
+    pool = get_pool(path)
+    try:
+        migrate(pool)
+        with pool.reader() as conn:
+            assert_no_full_scans(conn, queries)
+    finally:
+        close_pool(path)
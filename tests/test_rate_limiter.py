@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""Рейт-лимитер: сохранение флуд-блокировок"""
+
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import merzogames_bot as bot_module
+
+def flood(limiter: bot_module.RateLimiter, user_id: int):
+    """Довести пользователя до флуд-блокировки"""
+    for _ in range(bot_module.RATE_LIMIT_COMMANDS + bot_module.FLOOD_STRIKES_LIMIT):
+        limiter.check(user_id)
+
+def test_snapshot_keeps_blocks_when_save_fails(database, monkeypatch):
+    limiter = bot_module.RateLimiter()
+    flood(limiter, 1)
+    
+    async def busy(blocks):
+        raise sqlite3.OperationalError("database is locked")
+    
+    monkeypatch.setattr(database, "save_flood_blocks", busy)
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(limiter.snapshot(database))
+    monkeypatch.undo()
+    
+    asyncio.run(limiter.snapshot(database))
+    assert set(asyncio.run(database.load_flood_blocks())) == {1}
+
+def test_snapshot_deletes_expired_blocks(database):
+    now = datetime.now(timezone.utc)
+    asyncio.run(database.save_flood_blocks({1: now - timedelta(seconds=1)}))
+    asyncio.run(database.save_flood_blocks({2: now + timedelta(hours=1)}))
+    
+    with database.sync.pool.reader() as conn:
+        user_ids = [row[0] for row in conn.execute("SELECT user_id FROM rate_limits")]
+    assert user_ids == [2]
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""Разбиение HTML-документов на сообщения"""
+
+import re
+
+import pytest
+
+from merzogames_bot import split_html, utf16_len
+
+def _text(parts, sep=""):
+    return sep.join(re.sub(r"<[^>]+>", "", part) for part in parts)
+
+def _assert_balanced(part):
+    stack = []
+    for closing, name in re.findall(r"<(/?)([a-z]+)", part):
+        if closing:
+            assert stack and stack.pop() == name, part
+        else:
+            stack.append(name)
+    assert not stack, part
+
+def test_nested_tags_are_reopened():
+    parts = split_html("<b>жирный <i>" + "курсив " * 20 + "</i> конец</b>", 60)
+    
+    assert len(parts) > 1
+    for part in parts:
+        assert utf16_len(part) <= 60
+        _assert_balanced(part)
+    assert all(part.startswith("<b><i>") for part in parts[1:])
+    assert _text(parts, " ").split() == ("жирный " + "курсив " * 20 + "конец").split()
+
+def test_surrogate_pairs_count_twice():
+    parts = split_html("😀" * 30, 11)
+    
+    assert all(utf16_len(part) <= 11 for part in parts)
+    assert "".join(parts) == "😀" * 30
+
+def test_word_longer_than_part():
+    parts = split_html("<b>" + "x" * 100 + "</b>", 30)
+    
+    for part in parts:
+        assert utf16_len(part) <= 30
+        _assert_balanced(part)
+    assert _text(parts) == "x" * 100
+
+def test_no_tag_only_parts():
+    parts = split_html('<a href="https://x.y/z">' + "x" * 50 + "</a>", 60)
+    
+    assert all(_text([part]) for part in parts)
+    assert _text(parts) == "x" * 50
+
+def test_reopened_tags_leave_no_room():
+    text = '<b><i><a href="https://example.com/very/long/path">' + "x" * 50 + "</a></i></b>"
+    parts = split_html(text, 60)
+    
+    for part in parts:
+        assert utf16_len(part) <= 60
+        _assert_balanced(part)
+    assert _text(parts) == "x" * 50
+
+def test_tag_longer_than_part_is_dropped():
+    href = "https://example.com/" + "p" * 4100
+    parts = split_html(f'<b>до <a href="{href}">ссылка</a> после</b>', 4096)
+    
+    assert parts == ("<b>до ссылка после</b>",)
+
+def test_limit_must_fit_a_character():
+    with pytest.raises(ValueError):
+        split_html("текст", 1)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""/start известного пользователя: доступность для рассылок пишется только при изменении"""
+
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import merzogames_bot as bot_module
+
+class FakeMessage:
+    def __init__(self, user_id: int):
+        self.from_user = SimpleNamespace(id=user_id, username="user", language_code="ru")
+        self.answers = []
+    
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+def test_start_writes_reachability_only_when_changed(database, monkeypatch):
+    monkeypatch.setattr(bot_module, "db", database)
+    statements = []
+    database.sync.pool.set_trace_callback(statements.append)
+    
+    async def scenario():
+        await database.add_user(bot_module.User(1, "user", None, "ru", datetime.now(timezone.utc)))
+        await bot_module.cmd_start(FakeMessage(1), state=None)
+        reachable_updates = [sql for sql in statements if "is_reachable" in sql and sql.startswith("UPDATE users")]
+        assert reachable_updates == []
+        
+        await database.mark_unreachable([1])
+        statements.clear()
+        await bot_module.cmd_start(FakeMessage(1), state=None)
+        reachable_updates = [sql for sql in statements if "is_reachable" in sql and sql.startswith("UPDATE users")]
+        assert len(set(reachable_updates)) == 1
+        assert (await database.get_user(1)).is_reachable
+    
+    try:
+        asyncio.run(scenario())
+    finally:
+        database.sync.pool.set_trace_callback(None)
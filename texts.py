@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MERZOGAMES BOT - TEXTS
+Шаблоны сообщений бота по языкам
+
+Тексты лежат в locales/<язык>.json. Язык по умолчанию загружается
+при импорте, остальные — при первом обращении. Каждый шаблон
+разбирается один раз: подстановки проверяются при загрузке (набор
+полей должен совпадать с языком по умолчанию), а render_text() только
+склеивает готовые части. Ключи, которых нет в языке, и неизвестные
+языки берутся из языка по умолчанию.
+"""
+
+import json
+import logging
+import os
+import re
+import string
+import threading
+from typing import Any, Dict, FrozenSet, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+DEFAULT_LANGUAGE = "ru"
+
+_LANGUAGE_CODE = re.compile(r"^[a-z]{2,3}(-[a-z0-9]+)?$")
+
+class TextsError(ValueError):
+    """Ошибка в файле текстов"""
+
+# ════════════════════════════════════════════════════════════════
+# ШАБЛОН
+# ════════════════════════════════════════════════════════════════
+
+class Template:
+    """Разобранный шаблон str.format с именованными подстановками"""
+
+    __slots__ = ("fields", "_static", "_parts")
+
+    def __init__(self, source: str):
+        parts = []
+        fields = set()
+        for literal, name, spec, conversion in string.Formatter().parse(source):
+            if literal:
+                parts.append(literal)
+            if name is None:
+                continue
+            if not name.isidentifier() or conversion:
+                raise TextsError(f"Недопустимая подстановка {{{name}}}")
+            parts.append((name, spec or ""))
+            fields.add(name)
+
+        self.fields: FrozenSet[str] = frozenset(fields)
+        self._parts: Tuple[Union[str, Tuple[str, str]], ...] = tuple(parts)
+        self._static = "".join(parts) if not fields else None
+
+    def render(self, values: Dict[str, Any]) -> str:
+        if self._static is not None:
+            return self._static
+        try:
+            return "".join(
+                part if isinstance(part, str) else format(values[part[0]], part[1])
+                for part in self._parts
+            )
+        except KeyError as e:
+            raise KeyError(f"Не передана подстановка {e.args[0]!r}") from None
+
+# ════════════════════════════════════════════════════════════════
+# ЯЗЫКИ
+# ════════════════════════════════════════════════════════════════
+
+_locales: Dict[str, Dict[str, Template]] = {}
+_unknown: set = set()  # Языки без файла — отдаём язык по умолчанию
+_lock = threading.Lock()
+
+def _compile(lang: str, raw: Dict[str, Any], default: Optional[Dict[str, Template]]) -> Dict[str, Template]:
+    """Разобрать тексты языка и сверить подстановки с языком по умолчанию"""
+    templates: Dict[str, Template] = {}
+    for key, source in raw.items():
+        if not isinstance(source, str):
+            raise TextsError(f"{lang}.{key}: ожидается строка")
+        try:
+            template = Template(source)
+        except ValueError as e:
+            raise TextsError(f"{lang}.{key}: {e}") from None
+
+        base = default.get(key) if default is not None else None
+        if base is not None and template.fields != base.fields:
+            raise TextsError(
+                f"{lang}.{key}: подстановки {sorted(template.fields)} "
+                f"не совпадают с {DEFAULT_LANGUAGE}: {sorted(base.fields)}"
+            )
+        templates[key] = template
+
+    if default is not None:
+        missing = [key for key in default if key not in templates]
+        if missing:
+            logger.warning(f"⚠️ Язык {lang}: нет текстов {', '.join(missing)} — используется {DEFAULT_LANGUAGE}")
+            for key in missing:
+                templates[key] = default[key]
+    return templates
+
+def _load(lang: str, default: Optional[Dict[str, Template]]) -> Dict[str, Template]:
+    path = os.path.join(LOCALES_DIR, f"{lang}.json")
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    return _compile(lang, raw, default)
+
+def available_languages() -> Tuple[str, ...]:
+    """Языки, для которых есть файл текстов"""
+    return tuple(sorted(
+        name[:-5] for name in os.listdir(LOCALES_DIR)
+        if name.endswith(".json") and _LANGUAGE_CODE.match(name[:-5])
+    ))
+
+def loaded_languages() -> Tuple[str, ...]:
+    """Уже загруженные языки"""
+    return tuple(_locales)
+
+def get_locale(lang: Optional[str]) -> Dict[str, Template]:
+    """Шаблоны языка (загружаются при первом обращении)"""
+    templates = _locales.get(lang)
+    if templates is not None:
+        return templates
+    if lang in _unknown or not lang or not _LANGUAGE_CODE.match(lang):
+        return _locales[DEFAULT_LANGUAGE]
+
+    with _lock:
+        if lang not in _locales:
+            if not os.path.exists(os.path.join(LOCALES_DIR, f"{lang}.json")):
+                _unknown.add(lang)
+                return _locales[DEFAULT_LANGUAGE]
+            _locales[lang] = _load(lang, _locales[DEFAULT_LANGUAGE])
+            logger.info(f"🌐 Загружены тексты языка {lang}")
+        return _locales[lang]
+
+def render_text(lang: Optional[str], key: str, **values: Any) -> str:
+    """Текст по языку и ключу с подстановками"""
+    templates = get_locale(lang)
+    template = templates.get(key)
+    if template is None:
+        raise KeyError(f"Нет текста {key!r}")
+    return template.render(values)
+
+def reload_texts() -> Tuple[str, ...]:
+    """
+    Перечитать файлы уже загруженных языков.
+    При ошибке в любом файле остаются прежние тексты (TextsError).
+    """
+    with _lock:
+        default = _load(DEFAULT_LANGUAGE, None)
+        locales = {DEFAULT_LANGUAGE: default}
+        for lang in _locales:
+            if lang != DEFAULT_LANGUAGE:
+                locales[lang] = _load(lang, default)
+
+        _locales.clear()
+        _locales.update(locales)
+        _unknown.clear()
+    return loaded_languages()
+
+_locales[DEFAULT_LANGUAGE] = _load(DEFAULT_LANGUAGE, None)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MERZOGAMES BOT - TIMESTAMPS
+Хранение времени в БД как целых секунд Unix (UTC)
+
+Целые числа сравниваются и индексируются одинаково для всех таблиц,
+поэтому любые фильтры по времени — диапазоны по индексу. Импорт модуля
+регистрирует адаптер sqlite3: datetime в параметрах запроса
+записывается как epoch без ручного преобразования.
+"""
+
+import sqlite3
+from datetime import date, datetime, time, timezone
+from typing import Any, Dict, FrozenSet, Optional
+
+# Колонки со временем по таблицам
+TIMESTAMP_COLUMNS: Dict[str, FrozenSet[str]] = {
+    "users": frozenset({
+        "registration_date", "policy_accepted_date", "terms_accepted_date",
+        "age_confirmed_date", "block_date", "deletion_scheduled",
+        "last_activity", "unreachable_since"
+    }),
+    "logs": frozenset({"timestamp"}),
+    "rate_limits": frozenset({"last_command_time", "flood_blocked_until"}),
+    "badges": frozenset({"earned_date"}),
+    "webapp_stats": frozenset({"opened_date"}),
+    "broadcast_jobs": frozenset({"created_at", "updated_at", "finished_at"}),
+}
+
+def to_epoch(value: datetime) -> int:
+    """datetime → секунды Unix (наивное время считается UTC)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+def from_epoch(value: Optional[int]) -> Optional[datetime]:
+    """Секунды Unix → datetime в UTC"""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(int(value), tz=timezone.utc)
+
+def day_start_epoch(day: date) -> int:
+    """Начало суток (UTC) в секундах Unix"""
+    return to_epoch(datetime.combine(day, time.min, tzinfo=timezone.utc))
+
+def format_epoch(value: Optional[int]) -> str:
+    """Время из БД для вывода человеку"""
+    moment = from_epoch(value)
+    return moment.strftime("%Y-%m-%d %H:%M:%S") if moment else ""
+
+def format_row(table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка таблицы с временем в читаемом виде (для выгрузок и вывода)"""
+    columns = TIMESTAMP_COLUMNS.get(table, frozenset())
+    return {key: format_epoch(value) if key in columns else value for key, value in row.items()}
+
+sqlite3.register_adapter(datetime, to_epoch)
@@ -2,534 +2,645 @@
 
 # -*- coding: utf-8 -*-
 
-“””
+"""
 MERZOGAMES BOT - UTILITIES
 Утилиты для администрирования, бэкапа и обслуживания
 
 Автор: Autonomous AI Developer
 Дата: 2026-02-27
-“””
+"""
 
 import sqlite3
-import json
-import csv
 import os
-import shutil
 import hashlib
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
 import argparse
+import sys
+import tempfile
 
-# ════════════════════════════════════════════════════════════════
+from backups import (
+    BackupError, create_backup, create_incremental_backup, load_manifest,
+    prune_incremental, restore_incremental, restore_snapshot
+)
+from db_pool import close_pool, get_pool
+from exporters import EXPORT_FORMATS, ExportError, export_users
+from migrations import migrate
+from query_audit import audit_queries, collect_queries
+from rollups import rebuild_rollups
+from timestamps import format_epoch, format_row, to_epoch
 
+# ════════════════════════════════════════════════════════════════
 # КОНСТАНТЫ
-
 # ════════════════════════════════════════════════════════════════
 
-DB_PATH = “merzogames.db”
-BACKUP_DIR = “backups”
-EXPORT_DIR = “exports”
+DB_PATH = "merzogames.db"
+BACKUP_DIR = "backups"
+INCREMENTAL_DIR = os.path.join(BACKUP_DIR, "incremental")  # Цепочки снимков с манифестом
+EXPORT_DIR = "exports"
+STATS_WINDOWS = (7, 30, 90)  # Допустимые окна статистики, дней
 
-# ════════════════════════════════════════════════════════════════
+def format_size(size_bytes: float) -> str:
+    """Размер в читаемом виде"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size_bytes < 1024.0:
+            return f"{size_bytes:.2f} {unit}"
+        size_bytes /= 1024.0
 
-# УТИЛИТЫ БАЗЫ ДАННЫХ
+    return f"{size_bytes:.2f} TB"
 
 # ════════════════════════════════════════════════════════════════
+# УТИЛИТЫ БАЗЫ ДАННЫХ
+# ════════════════════════════════════════════════════════════════
 
 class DatabaseUtils:
-“”“Класс утилит для работы с БД”””
+    """Класс утилит для работы с БД"""
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        migrate(self.pool)
+
+    def backup_database(self) -> str:
+        """Создать сжатый бэкап БД (согласованный снимок через backup API)"""
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+    
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_path = os.path.join(BACKUP_DIR, f"merzogames_backup_{timestamp}.db.gz")
+        suffix = 1
+        while os.path.exists(backup_path):
+            # Несколько бэкапов в одну секунду (например, перед восстановлением)
+            backup_path = os.path.join(BACKUP_DIR, f"merzogames_backup_{timestamp}_{suffix}.db.gz")
+            suffix += 1
+    
+        with self.pool.reader() as conn:
+            result = create_backup(conn, backup_path)
+    
+        print(f"✅ Бэкап создан: {backup_path}")
+        print(
+            f"   Страниц: {result.pages}, БД: {format_size(result.db_bytes)}, "
+            f"архив: {format_size(result.archive_bytes)}"
+        )
+        print(f"   SHA-256: {result.sha256}")
+    
+        return backup_path
+
+    def restore_backup(self, backup_path: str):
+        """Восстановить из бэкапа (.db или .db.gz)"""
+        if not os.path.exists(backup_path):
+            print(f"❌ Файл не найден: {backup_path}")
+            return
+    
+        # Создаём бэкап текущей БД перед восстановлением
+        print("📦 Создаём бэкап текущей БД...")
+        self.backup_database()
+    
+        # Восстанавливаем поверх открытой БД через backup API
+        try:
+            with self.pool.writer() as conn:
+                restore_snapshot(backup_path, conn)
+        except BackupError as e:
+            print(f"❌ Бэкап повреждён, БД не изменена: {e}")
+            return
+        migrate(self.pool)
+        print(f"✅ БД восстановлена из: {backup_path}")
+
+    def backup_incremental(self, full: bool = False):
+        """Инкрементальный бэкап: только страницы, изменённые с прошлого снимка"""
+        with self.pool.reader() as conn:
+            snapshot = create_incremental_backup(conn, INCREMENTAL_DIR, full=full)
+    
+        kind = "полный" if snapshot.is_full else f"дельта к #{snapshot.parent}"
+        print(f"✅ Снимок #{snapshot.id} ({kind}): {os.path.join(INCREMENTAL_DIR, snapshot.file)}")
+        print(
+            f"   Страниц записано: {snapshot.pages} из {snapshot.page_count}, "
+            f"архив: {format_size(snapshot.archive_bytes)}"
+        )
+        return snapshot
+
+    def list_snapshots(self):
+        """Показать снимки инкрементальных бэкапов"""
+        snapshots = load_manifest(INCREMENTAL_DIR)
+        print(f"\n💾 Снимков: {len(snapshots)}\n")
+        for snapshot in snapshots:
+            kind = "FULL " if snapshot.is_full else f"Δ#{snapshot.parent:<4}"
+            print(
+                f"#{snapshot.id:<5} {kind} {format_epoch(snapshot.created_at)}  "
+                f"страниц {snapshot.pages}/{snapshot.page_count}  {format_size(snapshot.archive_bytes)}"
+            )
+
+    def restore_from_snapshot(self, snapshot_id: int):
+        """Восстановить БД на момент инкрементального снимка"""
+        print("📦 Создаём бэкап текущей БД...")
+        self.backup_database()
+    
+        try:
+            with self.pool.writer() as conn:
+                restore_incremental(INCREMENTAL_DIR, snapshot_id, conn)
+        except BackupError as e:
+            print(f"❌ Снимок не восстановлен, БД не изменена: {e}")
+            return
+        migrate(self.pool)
+        print(f"✅ БД восстановлена на момент снимка #{snapshot_id}")
+
+    def cleanup_old_backups(self, days: int = 30):
+        """Удалить старые бэкапы"""
+        if not os.path.exists(BACKUP_DIR):
+            return
+    
+        cutoff_date = datetime.now() - timedelta(days=days)
+        deleted_count = 0
+    
+        for filename in os.listdir(BACKUP_DIR):
+            filepath = os.path.join(BACKUP_DIR, filename)
+        
+            if os.path.isfile(filepath):
+                file_time = datetime.fromtimestamp(os.path.getmtime(filepath))
+            
+                if file_time < cutoff_date:
+                    os.remove(filepath)
+                    deleted_count += 1
+                    print(f"🗑 Удалён: {filename}")
+    
+        print(f"✅ Удалено старых бэкапов: {deleted_count}")
+    
+        # Цепочки снимков удаляются только целиком, последняя — никогда
+        if os.path.exists(INCREMENTAL_DIR):
+            pruned = prune_incremental(INCREMENTAL_DIR, int(cutoff_date.timestamp()))
+            print(f"✅ Удалено старых снимков: {pruned}")
+
+    def get_statistics(self, days: int = 7) -> Dict[str, Any]:
+        """
+        Получить детальную статистику.
+        Читает rollup-таблицы (см. rollups.py) вместо исходных данных.
+        """
+        if days not in STATS_WINDOWS:
+            raise ValueError(f"Окно статистики должно быть одним из {STATS_WINDOWS}")
+        
+        today = datetime.now(timezone.utc).date()
+        first_day = today - timedelta(days=days - 1)
+        
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+    
+            # Пользователи по языкам: активные, заблокированные, приглашённые
+            cursor.execute("""
+                SELECT language,
+                       SUM(registered - blocked) AS active,
+                       SUM(blocked) AS blocked,
+                       SUM(referred) AS referred
+                FROM stats_registrations
+                GROUP BY language
+            """)
+            language_rows = cursor.fetchall()
+            languages = {row['language']: row['active'] for row in language_rows if row['active']}
+            total_users = sum(row['active'] for row in language_rows)
+            blocked_users = sum(row['blocked'] for row in language_rows)
+            total_referrals = sum(row['referred'] for row in language_rows)
+    
+            # Регистрации по дням за окно
+            registrations_by_day = {
+                (today - timedelta(days=i)).isoformat(): 0 for i in range(days)
+            }
+            cursor.execute("""
+                SELECT day, SUM(registered) AS count
+                FROM stats_registrations
+                WHERE day >= ?
+                GROUP BY day
+            """, (first_day.isoformat(),))
+            for row in cursor.fetchall():
+                if row['day'] in registrations_by_day:
+                    registrations_by_day[row['day']] = row['count']
+    
+            # Рефералы (по индексу idx_users_referral_count)
+            cursor.execute("SELECT COUNT(*) FROM users WHERE referral_count > 0")
+            referrers_count = cursor.fetchone()[0]
+    
+            # Бейджи
+            cursor.execute("SELECT badge_type, count FROM stats_badges WHERE count > 0")
+            badges = {row['badge_type']: row['count'] for row in cursor.fetchall()}
+    
+            # Активность WebApp
+            cursor.execute("SELECT COALESCE(SUM(opens), 0) FROM stats_webapp_daily")
+            total_webapp_opens = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) FROM stats_webapp_users")
+            unique_webapp_users = cursor.fetchone()[0]
+    
+        return {
+            "total_users": total_users,
+            "blocked_users": blocked_users,
+            "days": days,
+            "registrations_by_day": registrations_by_day,
+            "languages": languages,
+            "referrers_count": referrers_count,
+            "total_referrals": total_referrals,
+            "badges": badges,
+            "total_webapp_opens": total_webapp_opens,
+            "unique_webapp_users": unique_webapp_users
+        }
+
+    def rebuild_statistics(self):
+        """Пересчитать rollup-таблицы статистики из исходных данных"""
+        with self.pool.writer() as conn:
+            rebuild_rollups(conn)
+        print("✅ Статистика пересчитана")
+
+    def export_users(
+        self,
+        export_format: str = "csv",
+        compress: bool = False,
+        columns: Optional[List[str]] = None,
+        since: Optional[int] = None
+    ) -> str:
+        """
+        Потоковый экспорт пользователей (csv / json / ndjson).
+        columns — только эти колонки, since — зарегистрированные не раньше (epoch).
+        """
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+    
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(EXPORT_DIR, f"users_export_{timestamp}.{export_format}")
+        if compress:
+            path += ".gz"
+    
+        with self.pool.reader() as conn:
+            rows = export_users(conn, path, export_format, columns, since)
+    
+        print(f"✅ Экспорт завершён: {path} ({rows} строк)")
+        return path
+
+    def export_users_csv(self, compress: bool = False) -> str:
+        """Экспорт пользователей в CSV"""
+        return self.export_users("csv", compress)
+
+    def export_users_json(self, compress: bool = False) -> str:
+        """Экспорт пользователей в JSON"""
+        return self.export_users("json", compress)
+
+    def get_user_by_id(self, telegram_id: int) -> Optional[Dict]:
+        """Получить пользователя по ID"""
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+    
+            cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+            row = cursor.fetchone()
+    
+        return dict(row) if row else None
+
+    def get_user_by_phone(self, phone: str) -> Optional[Dict]:
+        """Получить пользователя по телефону"""
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+    
+            phone_hash = hashlib.sha256(phone.encode()).hexdigest()
+            cursor.execute("SELECT * FROM users WHERE phone_hash = ?", (phone_hash,))
+            row = cursor.fetchone()
+    
+        return dict(row) if row else None
+
+    def search_users(self, query: str) -> List[Dict]:
+        """Поиск пользователей"""
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+    
+            cursor.execute("""
+                SELECT * FROM users 
+                WHERE username LIKE ? OR CAST(telegram_id AS TEXT) LIKE ?
+            """, (f"%{query}%", f"%{query}%"))
+            rows = cursor.fetchall()
+    
+        return [dict(row) for row in rows]
+
+    def block_user(self, telegram_id: int, reason: str = "admin_block"):
+        """Заблокировать пользователя"""
+        with self.pool.writer() as conn:
+            cursor = conn.cursor()
+    
+            cursor.execute("""
+                UPDATE users 
+                SET is_blocked = 1, block_reason = ?, block_date = ?
+                WHERE telegram_id = ?
+            """, (reason, datetime.now(timezone.utc), telegram_id))
+    
+        print(f"✅ Пользователь {telegram_id} заблокирован")
+
+    def unblock_user(self, telegram_id: int):
+        """Разблокировать пользователя"""
+        with self.pool.writer() as conn:
+            cursor = conn.cursor()
+    
+            cursor.execute("""
+                UPDATE users 
+                SET is_blocked = 0, block_reason = NULL, block_date = NULL
+                WHERE telegram_id = ?
+            """, (telegram_id,))
+    
+        print(f"✅ Пользователь {telegram_id} разблокирован")
+
+    def get_logs(self, user_id: Optional[int] = None, limit: int = 100) -> List[Dict]:
+        """Получить логи"""
+        with self.pool.reader() as conn:
+            cursor = conn.cursor()
+    
+            if user_id:
+                cursor.execute("""
+                    SELECT * FROM logs 
+                    WHERE user_id = ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                """, (user_id, limit))
+            else:
+                cursor.execute("""
+                    SELECT * FROM logs 
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                """, (limit,))
+    
+            rows = cursor.fetchall()
+    
+        return [dict(row) for row in rows]
+
+    def cleanup_deleted_accounts(self):
+        """Очистить аккаунты, помеченные на удаление"""
+        with self.pool.writer() as conn:
+            cursor = conn.cursor()
+    
+            now = datetime.now(timezone.utc)
+    
+            # Находим аккаунты, которые нужно удалить
+            cursor.execute("""
+                SELECT telegram_id FROM users 
+                WHERE deletion_scheduled IS NOT NULL 
+                AND deletion_scheduled <= ?
+            """, (now,))
+    
+            to_delete = [row['telegram_id'] for row in cursor.fetchall()]
+    
+            if not to_delete:
+                print("✅ Нет аккаунтов для удаления")
+                return
+    
+            # Анонимизируем данные
+            for user_id in to_delete:
+                cursor.execute("""
+                    UPDATE users 
+                    SET username = 'DELETED',
+                        phone = 'DELETED',
+                        phone_hash = 'DELETED',
+                        is_blocked = 1,
+                        block_reason = 'account_deleted'
+                    WHERE telegram_id = ?
+                """, (user_id,))
+        
+                print(f"🗑 Удалён аккаунт: {user_id}")
+    
+        print(f"✅ Удалено аккаунтов: {len(to_delete)}")
+
+    def vacuum_database(self):
+        """Оптимизировать БД (VACUUM)"""
+        with self.pool.writer() as conn:
+            cursor = conn.cursor()
+    
+            print("🔧 Оптимизация БД...")
+            cursor.execute("VACUUM")
+    
+        print("✅ БД оптимизирована")
+
+    @staticmethod
+    def audit_queries(verbose: bool = False) -> bool:
+        """
+        Проверить планы запросов бота и утилит (True — без неожиданных SCAN).
+        SQL собирается прогоном методов на временной БД, планы строятся на ней же:
+        рабочая БД и текущий каталог не затрагиваются.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "audit.db")
+            queries, uncovered = collect_queries(path)
+            pool = get_pool(path)
+            try:
+                with pool.reader() as conn:
+                    results = audit_queries(conn, queries)
+            finally:
+                close_pool(path)
+    
+        failed = 0
+        for result in results:
+            if not result.ok:
+                failed += 1
+                print(f"❌ {result.name}")
+            elif result.scans:
+                print(f"⚠️ {result.name} — {'; '.join(result.allowed)}")
+            else:
+                print(f"✅ {result.name}")
+            if verbose or not result.ok:
+                print(f"      {result.query.sql}")
+                for detail in result.plan:
+                    print(f"      {detail}")
+                if result.error:
+                    print(f"      Ошибка: {result.error}")
+        for name in uncovered:
+            print(f"❌ {name} — не вызван сценарием аудита (query_audit._run_workload)")
+    
+        print(f"\n📋 Запросов: {len(results)}, с полным проходом: {failed}, без проверки: {len(uncovered)}")
+        return failed == 0 and not uncovered
+
+    def get_db_size(self) -> str:
+        """Получить размер БД"""
+        return format_size(os.path.getsize(self.db_path))
 
-```
-def __init__(self, db_path: str = DB_PATH):
-    self.db_path = db_path
+# ════════════════════════════════════════════════════════════════
+# CLI ИНТЕРФЕЙС
+# ════════════════════════════════════════════════════════════════
 
-def get_connection(self) -> sqlite3.Connection:
-    """Получить подключение"""
-    conn = sqlite3.connect(self.db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+def main():
+    """Главная функция CLI"""
+    parser = argparse.ArgumentParser(
+        description="MERZOGAMES Bot Utilities - Утилиты администрирования"
+    )
 
-def backup_database(self) -> str:
-    """Создать бэкап БД"""
-    os.makedirs(BACKUP_DIR, exist_ok=True)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_path = os.path.join(BACKUP_DIR, f"merzogames_backup_{timestamp}.db")
-    
-    shutil.copy2(self.db_path, backup_path)
-    
-    # Создаём также сжатый архив
-    import gzip
-    with open(backup_path, 'rb') as f_in:
-        with gzip.open(f"{backup_path}.gz", 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
-    
-    print(f"✅ Бэкап создан: {backup_path}")
-    print(f"✅ Сжатый бэкап: {backup_path}.gz")
-    
-    return backup_path
+    subparsers = parser.add_subparsers(dest='command', help='Команды')
 
-def restore_backup(self, backup_path: str):
-    """Восстановить из бэкапа"""
-    if not os.path.exists(backup_path):
-        print(f"❌ Файл не найден: {backup_path}")
-        return
-    
-    # Создаём бэкап текущей БД перед восстановлением
-    print("📦 Создаём бэкап текущей БД...")
-    self.backup_database()
-    
-    # Восстанавливаем
-    shutil.copy2(backup_path, self.db_path)
-    print(f"✅ БД восстановлена из: {backup_path}")
+    # Бэкап
+    backup_parser = subparsers.add_parser('backup', help='Создать бэкап БД')
+    backup_parser.add_argument('--incremental', action='store_true', help='Только изменённые страницы')
+    backup_parser.add_argument('--full', action='store_true', help='Начать новую цепочку снимков')
 
-def cleanup_old_backups(self, days: int = 30):
-    """Удалить старые бэкапы"""
-    if not os.path.exists(BACKUP_DIR):
-        return
-    
-    cutoff_date = datetime.now() - timedelta(days=days)
-    deleted_count = 0
-    
-    for filename in os.listdir(BACKUP_DIR):
-        filepath = os.path.join(BACKUP_DIR, filename)
-        
-        if os.path.isfile(filepath):
-            file_time = datetime.fromtimestamp(os.path.getmtime(filepath))
-            
-            if file_time < cutoff_date:
-                os.remove(filepath)
-                deleted_count += 1
-                print(f"🗑 Удалён: {filename}")
-    
-    print(f"✅ Удалено старых бэкапов: {deleted_count}")
-
-def get_statistics(self) -> Dict[str, Any]:
-    """Получить детальную статистику"""
-    conn = self.get_connection()
-    cursor = conn.cursor()
-    
-    # Всего пользователей
-    cursor.execute("SELECT COUNT(*) FROM users WHERE is_blocked = 0")
-    total_users = cursor.fetchone()[0]
-    
-    # Заблокированных
-    cursor.execute("SELECT COUNT(*) FROM users WHERE is_blocked = 1")
-    blocked_users = cursor.fetchone()[0]
-    
-    # Регистрации по дням (последние 7 дней)
-    registrations_by_day = {}
-    for i in range(7):
-        date = (datetime.now() - timedelta(days=i)).date()
-        cursor.execute("""
-            SELECT COUNT(*) FROM users 
-            WHERE DATE(registration_date) = ?
-        """, (date.isoformat(),))
-        registrations_by_day[date.isoformat()] = cursor.fetchone()[0]
-    
-    # Языки
-    cursor.execute("""
-        SELECT language, COUNT(*) as count 
-        FROM users 
-        WHERE is_blocked = 0
-        GROUP BY language
-    """)
-    languages = {row['language']: row['count'] for row in cursor.fetchall()}
-    
-    # Рефералы
-    cursor.execute("""
-        SELECT COUNT(DISTINCT referred_by) as referrers,
-               COUNT(*) as total_referrals
-        FROM users 
-        WHERE referred_by IS NOT NULL
-    """)
-    referral_row = cursor.fetchone()
-    
-    # Бейджи
-    cursor.execute("""
-        SELECT badge_type, COUNT(*) as count 
-        FROM badges 
-        GROUP BY badge_type
-    """)
-    badges = {row['badge_type']: row['count'] for row in cursor.fetchall()}
-    
-    # Активность WebApp
-    cursor.execute("SELECT COUNT(*) FROM webapp_stats")
-    total_webapp_opens = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(DISTINCT user_id) FROM webapp_stats")
-    unique_webapp_users = cursor.fetchone()[0]
-    
-    conn.close()
-    
-    return {
-        "total_users": total_users,
-        "blocked_users": blocked_users,
-        "registrations_by_day": registrations_by_day,
-        "languages": languages,
-        "referrers_count": referral_row['referrers'] if referral_row else 0,
-        "total_referrals": referral_row['total_referrals'] if referral_row else 0,
-        "badges": badges,
-        "total_webapp_opens": total_webapp_opens,
-        "unique_webapp_users": unique_webapp_users
-    }
-
-def export_users_csv(self) -> str:
-    """Экспорт пользователей в CSV"""
-    os.makedirs(EXPORT_DIR, exist_ok=True)
-    
-    conn = self.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM users")
-    rows = cursor.fetchall()
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_path = os.path.join(EXPORT_DIR, f"users_export_{timestamp}.csv")
-    
-    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-        if rows:
-            writer = csv.DictWriter(f, fieldnames=rows[0].keys())
-            writer.writeheader()
-            writer.writerows([dict(row) for row in rows])
-    
-    conn.close()
-    
-    print(f"✅ Экспорт завершён: {csv_path}")
-    return csv_path
-
-def export_users_json(self) -> str:
-    """Экспорт пользователей в JSON"""
-    os.makedirs(EXPORT_DIR, exist_ok=True)
-    
-    conn = self.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM users")
-    rows = cursor.fetchall()
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    json_path = os.path.join(EXPORT_DIR, f"users_export_{timestamp}.json")
-    
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump([dict(row) for row in rows], f, ensure_ascii=False, indent=2)
-    
-    conn.close()
-    
-    print(f"✅ Экспорт завершён: {json_path}")
-    return json_path
-
-def get_user_by_id(self, telegram_id: int) -> Optional[Dict]:
-    """Получить пользователя по ID"""
-    conn = self.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    return dict(row) if row else None
-
-def get_user_by_phone(self, phone: str) -> Optional[Dict]:
-    """Получить пользователя по телефону"""
-    conn = self.get_connection()
-    cursor = conn.cursor()
-    
-    phone_hash = hashlib.sha256(phone.encode()).hexdigest()
-    cursor.execute("SELECT * FROM users WHERE phone_hash = ?", (phone_hash,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    return dict(row) if row else None
-
-def search_users(self, query: str) -> List[Dict]:
-    """Поиск пользователей"""
-    conn = self.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT * FROM users 
-        WHERE username LIKE ? OR CAST(telegram_id AS TEXT) LIKE ?
-    """, (f"%{query}%", f"%{query}%"))
-    rows = cursor.fetchall()
-    conn.close()
-    
-    return [dict(row) for row in rows]
+    # Восстановление
+    restore_parser = subparsers.add_parser('restore', help='Восстановить из бэкапа')
+    restore_parser.add_argument('file', nargs='?', help='Путь к файлу бэкапа')
+    restore_parser.add_argument('--snapshot', type=int, help='ID инкрементального снимка')
 
-def block_user(self, telegram_id: int, reason: str = "admin_block"):
-    """Заблокировать пользователя"""
-    conn = self.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        UPDATE users 
-        SET is_blocked = 1, block_reason = ?, block_date = ?
-        WHERE telegram_id = ?
-    """, (reason, datetime.now(timezone.utc).isoformat(), telegram_id))
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"✅ Пользователь {telegram_id} заблокирован")
+    # Снимки
+    snapshots_parser = subparsers.add_parser('snapshots', help='Список инкрементальных снимков')
 
-def unblock_user(self, telegram_id: int):
-    """Разблокировать пользователя"""
-    conn = self.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        UPDATE users 
-        SET is_blocked = 0, block_reason = NULL, block_date = NULL
-        WHERE telegram_id = ?
-    """, (telegram_id,))
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"✅ Пользователь {telegram_id} разблокирован")
+    # Очистка бэкапов
+    cleanup_parser = subparsers.add_parser('cleanup-backups', help='Удалить старые бэкапы')
+    cleanup_parser.add_argument('--days', type=int, default=30, help='Старше N дней')
 
-def get_logs(self, user_id: Optional[int] = None, limit: int = 100) -> List[Dict]:
-    """Получить логи"""
-    conn = self.get_connection()
-    cursor = conn.cursor()
-    
-    if user_id:
-        cursor.execute("""
-            SELECT * FROM logs 
-            WHERE user_id = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """, (user_id, limit))
-    else:
-        cursor.execute("""
-            SELECT * FROM logs 
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """, (limit,))
-    
-    rows = cursor.fetchall()
-    conn.close()
-    
-    return [dict(row) for row in rows]
-
-def cleanup_deleted_accounts(self):
-    """Очистить аккаунты, помеченные на удаление"""
-    conn = self.get_connection()
-    cursor = conn.cursor()
-    
-    now = datetime.now(timezone.utc)
-    
-    # Находим аккаунты, которые нужно удалить
-    cursor.execute("""
-        SELECT telegram_id FROM users 
-        WHERE deletion_scheduled IS NOT NULL 
-        AND deletion_scheduled <= ?
-    """, (now.isoformat(),))
-    
-    to_delete = [row['telegram_id'] for row in cursor.fetchall()]
-    
-    if not to_delete:
-        print("✅ Нет аккаунтов для удаления")
-        return
-    
-    # Анонимизируем данные
-    for user_id in to_delete:
-        cursor.execute("""
-            UPDATE users 
-            SET username = 'DELETED',
-                phone = 'DELETED',
-                phone_hash = 'DELETED',
-                is_blocked = 1,
-                block_reason = 'account_deleted'
-            WHERE telegram_id = ?
-        """, (user_id,))
-        
-        print(f"🗑 Удалён аккаунт: {user_id}")
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"✅ Удалено аккаунтов: {len(to_delete)}")
+    # Статистика
+    stats_parser = subparsers.add_parser('stats', help='Показать статистику')
+    stats_parser.add_argument('--days', type=int, choices=STATS_WINDOWS, default=7, help='Окно регистраций, дней')
 
-def vacuum_database(self):
-    """Оптимизировать БД (VACUUM)"""
-    conn = self.get_connection()
-    cursor = conn.cursor()
-    
-    print("🔧 Оптимизация БД...")
-    cursor.execute("VACUUM")
-    
-    conn.commit()
-    conn.close()
-    
-    print("✅ БД оптимизирована")
+    # Пересчёт статистики
+    rebuild_stats_parser = subparsers.add_parser('rebuild-stats', help='Пересчитать таблицы статистики')
 
-def get_db_size(self) -> str:
-    """Получить размер БД"""
-    size_bytes = os.path.getsize(self.db_path)
-    
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size_bytes < 1024.0:
-            return f"{size_bytes:.2f} {unit}"
-        size_bytes /= 1024.0
-    
-    return f"{size_bytes:.2f} TB"
-```
+    # Экспорт
+    export_parser = subparsers.add_parser('export', help='Экспорт данных')
+    export_parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    export_parser.add_argument('--compress', action='store_true', help='Сжать в .gz')
+    export_parser.add_argument('--columns', help='Колонки через запятую (по умолчанию все)')
+    export_parser.add_argument('--since', help='Зарегистрированные не раньше (YYYY-MM-DD[ HH:MM:SS], UTC)')
 
-# ════════════════════════════════════════════════════════════════
+    # Поиск пользователя
+    search_parser = subparsers.add_parser('search', help='Поиск пользователя')
+    search_parser.add_argument('query', help='Username или ID')
 
-# CLI ИНТЕРФЕЙС
+    # Информация о пользователе
+    user_info_parser = subparsers.add_parser('user-info', help='Информация о пользователе')
+    user_info_parser.add_argument('telegram_id', type=int, help='Telegram ID')
 
-# ════════════════════════════════════════════════════════════════
+    # Блокировка
+    block_parser = subparsers.add_parser('block', help='Заблокировать пользователя')
+    block_parser.add_argument('telegram_id', type=int, help='Telegram ID')
+    block_parser.add_argument('--reason', default='admin_block', help='Причина')
 
-def main():
-“”“Главная функция CLI”””
-parser = argparse.ArgumentParser(
-description=“MERZOGAMES Bot Utilities - Утилиты администрирования”
-)
+    # Разблокировка
+    unblock_parser = subparsers.add_parser('unblock', help='Разблокировать пользователя')
+    unblock_parser.add_argument('telegram_id', type=int, help='Telegram ID')
+
+    # Логи
+    logs_parser = subparsers.add_parser('logs', help='Показать логи')
+    logs_parser.add_argument('--user-id', type=int, help='ID пользователя')
+    logs_parser.add_argument('--limit', type=int, default=20, help='Количество записей')
+
+    # Очистка удалённых аккаунтов
+    cleanup_deleted_parser = subparsers.add_parser('cleanup-deleted', help='Очистить удалённые аккаунты')
+
+    # Оптимизация БД
+    vacuum_parser = subparsers.add_parser('vacuum', help='Оптимизировать БД')
+
+    # Аудит планов запросов
+    audit_parser = subparsers.add_parser('audit-queries', help='Проверить запросы на полные проходы таблиц')
+    audit_parser.add_argument('--verbose', action='store_true', help='Показать планы всех запросов')
+
+    # Размер БД
+    size_parser = subparsers.add_parser('size', help='Размер БД')
+
+    args = parser.parse_args()
+
+    if not args.command:
+        parser.print_help()
+        return
+
+    if args.command == 'audit-queries':
+        # Работает на временной БД — рабочую не открываем
+        if not DatabaseUtils.audit_queries(args.verbose):
+            sys.exit(1)
+        return
 
-```
-subparsers = parser.add_subparsers(dest='command', help='Команды')
-
-# Бэкап
-backup_parser = subparsers.add_parser('backup', help='Создать бэкап БД')
-
-# Восстановление
-restore_parser = subparsers.add_parser('restore', help='Восстановить из бэкапа')
-restore_parser.add_argument('file', help='Путь к файлу бэкапа')
-
-# Очистка бэкапов
-cleanup_parser = subparsers.add_parser('cleanup-backups', help='Удалить старые бэкапы')
-cleanup_parser.add_argument('--days', type=int, default=30, help='Старше N дней')
-
-# Статистика
-stats_parser = subparsers.add_parser('stats', help='Показать статистику')
-
-# Экспорт
-export_parser = subparsers.add_parser('export', help='Экспорт данных')
-export_parser.add_argument('--format', choices=['csv', 'json'], default='csv')
-
-# Поиск пользователя
-search_parser = subparsers.add_parser('search', help='Поиск пользователя')
-search_parser.add_argument('query', help='Username или ID')
-
-# Информация о пользователе
-user_info_parser = subparsers.add_parser('user-info', help='Информация о пользователе')
-user_info_parser.add_argument('telegram_id', type=int, help='Telegram ID')
-
-# Блокировка
-block_parser = subparsers.add_parser('block', help='Заблокировать пользователя')
-block_parser.add_argument('telegram_id', type=int, help='Telegram ID')
-block_parser.add_argument('--reason', default='admin_block', help='Причина')
-
-# Разблокировка
-unblock_parser = subparsers.add_parser('unblock', help='Разблокировать пользователя')
-unblock_parser.add_argument('telegram_id', type=int, help='Telegram ID')
-
-# Логи
-logs_parser = subparsers.add_parser('logs', help='Показать логи')
-logs_parser.add_argument('--user-id', type=int, help='ID пользователя')
-logs_parser.add_argument('--limit', type=int, default=20, help='Количество записей')
-
-# Очистка удалённых аккаунтов
-cleanup_deleted_parser = subparsers.add_parser('cleanup-deleted', help='Очистить удалённые аккаунты')
-
-# Оптимизация БД
-vacuum_parser = subparsers.add_parser('vacuum', help='Оптимизировать БД')
-
-# Размер БД
-size_parser = subparsers.add_parser('size', help='Размер БД')
-
-args = parser.parse_args()
-
-if not args.command:
-    parser.print_help()
-    return
-
-db = DatabaseUtils()
-
-# Обработка команд
-if args.command == 'backup':
-    db.backup_database()
-
-elif args.command == 'restore':
-    db.restore_backup(args.file)
-
-elif args.command == 'cleanup-backups':
-    db.cleanup_old_backups(args.days)
-
-elif args.command == 'stats':
-    stats = db.get_statistics()
-    print("\n📊 СТАТИСТИКА MERZOGAMES BOT\n")
-    print(f"👥 Всего пользователей: {stats['total_users']}")
-    print(f"🚫 Заблокировано: {stats['blocked_users']}")
-    print(f"\n📅 Регистрации по дням:")
-    for date, count in stats['registrations_by_day'].items():
-        print(f"   {date}: {count}")
-    print(f"\n🌍 Языки:")
-    for lang, count in stats['languages'].items():
-        print(f"   {lang}: {count}")
-    print(f"\n🔗 Рефералы:")
-    print(f"   Приглашающих: {stats['referrers_count']}")
-    print(f"   Всего приглашено: {stats['total_referrals']}")
-    print(f"\n🎖 Бейджи:")
-    for badge, count in stats['badges'].items():
-        print(f"   {badge}: {count}")
-    print(f"\n🌐 WebApp:")
-    print(f"   Всего открытий: {stats['total_webapp_opens']}")
-    print(f"   Уникальных пользователей: {stats['unique_webapp_users']}")
-
-elif args.command == 'export':
-    if args.format == 'csv':
-        db.export_users_csv()
-    else:
-        db.export_users_json()
-
-elif args.command == 'search':
-    results = db.search_users(args.query)
-    print(f"\n🔍 Найдено: {len(results)}\n")
-    for user in results:
-        print(f"🆔 ID: {user['telegram_id']}")
-        print(f"👤 Username: @{user['username']}")
-        print(f"📱 Телефон: {user['phone']}")
-        print(f"📅 Регистрация: {user['registration_date']}")
-        print(f"🚫 Заблокирован: {'Да' if user['is_blocked'] else 'Нет'}")
-        print("-" * 50)
-
-elif args.command == 'user-info':
-    user = db.get_user_by_id(args.telegram_id)
-    if user:
-        print("\n👤 ИНФОРМАЦИЯ О ПОЛЬЗОВАТЕЛЕ\n")
-        for key, value in user.items():
-            print(f"{key}: {value}")
-    else:
-        print("❌ Пользователь не найден")
-
-elif args.command == 'block':
-    db.block_user(args.telegram_id, args.reason)
-
-elif args.command == 'unblock':
-    db.unblock_user(args.telegram_id)
-
-elif args.command == 'logs':
-    logs = db.get_logs(args.user_id, args.limit)
-    print(f"\n📋 ЛОГИ (последние {len(logs)})\n")
-    for log in logs:
-        print(f"[{log['timestamp']}] User {log['user_id']}: {log['action']}")
-        if log['details']:
-            print(f"   Детали: {log['details']}")
-        print("-" * 50)
-
-elif args.command == 'cleanup-deleted':
-    db.cleanup_deleted_accounts()
-
-elif args.command == 'vacuum':
-    db.vacuum_database()
-
-elif args.command == 'size':
-    size = db.get_db_size()
-    print(f"\n💾 Размер БД: {size}\n")
-```
-
-if **name** == “**main**”:
-main()
\ No newline at end of file
+    db = DatabaseUtils()
+
+    # Обработка команд
+    if args.command == 'backup':
+        if args.incremental or args.full:
+            db.backup_incremental(args.full)
+        else:
+            db.backup_database()
+
+    elif args.command == 'restore':
+        if args.snapshot is not None:
+            db.restore_from_snapshot(args.snapshot)
+        elif args.file:
+            db.restore_backup(args.file)
+        else:
+            restore_parser.error('укажите файл бэкапа или --snapshot')
+
+    elif args.command == 'snapshots':
+        db.list_snapshots()
+
+    elif args.command == 'cleanup-backups':
+        db.cleanup_old_backups(args.days)
+
+    elif args.command == 'stats':
+        stats = db.get_statistics(args.days)
+        print("\n📊 СТАТИСТИКА MERZOGAMES BOT\n")
+        print(f"👥 Всего пользователей: {stats['total_users']}")
+        print(f"🚫 Заблокировано: {stats['blocked_users']}")
+        print(f"\n📅 Регистрации по дням (за {stats['days']} дн.):")
+        for date, count in stats['registrations_by_day'].items():
+            print(f"   {date}: {count}")
+        print(f"\n🌍 Языки:")
+        for lang, count in stats['languages'].items():
+            print(f"   {lang}: {count}")
+        print(f"\n🔗 Рефералы:")
+        print(f"   Приглашающих: {stats['referrers_count']}")
+        print(f"   Всего приглашено: {stats['total_referrals']}")
+        print(f"\n🎖 Бейджи:")
+        for badge, count in stats['badges'].items():
+            print(f"   {badge}: {count}")
+        print(f"\n🌐 WebApp:")
+        print(f"   Всего открытий: {stats['total_webapp_opens']}")
+        print(f"   Уникальных пользователей: {stats['unique_webapp_users']}")
+
+    elif args.command == 'rebuild-stats':
+        db.rebuild_statistics()
+
+    elif args.command == 'export':
+        columns = [column.strip() for column in args.columns.split(',')] if args.columns else None
+        try:
+            since = to_epoch(datetime.fromisoformat(args.since)) if args.since else None
+        except ValueError:
+            export_parser.error(f'неверная дата --since: {args.since}')
+        try:
+            db.export_users(args.format, args.compress, columns, since)
+        except ExportError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+    elif args.command == 'search':
+        results = db.search_users(args.query)
+        print(f"\n🔍 Найдено: {len(results)}\n")
+        for user in results:
+            print(f"🆔 ID: {user['telegram_id']}")
+            print(f"👤 Username: @{user['username']}")
+            print(f"📱 Телефон: {user['phone']}")
+            print(f"📅 Регистрация: {format_epoch(user['registration_date'])}")
+            print(f"🚫 Заблокирован: {'Да' if user['is_blocked'] else 'Нет'}")
+            print("-" * 50)
+
+    elif args.command == 'user-info':
+        user = db.get_user_by_id(args.telegram_id)
+        if user:
+            print("\n👤 ИНФОРМАЦИЯ О ПОЛЬЗОВАТЕЛЕ\n")
+            for key, value in format_row("users", user).items():
+                print(f"{key}: {value}")
+        else:
+            print("❌ Пользователь не найден")
+
+    elif args.command == 'block':
+        db.block_user(args.telegram_id, args.reason)
+
+    elif args.command == 'unblock':
+        db.unblock_user(args.telegram_id)
+
+    elif args.command == 'logs':
+        logs = db.get_logs(args.user_id, args.limit)
+        print(f"\n📋 ЛОГИ (последние {len(logs)})\n")
+        for log in logs:
+            print(f"[{format_epoch(log['timestamp'])}] User {log['user_id']}: {log['action']}")
+            if log['details']:
+                print(f"   Детали: {log['details']}")
+            print("-" * 50)
+
+    elif args.command == 'cleanup-deleted':
+        db.cleanup_deleted_accounts()
+
+    elif args.command == 'vacuum':
+        db.vacuum_database()
+
+    elif args.command == 'size':
+        size = db.get_db_size()
+        print(f"\n💾 Размер БД: {size}\n")
+
+if __name__ == "__main__":
+    main()